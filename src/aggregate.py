@@ -1,4 +1,5 @@
 import math
+from concurrent.futures import ThreadPoolExecutor
 
 import duckdb
 from rich.align import Align
@@ -12,9 +13,14 @@ from rich.progress import (
 )
 from rich.table import Table
 
+from sketches import (
+    sketch_estimates_sql,
+    sketch_registers_sql,
+    sketch_table_name,
+    standard_error,
+)
 from utilities import (
     MonthlyTweetData,
-    build_aggregate_command_for_month_columns,
     create_month_column_names,
     extract_month,
     list_tables,
@@ -23,6 +29,11 @@ from utilities import (
 )
 
 
+# Ways of combining the monthly aggregate tables into one: recursively, one pair of tables at a
+# time, or with a single GROUP BY over all the tables
+COMBINE_ENGINES = ["pairwise", "single-pass"]
+
+
 class AggregateSQL:
     def __init__(
         self,
@@ -30,6 +41,7 @@ class AggregateSQL:
         select: str,
         where: str,
         group_by: str,
+        sketches: dict[str, str] | None = None,
     ) -> None:
         self.columns = ", ".join(new_table_constant_columns)
         if select.rstrip()[-1] != ",":
@@ -38,6 +50,17 @@ class AggregateSQL:
             self.select = select
         self.where = where
         self.group_by = group_by
+        # Columns whose distinct counts are estimated from HyperLogLog sketches of the given values
+        self.sketches = sketches or {}
+
+
+def count_distinct_sql(metrics: dict[str, str], approximate: list[str]) -> str:
+    """Function to build the SQL selection that counts each metric's distinct values, with a placeholder 0 for the metrics that are estimated from sketches instead."""
+    selection = [
+        "0" if column in approximate else f"COUNT(DISTINCT {value})"
+        for column, value in metrics.items()
+    ]
+    return "".join(f"\n            {count}," for count in selection)
 
 
 def aggregate_tables(
@@ -45,6 +68,8 @@ def aggregate_tables(
     color: str,
     target_table_prefix: str,
     sql: AggregateSQL,
+    concurrent_months: int = 1,
+    months: list[str] | None = None,
 ):
     """Function to aggregate every target table's tweets according to the "group_by" column given in the sql parameter.
 
@@ -53,16 +78,21 @@ def aggregate_tables(
         color (str): color name for rich progress bar
         target_table_prefix (str): prefix to captures tables to aggregate
         sql (AggregateSQL): information to give to SQL commands
+        concurrent_months (int): number of months to aggregate at the same time, each on its own cursor
+        months (list[str] | None): if given, the only months to aggregate, whose rows of the time series are replaced
     """
     msg = f"""
 Group all tables of monthly tweet data on their column "{sql.group_by}" and aggregate the columns according to the following SQL:
 {sql.select}"""
     style_panel(msg=msg, color=color, title="Aggregate tables")
 
-    # Before continuing with this process, remove any existing monthly aggregate tables with the target prefix
+    # Before continuing with this process, remove any existing monthly aggregate tables and their sketches with the target prefix
     all_tables = connection.execute("SHOW TABLES;").fetchall()
     aggregate_tables = sorted(
         list_tables(all_tables=all_tables, prefix=target_table_prefix)
+        + list_tables(
+            all_tables=all_tables, prefix=sketch_table_name(target_table_prefix)
+        )
     )
     if len(aggregate_tables) > 0:
         for table in aggregate_tables:
@@ -78,14 +108,36 @@ Group all tables of monthly tweet data on their column "{sql.group_by}" and aggr
         for table in all_tables
         if table[0].startswith("tweets_from")
     ]
-
-    # So that each monthly aggregate table has a column for every month present in the dataset,
-    # get all the monthly tweet links tables' names and extract the month part
-    months_in_all_tweet_data = [m.month_name for m in monthly_tweet_data]
-    month_column_names = create_month_column_names(months_in_all_tweet_data)
-    month_column_names_and_data_types = ", ".join(
-        [f"{column_name} UBIGINT" for column_name in month_column_names]
-    )
+    if months is not None:
+        monthly_tweet_data = [m for m in monthly_tweet_data if m.month_name in months]
+
+    # Rather than giving every monthly aggregate table a column for every month in the dataset, keep
+    # each group's number of tweets in each month in a long-format time series, which is pivoted at export
+    timeseries_table = timeseries_table_name(target_table_prefix)
+    if months is None:
+        query = f"""
+        DROP TABLE IF EXISTS {timeseries_table};
+        """
+        connection.execute(query)
+    if monthly_tweet_data:
+        # The monthly tweet data are tables or, in the query-in-place mode, views, which both can be described
+        query = f"""
+        DESCRIBE {monthly_tweet_data[0].tweet_links_table_name};
+        """
+        column_types = {
+            column[0]: column[1] for column in connection.execute(query).fetchall()
+        }
+        group_by_type = column_types[sql.group_by]
+        month_names = ", ".join(f"'{m.month_name}'" for m in monthly_tweet_data)
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {timeseries_table}(
+            {sql.group_by} {group_by_type},
+            month VARCHAR,
+            nb_tweets UBIGINT
+            );
+        DELETE FROM {timeseries_table} WHERE month IN ({month_names});
+        """
+        connection.execute(query)
 
     # ----------------------------------------------------------------------- #
     # Set up the progress bar
@@ -98,51 +150,127 @@ Group all tables of monthly tweet data on their column "{sql.group_by}" and aggr
     )
     with ProgressCompleteColumn as progress:
         task1 = progress.add_task(
-            description=f"{color}Creating monthly aggregate tables...", start=False
+            description=f"{color}Creating monthly aggregate tables...",
+            total=len(monthly_tweet_data),
         )
         task2 = progress.add_task(
-            description=f"{color}Aggregating data in each table...", start=False
+            description=f"{color}Aggregating data in each table...",
+            total=len(monthly_tweet_data),
         )
-        total = len(monthly_tweet_data)
         # ------------------------------------------------------------------ #
 
-        # For every table of monthly twitter link data: (1) create a table for domain aggregates
-        # and (2) insert the month's tweet data into that table while grouping by the domain
-        for m in monthly_tweet_data:
-            # Prepare the progress bar for task 1: Creating the table of domain aggregates
-            progress.update(task_id=task1, total=total)
-            progress.start_task(task_id=task1)
+        def aggregate(m: MonthlyTweetData):
+            # Every month is aggregated on its own cursor. The cursors share the database's pool of
+            # threads, so that the months running at the same time split the "threads" setting
+            cursor = connection.cursor()
+            try:
+                aggregate_month(
+                    connection=cursor,
+                    m=m,
+                    sql=sql,
+                    timeseries_table=timeseries_table,
+                    progress=progress,
+                    tasks=(task1, task2),
+                )
+            finally:
+                cursor.close()
+
+        if concurrent_months > 1:
+            with ThreadPoolExecutor(max_workers=concurrent_months) as executor:
+                list(executor.map(aggregate, monthly_tweet_data))
+        else:
+            for m in monthly_tweet_data:
+                aggregate(m)
 
-            # While adding however many month columns are necessary for the dataset, create the table
-            query = f"""
-            DROP TABLE IF EXISTS {m.aggregated_table_name};
-            CREATE TABLE {m.aggregated_table_name}(
-                {sql.columns},
-                {month_column_names_and_data_types}
-                );
-            """
-            connection.execute(query)
-            progress.update(task_id=task1, advance=1)
 
-            # Prepare the progress bar for task 2: Inserting data into the domain aggregates table
-            progress.update(task_id=task2, total=total)
-            progress.start_task(task_id=task2)
+def aggregate_month(
+    connection: duckdb.DuckDBPyConnection,
+    m: MonthlyTweetData,
+    sql: AggregateSQL,
+    timeseries_table: str,
+    progress: Progress,
+    tasks: tuple,
+):
+    """Function to (1) create a month's aggregate table and (2) insert the month's tweet data into that table while grouping by the "group_by" column given in the sql parameter."""
+    create_task, aggregate_task = tasks
+
+    # Create the table with a temporary column for the month's number of tweets
+    query = f"""
+    DROP TABLE IF EXISTS {m.aggregated_table_name};
+    CREATE TABLE {m.aggregated_table_name}(
+        {sql.columns},
+        nb_tweets_in_month UBIGINT
+        );
+    """
+    connection.execute(query)
+    progress.update(task_id=create_task, advance=1)
+
+    query = f"""
+    INSERT INTO {m.aggregated_table_name}
+    SELECT  {sql.select}
+            COUNT(DISTINCT tweet_id)
+    FROM {m.tweet_links_table_name}
+    WHERE {sql.where}
+    GROUP BY {sql.group_by};
+    """
+    connection.execute(query)
+
+    # Move the month's number of tweets to the time series
+    query = f"""
+    INSERT INTO {timeseries_table}
+    SELECT  {sql.group_by},
+            '{m.month_name}',
+            nb_tweets_in_month
+    FROM {m.aggregated_table_name};
+    ALTER TABLE {m.aggregated_table_name} DROP COLUMN nb_tweets_in_month;
+    """
+    connection.execute(query)
+
+    # Store the sketches of the distinct values that are counted approximately, so that
+    # they can be merged with those of other months rather than summed
+    if sql.sketches:
+        registers = sketch_registers_sql(
+            source=m.tweet_links_table_name,
+            group_by=sql.group_by,
+            metrics=sql.sketches,
+            where=sql.where,
+        )
+        query = f"""
+        CREATE TABLE {sketch_table_name(m.aggregated_table_name)} AS
+        {registers};
+        """
+        connection.execute(query)
+    progress.update(task_id=aggregate_task, advance=1)
+
+
+def timeseries_table_name(aggregate_table_prefix: str) -> str:
+    return f"timeseries_{aggregate_table_prefix}"
+
+
+def pivot_timeseries_sql(
+    connection: duckdb.DuckDBPyConnection, aggregate_table_prefix: str, group_by: str
+) -> tuple[list[str], str]:
+    """Function to build the SQL query that pivots the long-format time series of the aggregate tables with the given prefix into one column per month of the dataset. It returns the month columns' names and the query."""
+    timeseries_table = timeseries_table_name(aggregate_table_prefix)
+    query = f"""
+    SELECT DISTINCT month
+    FROM {timeseries_table};
+    """
+    months = sorted(row[0] for row in connection.execute(query).fetchall())
+    month_column_names = create_month_column_names(months)
 
-            # While minding the order of the table's month columns, define the SQL command that
-            # will sum this month's data into the relevant month column
-            month_column_aggregate_string = build_aggregate_command_for_month_columns(
-                month_column_names, m.month_name
-            )
-            query = f"""
-            INSERT INTO {m.aggregated_table_name}
-            SELECT  {sql.select}
-                    {month_column_aggregate_string}
-            FROM {m.tweet_links_table_name}
-            WHERE {sql.where}
-            GROUP BY {sql.group_by};
-            """
-            connection.execute(query)
-            progress.update(task_id=task2, advance=1)
+    # A group that had no tweet in a month has no row for that month in the time series
+    month_counts = [
+        f"COALESCE(SUM(nb_tweets) FILTER (WHERE month = '{month}'), 0) AS {column}"
+        for month, column in zip(months, month_column_names)
+    ]
+    query = f"""
+    SELECT  {group_by},
+            {', '.join(month_counts)}
+    FROM {timeseries_table}
+    GROUP BY {group_by}
+    """
+    return month_column_names, query
 
 
 def recursively_aggregate_tables(
@@ -151,6 +279,7 @@ def recursively_aggregate_tables(
     group_by: list,
     any_value: list,
     color: str,
+    merge: str = "SUM",
 ):
     """Function to recursively concatenate pairs of tables and re-aggregate their contents until no more pairs can be made and all the targeted tables have been combined into one.
 
@@ -160,6 +289,7 @@ def recursively_aggregate_tables(
         group_by (list): column names for SQL group by
         any_value (list): column names not to be summed, but rather to have any value taken
         color (str): color name for rich progress bar
+        merge (str): SQL aggregate function with which the remaining columns are combined
     """
 
     # Based on a consistent prefix, list the tables to recurisvely aggregate
@@ -219,8 +349,8 @@ Recursively concatenate pairs of tables and re-group by {group_by} until no more
                     connection.execute(query)
 
                     # From one of the tables, extract the column names and their data types
-                    columns = duckdb.table(left_table, connection).columns
-                    data_types = duckdb.table(left_table, connection).dtypes
+                    columns = connection.table(left_table).columns
+                    data_types = connection.table(left_table).dtypes
                     columns_and_data_types = [
                         f"{i[0]} {i[1]}" for i in list(zip(columns, data_types))
                     ]
@@ -245,7 +375,7 @@ Recursively concatenate pairs of tables and re-group by {group_by} until no more
                             columns.remove(col)
                             any_value_syntax.append(f"ANY_VALUE({col})")
                     aggregation = group_by + any_value_syntax
-                    summed_columns = [f"SUM({col})" for col in columns]
+                    summed_columns = [f"{merge}({col})" for col in columns]
 
                     # On the concatenated data, group by the target column and insert into the combined table
                     query = f"""
@@ -271,6 +401,194 @@ Recursively concatenate pairs of tables and re-group by {group_by} until no more
             )
 
 
+def combine_tables(
+    connection: duckdb.DuckDBPyConnection,
+    targeted_table_prefix: str,
+    group_by: list,
+    any_value: list,
+    color: str,
+    merge: str = "SUM",
+    engine: str = "pairwise",
+):
+    """Function to combine all the targeted tables into one with the given engine, one of COMBINE_ENGINES."""
+    if engine == "single-pass":
+        combine_tables_in_one_pass(
+            connection=connection,
+            targeted_table_prefix=targeted_table_prefix,
+            group_by=group_by,
+            any_value=any_value,
+            color=color,
+            merge=merge,
+        )
+    else:
+        recursively_aggregate_tables(
+            connection=connection,
+            targeted_table_prefix=targeted_table_prefix,
+            group_by=group_by,
+            any_value=any_value,
+            color=color,
+            merge=merge,
+        )
+
+
+def combine_tables_in_one_pass(
+    connection: duckdb.DuckDBPyConnection,
+    targeted_table_prefix: str,
+    group_by: list,
+    any_value: list,
+    color: str,
+    merge: str = "SUM",
+):
+    """Function to combine all the targeted tables into one with a single aggregation over a view that concatenates them.
+
+    Unlike the recursive pairing of tables, no row is copied before it is aggregated, and the
+    aggregation's memory is bounded by DuckDB's "memory_limit" setting, beyond which it spills
+    to the "temp_directory."
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): database connection
+        targeted_table_prefix (str): prefix to captures tables to aggregate
+        group_by (list): column names for SQL group by
+        any_value (list): column names not to be summed, but rather to have any value taken
+        color (str): color name for rich progress bar
+        merge (str): SQL aggregate function with which the remaining columns are combined
+    """
+    all_tables = connection.execute("SHOW TABLES;").fetchall()
+    target_tables = sorted(
+        list_tables(all_tables=all_tables, prefix=targeted_table_prefix)
+    )
+    if len(target_tables) < 2:
+        return
+
+    msg = f"""
+Concatenate the {len(target_tables)} tables with the prefix "{targeted_table_prefix}" in a view and re-group them by {group_by} in a single pass.
+    """
+    style_panel(msg=msg, color=color, title="Combine tables")
+
+    # From one of the tables, extract the column names and their data types
+    columns = connection.table(target_tables[0]).columns
+    data_types = connection.table(target_tables[0]).dtypes
+    columns_and_data_types = [f"{i[0]} {i[1]}" for i in list(zip(columns, data_types))]
+
+    # Every table has the same columns in the same order, so their rows can be concatenated as they are
+    view_name = f"union_of_{targeted_table_prefix}"
+    union = " UNION ALL ".join(
+        f"SELECT {', '.join(columns)} FROM {table}" for table in target_tables
+    )
+    query = f"""
+    CREATE OR REPLACE VIEW {view_name} AS {union};
+    """
+    connection.execute(query)
+
+    new_table_name = "{}_{}_{}".format(
+        targeted_table_prefix,
+        extract_month(target_tables[0]),
+        extract_month(target_tables[-1]),
+    )
+    query = f"""
+    DROP TABLE IF EXISTS {new_table_name};
+    CREATE TABLE {new_table_name}(
+        {', '.join(columns_and_data_types)}
+    )
+    """
+    connection.execute(query)
+
+    aggregated_columns = [
+        col for col in columns if col not in group_by and col not in any_value
+    ]
+    aggregation = (
+        group_by
+        + [f"ANY_VALUE({col})" for col in any_value]
+        + [f"{merge}({col})" for col in aggregated_columns]
+    )
+    query = f"""
+    INSERT INTO {new_table_name}({', '.join(group_by + any_value + aggregated_columns)})
+    SELECT  {', '.join(aggregation)}
+    FROM {view_name}
+    GROUP BY ({', '.join(group_by)});
+    """
+    with Progress(
+        TextColumn("{task.description}"), TimeElapsedColumn(), transient=True
+    ) as progress:
+        progress.add_task(f"{color}Aggregating {len(target_tables)} tables...")
+        connection.execute(query)
+
+    query = f"""
+    DROP VIEW {view_name};
+    """
+    connection.execute(query)
+    for table in target_tables:
+        if table != new_table_name:
+            query = f"""
+            DROP TABLE {table};
+            """
+            connection.execute(query)
+
+
+def combine_sketches(
+    connection: duckdb.DuckDBPyConnection,
+    targeted_table_prefix: str,
+    sql: AggregateSQL,
+    color: str,
+    engine: str = "pairwise",
+    keep_as: str | None = None,
+):
+    """Function to merge the monthly sketches of the targeted aggregate tables and to replace the distinct counts of the combined aggregate table with the sketches' estimates.
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): database connection
+        targeted_table_prefix (str): prefix to captures the aggregate tables whose sketches to merge
+        sql (AggregateSQL): information given to the SQL commands that aggregated the tables
+        color (str): color name for rich progress bar
+        engine (str): way of combining the tables, one of COMBINE_ENGINES
+        keep_as (str | None): name under which to keep the merged sketches rather than dropping them
+    """
+    if not sql.sketches:
+        return
+
+    # Sketches are merged by keeping, for each group, metric and register, the maximum rank
+    sketch_prefix = sketch_table_name(targeted_table_prefix)
+    combine_tables(
+        connection=connection,
+        targeted_table_prefix=sketch_prefix,
+        group_by=[sql.group_by, "metric", "register"],
+        any_value=[],
+        color=color,
+        merge="MAX",
+        engine=engine,
+    )
+
+    all_tables = connection.execute("SHOW TABLES;").fetchall()
+    aggregate_tables = list_tables(all_tables=all_tables, prefix=targeted_table_prefix)
+    aggregate_table = aggregate_tables[0]
+    sketch_table = list_tables(all_tables=all_tables, prefix=sketch_prefix)[0]
+
+    msg = f"""
+Estimate the number of distinct values of {list(sql.sketches)} for each "{sql.group_by}" from the merged HyperLogLog sketches, with a relative standard error of {standard_error():.2%}.
+    """
+    style_panel(msg=msg, color=color, title="Estimate distinct counts")
+    for column in sql.sketches:
+        estimates = sketch_estimates_sql(sketch_table, sql.group_by, column)
+        query = f"""
+        UPDATE {aggregate_table}
+        SET {column} = estimates.estimate
+        FROM ({estimates}) AS estimates
+        WHERE {aggregate_table}.{sql.group_by} = estimates.{sql.group_by};
+        """
+        connection.execute(query)
+
+    if keep_as:
+        query = f"""
+        DROP TABLE IF EXISTS {keep_as};
+        ALTER TABLE {sketch_table} RENAME TO {keep_as};
+        """
+    else:
+        query = f"""
+        DROP TABLE {sketch_table};
+        """
+    connection.execute(query)
+
+
 def write_live_table_row(table: Table, total_tours: str, tour: str, pairings: list):
     """Function to modify rich Live Table and show recursive aggregation of tables.
 
@@ -0,0 +1,131 @@
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import duckdb
+from rich import print as rich_print
+from rich.table import Table
+
+from aggregate import COMBINE_ENGINES, aggregate_tables, combine_tables
+from domains import domain_aggregate_sql, domain_group_by
+from utilities import SwitchColor, list_tables
+
+
+def benchmark_engine(
+    database: Path,
+    engine: str,
+    memory_limit: str | None,
+    temp_directory: str | None,
+    color: SwitchColor,
+) -> dict:
+    """Function to aggregate a copy of the database's monthly tweet tables by domain and time how long the given engine takes to combine the monthly aggregates."""
+    with tempfile.TemporaryDirectory() as directory:
+        copy = Path(directory).joinpath(database.name)
+        shutil.copy(database, copy)
+        connection = duckdb.connect(str(copy), read_only=False)
+        if memory_limit:
+            connection.execute(f"SET memory_limit='{memory_limit}';")
+        if temp_directory:
+            connection.execute(f"SET temp_directory='{temp_directory}';")
+
+        # The database's tweet tables have a column "domain_name" unless they were imported with compact IDs
+        all_tables = connection.execute("SHOW TABLES;").fetchall()
+        monthly_table = list_tables(all_tables, "tweets_from")[0]
+        columns = [
+            column[0]
+            for column in connection.execute(f"DESCRIBE {monthly_table};").fetchall()
+        ]
+        compact_ids = "none" if "domain_name" in columns else "dictionary"
+
+        aggregate_tables(
+            connection=connection,
+            color=color.set(),
+            target_table_prefix="domains_in",
+            sql=domain_aggregate_sql(compact_ids),
+        )
+        connection.execute("CHECKPOINT;")
+        size_before = copy.stat().st_size
+
+        start = time.perf_counter()
+        combine_tables(
+            connection=connection,
+            targeted_table_prefix="domains_in",
+            group_by=domain_group_by(compact_ids),
+            any_value=[],
+            color=color.set(),
+            engine=engine,
+        )
+        duration = time.perf_counter() - start
+        connection.execute("CHECKPOINT;")
+        size_after = copy.stat().st_size
+
+        all_tables = connection.execute("SHOW TABLES;").fetchall()
+        combined_table = list_tables(all_tables, "domains_in")[0]
+        rows = connection.execute(
+            f"SELECT * FROM {combined_table} ORDER BY domain_id;"
+        ).fetchall()
+        connection.close()
+
+    return {
+        "engine": engine,
+        "seconds": duration,
+        "growth": size_after - size_before,
+        "rows": rows,
+    }
+
+
+@click.command()
+@click.option(
+    "-d",
+    "--database",
+    type=click.types.Path(exists=True, dir_okay=False),
+    default="output/twitter_links.duckdb",
+    show_default=True,
+    help="A database whose monthly tweet tables were imported by a previous run.",
+)
+@click.option(
+    "--memory-limit",
+    type=click.types.STRING,
+    required=False,
+    help='The maximum memory that the database may use (i.e. "8GB").',
+)
+@click.option(
+    "--temp-directory",
+    type=click.types.Path(file_okay=False),
+    required=False,
+    help="The directory in which the database writes temporary data when it exceeds its memory limit.",
+)
+def main(database, memory_limit, temp_directory):
+    """Compare the engines that combine monthly domain aggregates on the same data."""
+    color = SwitchColor()
+    results = [
+        benchmark_engine(
+            database=Path(database),
+            engine=engine,
+            memory_limit=memory_limit,
+            temp_directory=temp_directory,
+            color=color,
+        )
+        for engine in COMBINE_ENGINES
+    ]
+
+    table = Table(title="Combining monthly domain aggregates")
+    table.add_column("Engine")
+    table.add_column("Time (s)", justify="right")
+    table.add_column("Database growth (MB)", justify="right")
+    table.add_column("Same result", justify="center")
+    reference = results[0]["rows"]
+    for result in results:
+        table.add_row(
+            result["engine"],
+            f"{result['seconds']:.3f}",
+            f"{result['growth'] / 1024 / 1024:.2f}",
+            str(result["rows"] == reference),
+        )
+    rich_print(table)
+
+
+if __name__ == "__main__":
+    main()
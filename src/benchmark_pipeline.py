@@ -0,0 +1,551 @@
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import duckdb
+from rich import print as rich_print
+from rich.table import Table
+
+from aggregate import (
+    COMBINE_ENGINES,
+    aggregate_tables,
+    combine_sketches,
+    combine_tables,
+)
+from domains import domain_aggregate_sql, domain_group_by, export_domains
+from import_data import COMPACT_ID_MODES, create_monthly_views, insert_processed_data
+from parquet_layout import (
+    DEFAULT_ROW_GROUP_SIZE,
+    PARQUET_COMPRESSIONS,
+    ParquetBatchWriter,
+    ParquetLayout,
+    PartitionedParquetWriter,
+)
+from preprocessing import (
+    DEFAULT_BLOCK_SIZE,
+    PARSED_URL_FILE_PATTERN,
+    PARSED_URL_PREFIX,
+    LinkParser,
+    PreprocessingOptions,
+    deconcatenate_links,
+    parse_links,
+    select_columns,
+    stream_links,
+)
+from synthetic_data import SyntheticDataOptions, write_synthetic_data
+from utilities import FileNaming, SwitchColor
+from youtube_links import export_youtube_links, youtube_link_aggregate_sql
+
+# Stages of the pipeline that the benchmark times, in the order in which they run. With the
+# streaming engine, the first 3 stages are replaced by "stream_links"
+BENCHMARK_STAGES = [
+    "select_columns",
+    "deconcatenate_links",
+    "parse_links",
+    "stream_links",
+    "import",
+    "aggregate_domains",
+    "combine_domains",
+    "export_domains",
+    "aggregate_youtube_links",
+    "combine_youtube_links",
+    "export_youtube_links",
+]
+
+
+class StageTimes:
+    """Class to add up the time spent in each stage of the pipeline."""
+
+    def __init__(self) -> None:
+        self.seconds = {}
+
+    def time(self, stage: str, function, *args, **kwargs):
+        """Method to call the function and add its duration to the stage's time. It returns the function's result."""
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+        return result
+
+
+class PipelineOptions:
+    """Class to hold the options of the pipeline with which the benchmark runs, which are those of src/main.py that change its performance."""
+
+    def __init__(
+        self,
+        preprocessing: PreprocessingOptions | None = None,
+        compact_ids: str = "none",
+        approximate_distinct: bool = False,
+        combine_engine: str = "pairwise",
+        concurrent_months: int = 1,
+        query_in_place: bool = False,
+    ) -> None:
+        if preprocessing is None:
+            preprocessing = PreprocessingOptions()
+        self.preprocessing = preprocessing
+        self.compact_ids = compact_ids
+        self.approximate_distinct = approximate_distinct
+        self.combine_engine = combine_engine
+        self.concurrent_months = concurrent_months
+        self.query_in_place = query_in_place
+
+    def to_dict(self) -> dict:
+        preprocessing = self.preprocessing
+        return {
+            "streaming": preprocessing.streaming,
+            "block_size": preprocessing.block_size,
+            "fast_domains": preprocessing.fast_domains,
+            "layout": preprocessing.layout.describe(),
+            "partition_by_month": preprocessing.partition_by_month,
+            "decompression_threads": preprocessing.decompression_threads,
+            "compact_ids": self.compact_ids,
+            "approximate_distinct": self.approximate_distinct,
+            "combine_engine": self.combine_engine,
+            "concurrent_months": self.concurrent_months,
+            "query_in_place": self.query_in_place,
+        }
+
+
+def benchmark_pipeline(
+    options: SyntheticDataOptions,
+    files: int,
+    color: SwitchColor,
+    pipeline: PipelineOptions | None = None,
+) -> dict[str, float]:
+    """Function to generate synthetic data in a temporary directory and time every stage of the pipeline on it, run with the given options."""
+    if pipeline is None:
+        pipeline = PipelineOptions()
+    preprocessing = pipeline.preprocessing
+    times = StageTimes()
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir = Path(directory).joinpath("data")
+        output_dir = Path(directory).joinpath("pre-processing")
+        output_dir.mkdir()
+        infiles = write_synthetic_data(data_dir, options, files=files)
+
+        # Pre-process the files one step at a time, or with the streaming engine, with a new cache of parsed links
+        parser = LinkParser(fast_domains=preprocessing.fast_domains)
+        for infile in infiles:
+            name_file = FileNaming(output_dir, infile)
+            parsed_urls_outfile = name_file.parquet(PARSED_URL_PREFIX)
+            if preprocessing.partition_by_month:
+                writer = PartitionedParquetWriter(
+                    output_dir, parsed_urls_outfile.name, preprocessing.layout
+                )
+            else:
+                writer = ParquetBatchWriter(parsed_urls_outfile, preprocessing.layout)
+            if preprocessing.streaming:
+                times.time(
+                    "stream_links",
+                    stream_links,
+                    infile,
+                    writer,
+                    parser=parser,
+                    block_size=preprocessing.block_size,
+                    decompression_threads=preprocessing.decompression_threads,
+                )
+                times.time("stream_links", writer.close)
+                continue
+            selected_columns_outfile = name_file.parquet("selected_columns")
+            times.time(
+                "select_columns",
+                select_columns,
+                infile,
+                selected_columns_outfile,
+                layout=preprocessing.layout,
+                decompression_threads=preprocessing.decompression_threads,
+            )
+            links = times.time(
+                "deconcatenate_links", deconcatenate_links, selected_columns_outfile
+            )
+            selected_columns_outfile.unlink()
+            times.time("parse_links", parse_links, links, writer, parser=parser)
+            times.time("parse_links", writer.close)
+
+        connection = duckdb.connect(str(Path(directory).joinpath("benchmark.duckdb")))
+        times.time(
+            "import",
+            create_monthly_views if pipeline.query_in_place else insert_processed_data,
+            connection=connection,
+            preprocessing_dir=output_dir,
+            input_file_pattern=PARSED_URL_FILE_PATTERN,
+            color=color.set(),
+            compact_ids=pipeline.compact_ids,
+        )
+
+        domain_sql = domain_aggregate_sql(
+            pipeline.compact_ids, pipeline.approximate_distinct
+        )
+        times.time(
+            "aggregate_domains",
+            aggregate_tables,
+            connection=connection,
+            color=color.set(),
+            target_table_prefix="domains_in",
+            sql=domain_sql,
+            concurrent_months=pipeline.concurrent_months,
+        )
+        times.time(
+            "combine_domains",
+            combine_tables,
+            connection=connection,
+            targeted_table_prefix="domains_in",
+            group_by=domain_group_by(pipeline.compact_ids),
+            any_value=[],
+            color=color.set(),
+            engine=pipeline.combine_engine,
+        )
+        times.time(
+            "combine_domains",
+            combine_sketches,
+            connection=connection,
+            targeted_table_prefix="domains_in",
+            sql=domain_sql,
+            color=color.set(),
+            engine=pipeline.combine_engine,
+        )
+        times.time(
+            "export_domains",
+            export_domains,
+            connection=connection,
+            outfile=str(Path(directory).joinpath("domains.csv")),
+            compact_ids=pipeline.compact_ids,
+        )
+
+        youtube_link_sql = youtube_link_aggregate_sql(
+            pipeline.compact_ids, pipeline.approximate_distinct
+        )
+        times.time(
+            "aggregate_youtube_links",
+            aggregate_tables,
+            connection=connection,
+            color=color.set(),
+            target_table_prefix="youtube_links",
+            sql=youtube_link_sql,
+            concurrent_months=pipeline.concurrent_months,
+        )
+        times.time(
+            "combine_youtube_links",
+            combine_tables,
+            connection=connection,
+            targeted_table_prefix="youtube_links",
+            group_by=["normalized_url"],
+            any_value=["link_for_scraping"],
+            color=color.set(),
+            engine=pipeline.combine_engine,
+        )
+        times.time(
+            "combine_youtube_links",
+            combine_sketches,
+            connection=connection,
+            targeted_table_prefix="youtube_links",
+            sql=youtube_link_sql,
+            color=color.set(),
+            engine=pipeline.combine_engine,
+        )
+        times.time(
+            "export_youtube_links",
+            export_youtube_links,
+            connection=connection,
+            outfile=Path(directory).joinpath("youtube_links.parquet"),
+        )
+        connection.close()
+    return times.seconds
+
+
+def comparison_table(results: dict, baseline: dict | None) -> Table:
+    """Function to lay out the time of each stage that ran at every scale and, if a baseline is given, its change from the baseline."""
+    table = Table(title="Pipeline stages on synthetic data")
+    table.add_column("Rows", justify="right")
+    table.add_column("Stage")
+    table.add_column("Time (s)", justify="right")
+    if baseline:
+        table.add_column("Baseline (s)", justify="right")
+        table.add_column("Change", justify="right")
+    for rows, seconds in results.items():
+        for stage in BENCHMARK_STAGES:
+            if stage not in seconds:
+                continue
+            row = [rows, stage, f"{seconds[stage]:.3f}"]
+            if baseline:
+                reference = baseline["results"].get(rows, {}).get(stage)
+                if reference:
+                    change = (seconds[stage] - reference) / reference
+                    # Changes of more than 10% are highlighted
+                    formatted_change = f"{change:+.0%}"
+                    if change > 0.1:
+                        formatted_change = f"[red]{formatted_change}"
+                    elif change < -0.1:
+                        formatted_change = f"[green]{formatted_change}"
+                    row += [f"{reference:.3f}", formatted_change]
+                else:
+                    row += ["", ""]
+            table.add_row(*row)
+    return table
+
+
+@click.command()
+@click.option(
+    "--rows",
+    type=click.types.INT,
+    multiple=True,
+    default=[10_000, 100_000],
+    show_default=True,
+    help="Number of synthetic tweets at which to run the benchmark. Can be given several times, for several scales.",
+)
+@click.option(
+    "--files",
+    type=click.types.INT,
+    default=4,
+    show_default=True,
+    help="Number of gzipped CSV files between which the synthetic tweets are split.",
+)
+@click.option(
+    "--links-per-tweet",
+    type=click.types.FLOAT,
+    default=1.5,
+    show_default=True,
+    help="Mean number of links in a synthetic tweet.",
+)
+@click.option(
+    "--distinct-urls",
+    type=click.types.INT,
+    required=False,
+    help="Number of distinct URLs from which the links are drawn. Defaults to a tenth of the number of tweets.",
+)
+@click.option(
+    "--url-skew",
+    type=click.types.FLOAT,
+    default=1.1,
+    show_default=True,
+    help="Exponent of the Zipf distribution from which links are drawn. The higher it is, the more the most shared URLs are repeated.",
+)
+@click.option(
+    "--youtube-share",
+    type=click.types.FLOAT,
+    default=0.2,
+    show_default=True,
+    help="Share of the distinct URLs that are YouTube links.",
+)
+@click.option(
+    "--months",
+    type=click.types.INT,
+    default=12,
+    show_default=True,
+    help="Number of months over which the synthetic tweets are spread.",
+)
+@click.option(
+    "--seed",
+    type=click.types.INT,
+    default=0,
+    show_default=True,
+    help="Seed of the random generator of synthetic data.",
+)
+@click.option(
+    "--repeat",
+    type=click.types.INT,
+    default=1,
+    show_default=True,
+    help="Number of times the benchmark is run at every scale. The fastest time of each stage is kept.",
+)
+@click.option(
+    "--streaming",
+    is_flag=True,
+    default=False,
+    help="This flag pre-processes the files with the fused streaming engine, which is timed as the stage 'stream_links.'",
+)
+@click.option(
+    "--block-size",
+    type=click.types.INT,
+    default=DEFAULT_BLOCK_SIZE // (1024 * 1024),
+    show_default=True,
+    help="Size, in MB, of the blocks of CSV data that the streaming engine reads at a time.",
+)
+@click.option(
+    "--fast-domains",
+    is_flag=True,
+    default=False,
+    help="This flag computes the links' domain names with the vectorised fast path.",
+)
+@click.option(
+    "--parquet-compression",
+    type=click.Choice(PARQUET_COMPRESSIONS),
+    default="zstd",
+    show_default=True,
+    help="The compression codec of the pre-processed parquet files.",
+)
+@click.option(
+    "--row-group-size",
+    type=click.types.INT,
+    default=DEFAULT_ROW_GROUP_SIZE,
+    show_default=True,
+    help="The number of rows in each row group of the pre-processed parquet files.",
+)
+@click.option(
+    "--sort-by-time/--no-sort-by-time",
+    default=True,
+    show_default=True,
+    help="Whether to sort the rows of each pre-processed parquet file by the tweets' local time.",
+)
+@click.option(
+    "--partition-by-month",
+    is_flag=True,
+    default=False,
+    help="This flag writes the pre-processed parquet files in month-partitioned directories.",
+)
+@click.option(
+    "--decompression-threads",
+    type=click.types.INT,
+    default=1,
+    show_default=True,
+    help="The number of threads with which a data file is decompressed.",
+)
+@click.option(
+    "--compact-ids",
+    type=click.Choice(COMPACT_ID_MODES),
+    default="none",
+    show_default=True,
+    help="The way the tweets' and the domains' IDs are stored in the monthly tables.",
+)
+@click.option(
+    "--approximate-distinct",
+    is_flag=True,
+    default=False,
+    help="This flag estimates the cross-month distinct counts from sketches.",
+)
+@click.option(
+    "--combine-engine",
+    type=click.Choice(COMBINE_ENGINES),
+    default="pairwise",
+    show_default=True,
+    help="The engine with which the monthly aggregate tables are combined.",
+)
+@click.option(
+    "--concurrent-months",
+    type=click.types.INT,
+    default=1,
+    show_default=True,
+    help="The number of months aggregated at the same time.",
+)
+@click.option(
+    "--query-in-place",
+    is_flag=True,
+    default=False,
+    help="This flag aggregates the pre-processed parquet files through views instead of importing them.",
+)
+@click.option(
+    "--save-baseline",
+    type=click.types.Path(dir_okay=False),
+    required=False,
+    help="JSON file to which the results are written, so that later runs can be compared with them.",
+)
+@click.option(
+    "--compare",
+    type=click.types.Path(exists=True, dir_okay=False),
+    required=False,
+    help="JSON file of results saved with --save-baseline, to which the results are compared.",
+)
+def main(
+    rows,
+    files,
+    links_per_tweet,
+    distinct_urls,
+    url_skew,
+    youtube_share,
+    months,
+    seed,
+    repeat,
+    streaming,
+    block_size,
+    fast_domains,
+    parquet_compression,
+    row_group_size,
+    sort_by_time,
+    partition_by_month,
+    decompression_threads,
+    compact_ids,
+    approximate_distinct,
+    combine_engine,
+    concurrent_months,
+    query_in_place,
+    save_baseline,
+    compare,
+):
+    """Time every stage of the pipeline, run with the given options, on synthetic Twitter data at several scales."""
+    color = SwitchColor()
+    pipeline = PipelineOptions(
+        preprocessing=PreprocessingOptions(
+            streaming=streaming,
+            block_size=block_size * 1024 * 1024,
+            fast_domains=fast_domains,
+            layout=ParquetLayout(
+                compression=parquet_compression,
+                row_group_size=row_group_size,
+                sort_by_time=sort_by_time,
+            ),
+            partition_by_month=partition_by_month,
+            decompression_threads=decompression_threads,
+        ),
+        compact_ids=compact_ids,
+        approximate_distinct=approximate_distinct,
+        combine_engine=combine_engine,
+        concurrent_months=concurrent_months,
+        query_in_place=query_in_place,
+    )
+    baseline = None
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    generator_options = None
+    for nb_rows in rows:
+        options = SyntheticDataOptions(
+            rows=nb_rows,
+            links_per_tweet=links_per_tweet,
+            distinct_urls=distinct_urls or max(1, nb_rows // 10),
+            url_skew=url_skew,
+            youtube_share=youtube_share,
+            months=months,
+            seed=seed,
+        )
+        runs = [
+            benchmark_pipeline(options, files, color, pipeline) for _ in range(repeat)
+        ]
+        results[str(nb_rows)] = {
+            stage: min(run[stage] for run in runs) for stage in runs[0]
+        }
+        generator_options = options.to_dict()
+        del generator_options["rows"]
+        generator_options["files"] = files
+        if distinct_urls is None:
+            generator_options["distinct_urls"] = "rows / 10"
+
+    if baseline and baseline["options"] != generator_options:
+        rich_print(
+            "[bold red]The baseline was measured on synthetic data generated with other options, to which these results can't be compared."
+        )
+        baseline = None
+    # Baselines are meant to be compared with other options of the pipeline, which are only pointed out
+    if baseline and baseline.get("pipeline") != pipeline.to_dict():
+        rich_print(
+            f"The baseline was measured with the pipeline's options {baseline.get('pipeline')}."
+        )
+    rich_print(comparison_table(results, baseline))
+
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            json.dump(
+                {
+                    "options": generator_options,
+                    "pipeline": pipeline.to_dict(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import io
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pyarrow
+
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+# Magic numbers at the start of compressed files
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LZ4_FRAME_MAGIC = b"\x04\x22\x4d\x18"
+BZ2_MAGIC = b"BZh"
+
+# Size of the buffer through which decompressed data is given to the CSV reader
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+def detect_compression(infile: Path) -> str | None:
+    """Function to detect a file's compression from its first bytes rather than from its extension. It returns "bgzip," "gzip," "zstd," "lz4," "bz2," or None if the file is not compressed."""
+    with open(infile, "rb") as f:
+        header = f.read(18)
+    if header.startswith(GZIP_MAGIC):
+        if is_bgzf_header(header):
+            return "bgzip"
+        return "gzip"
+    if header.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if header.startswith(LZ4_FRAME_MAGIC):
+        return "lz4"
+    if header.startswith(BZ2_MAGIC):
+        return "bz2"
+    return None
+
+
+def is_bgzf_header(header: bytes) -> bool:
+    """Function to check whether a gzip member's header has the "BC" extra field of blocked gzip (bgzip), whose blocks can be inflated independently."""
+    if len(header) < 18 or not header[3] & 4:
+        return False
+    extra_length = struct.unpack("<H", header[10:12])[0]
+    return extra_length >= 6 and header[12:14] == b"BC"
+
+
+def open_input(infile: Path, decompression_threads: int = 1):
+    """Function to open a data file for pyarrow's streaming CSV reader, decompressing it on several threads when possible.
+
+    Blocked gzip (bgzip) files are inflated in parallel block by block. Other gzip files are inflated
+    in parallel with rapidgzip, which speculatively decodes the file from several offsets, if it is
+    installed. Zstandard, LZ4 and bzip2 files are decompressed natively by pyarrow.
+    """
+    compression = detect_compression(infile)
+    if compression == "bgzip":
+        if decompression_threads > 1:
+            return io.BufferedReader(
+                ParallelBGZFReader(infile, threads=decompression_threads),
+                buffer_size=READ_BUFFER_SIZE,
+            )
+        compression = "gzip"
+    if compression == "gzip" and decompression_threads > 1 and rapidgzip is not None:
+        return rapidgzip.open(str(infile), parallelization=decompression_threads)
+    return pyarrow.input_stream(str(infile), compression=compression)
+
+
+def single_threaded_files(files: list[Path], decompression_threads: int) -> list[Path]:
+    """Function to find the files that would be decompressed on a single thread despite being given several threads, i.e. the ordinary gzip files when rapidgzip isn't installed."""
+    if decompression_threads <= 1 or rapidgzip is not None:
+        return []
+    return [infile for infile in files if detect_compression(infile) == "gzip"]
+
+
+def inflate_bgzf_block(block: bytes) -> bytes:
+    """Function to inflate one bgzip block and check its CRC and size."""
+    extra_length = struct.unpack("<H", block[10:12])[0]
+    data = zlib.decompress(block[12 + extra_length : -8], wbits=-15)
+    crc, size = struct.unpack("<II", block[-8:])
+    if zlib.crc32(data) != crc or len(data) != size:
+        raise zlib.error("Corrupted bgzip block")
+    return data
+
+
+class ParallelBGZFReader(io.RawIOBase):
+    """Class to read a blocked gzip (bgzip) file while inflating its blocks on a pool of threads. Blocks are read ahead of the consumer and given back in order."""
+
+    def __init__(self, infile: Path, threads: int) -> None:
+        super().__init__()
+        self.file = open(infile, "rb")
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.read_ahead = threads * 4
+        self.pending = deque()
+        self.buffer = b""
+        self.offset = 0
+        self.end_of_file = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read_block(self) -> bytes | None:
+        header = self.file.read(12)
+        if len(header) < 12:
+            return None
+        extra_length = struct.unpack("<H", header[10:12])[0]
+        extra = self.file.read(extra_length)
+        block_size = None
+        i = 0
+        while i + 4 <= len(extra):
+            subfield_length = struct.unpack("<H", extra[i + 2 : i + 4])[0]
+            if extra[i : i + 2] == b"BC":
+                block_size = struct.unpack("<H", extra[i + 4 : i + 6])[0] + 1
+            i += 4 + subfield_length
+        if block_size is None:
+            raise zlib.error("Missing bgzip block size")
+        rest = self.file.read(block_size - 12 - extra_length)
+        return header + extra + rest
+
+    def fill(self):
+        while len(self.pending) < self.read_ahead and not self.end_of_file:
+            block = self.read_block()
+            if block is None:
+                self.end_of_file = True
+            else:
+                self.pending.append(self.executor.submit(inflate_bgzf_block, block))
+
+    def readinto(self, b) -> int:
+        while self.offset >= len(self.buffer):
+            self.fill()
+            if not self.pending:
+                return 0
+            self.buffer = self.pending.popleft().result()
+            self.offset = 0
+        n = min(len(b), len(self.buffer) - self.offset)
+        b[:n] = self.buffer[self.offset : self.offset + n]
+        self.offset += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.file.close()
+        super().close()
@@ -1,36 +1,72 @@
 import duckdb
 
-from aggregate import AggregateSQL
+from aggregate import (
+    AggregateSQL,
+    count_distinct_sql,
+    pivot_timeseries_sql,
+)
 from exceptions import MissingTable
+from import_data import domain_names_table
 from utilities import list_tables
 
 
-def domain_aggregate_sql() -> AggregateSQL:
-    new_table_columns = [
-        "domain_id VARCHAR",
-        "domain_name VARCHAR",
-        "nb_distinct_links_from_domain UBIGINT",
-        "nb_collected_retweets_with_domain UBIGINT",
-        "sum_all_tweets_with_domain UBIGINT",
-        "nb_accounts_that_shared_domain_link UBIGINT",
-    ]
-    select = """
+# Distinct counts of the domain aggregates and the values they count. Except for tweets, which
+# belong to one month only, the same values can be counted in several months
+DOMAIN_DISTINCT_COUNTS = {
+    "nb_distinct_links_from_domain": "normalized_url",
+    "nb_collected_retweets_with_domain": "retweeted_id",
+    "sum_all_tweets_with_domain": "tweet_id",
+    "nb_accounts_that_shared_domain_link": "user_id",
+}
+CROSS_MONTH_DOMAIN_COUNTS = [
+    "nb_distinct_links_from_domain",
+    "nb_collected_retweets_with_domain",
+    "nb_accounts_that_shared_domain_link",
+]
+
+
+def domain_aggregate_sql(
+    compact_ids: str = "none", approximate_distinct: bool = False
+) -> AggregateSQL:
+    # With compact IDs, the domain's name is only joined back to its ID at export
+    if compact_ids == "none":
+        new_table_columns = ["domain_id VARCHAR", "domain_name VARCHAR"]
+        select = """
             domain_id,
-            ANY_VALUE(domain_name),
-            COUNT(DISTINCT normalized_url),
-            COUNT(DISTINCT retweeted_id),
-            COUNT(DISTINCT tweet_id),
-            COUNT(DISTINCT user_id),
-    """
+            ANY_VALUE(domain_name),"""
+        where = "domain_name IS NOT NULL"
+    else:
+        new_table_columns = ["domain_id UBIGINT"]
+        select = """
+            domain_id,"""
+        where = "domain_id IS NOT NULL"
+    new_table_columns += [f"{column} UBIGINT" for column in DOMAIN_DISTINCT_COUNTS]
+
+    # In the approximate mode, the counts that would be overcounted by summing months are estimated from sketches
+    approximate = CROSS_MONTH_DOMAIN_COUNTS if approximate_distinct else []
+    select += count_distinct_sql(DOMAIN_DISTINCT_COUNTS, approximate)
     return AggregateSQL(
         new_table_constant_columns=new_table_columns,
         select=select,
-        where="domain_name IS NOT NULL",
+        where=where,
         group_by="domain_id",
+        sketches={column: DOMAIN_DISTINCT_COUNTS[column] for column in approximate},
     )
 
 
-def export_domains(connection: duckdb.DuckDBPyConnection, outfile: str):
+def domain_group_by(compact_ids: str = "none") -> list[str]:
+    """Function to get the columns on which aggregated domain tables are combined."""
+    if compact_ids == "none":
+        return ["domain_id", "domain_name"]
+    return ["domain_id"]
+
+
+def export_domains(
+    connection: duckdb.DuckDBPyConnection,
+    outfile: str,
+    compact_ids: str = "none",
+    aggregate_table_prefix: str = "domains_in",
+):
     """Function to clean up after aggregation of domain names and to export result."""
 
     # If more than 1 table exists with the prefix "domains", the recursive aggregation of target tables failed
@@ -41,9 +77,27 @@ def export_domains(connection: duckdb.DuckDBPyConnection, outfile: str):
     sole_remaining_domain_table = domain_tables[0]
 
     # Create a table for the finalized domain data with a generated column that counts original tweets
-    columns = duckdb.table(sole_remaining_domain_table, connection).columns
-    data_types = duckdb.table(sole_remaining_domain_table, connection).dtypes
+    columns = connection.table(sole_remaining_domain_table).columns
+    data_types = connection.table(sole_remaining_domain_table).dtypes
     columns_and_data_types = [f"{i[0]} {i[1]}" for i in list(zip(columns, data_types))]
+    source = sole_remaining_domain_table
+
+    # With compact IDs, join the domains' names back to their IDs
+    if compact_ids != "none":
+        columns_and_data_types.insert(1, "domain_name VARCHAR")
+        columns.insert(1, "domain_name")
+        source += f"""
+    JOIN {domain_names_table(compact_ids)} USING (domain_id)"""
+
+    # Pivot the domains' long-format time series into one column of tweet counts per month
+    month_columns, timeseries = pivot_timeseries_sql(
+        connection, aggregate_table_prefix, group_by="domain_id"
+    )
+    columns_and_data_types += [f"{column} UBIGINT" for column in month_columns]
+    columns += month_columns
+    source += f"""
+    JOIN ({timeseries}) AS timeseries USING (domain_id)"""
+
     query = f"""
     DROP TABLE IF EXISTS all_domains;
     CREATE TABLE all_domains(
@@ -57,7 +111,7 @@ def export_domains(connection: duckdb.DuckDBPyConnection, outfile: str):
     query = f"""
     INSERT INTO all_domains
     SELECT {', '.join(columns)}
-    FROM {sole_remaining_domain_table}
+    FROM {source}
     ORDER BY sum_all_tweets_with_domain DESC;
     """
     connection.execute(query)
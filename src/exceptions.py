@@ -1,3 +1,13 @@
 class MissingTable(Exception):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
+
+
+class YouTubeQuotaExhausted(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class YouTubeAPIError(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
@@ -0,0 +1,132 @@
+import random
+from functools import lru_cache
+
+import polars
+import ural.tld_data
+import ural.youtube
+
+# Pattern to extract the host from a (normalized) URL, with or without its scheme
+HOST_PATTERN = r"^(?:[a-zA-Z][a-zA-Z0-9+.\-]*://)?(?:[^@/?#]*@)?([^:/?#]+)"
+
+# Prefixes that are stripped from a host before its domain name is computed
+STRIPPED_PREFIX_PATTERN = r"^(?:www\d*)\.(.+\..+)$"
+
+# Hosts that the fast path leaves to Ural: IP addresses, internationalized names, and malformed hosts
+UNCLASSIFIABLE_HOST_PATTERN = r"(?:^[\d.]+$|[^a-z0-9.\-]|xn--|^\.|\.$|\.\.)"
+
+
+class PublicSuffixes:
+    """Class to hold the public suffix list, grouped by the number of labels in each suffix."""
+
+    def __init__(self, rules: list[str]) -> None:
+        self.by_depth = {}
+        self.wildcard_parents = set()
+        self.exceptions = set()
+        for rule in rules:
+            if rule.startswith("!"):
+                self.exceptions.add(rule[1:])
+            elif rule.startswith("*."):
+                self.wildcard_parents.add(rule[2:])
+            else:
+                depth = rule.count(".") + 1
+                self.by_depth.setdefault(depth, set()).add(rule)
+        self.max_depth = max(self.by_depth.keys(), default=0)
+
+
+@lru_cache(maxsize=1)
+def load_public_suffixes() -> PublicSuffixes:
+    """Function to preload the public and private suffixes on which Ural's get_domain_name relies."""
+    rules = [
+        rule.lower()
+        for rule in ural.tld_data.PUBLIC_SUFFIXES + ural.tld_data.PRIVATE_SUFFIXES
+    ]
+    return PublicSuffixes(rules)
+
+
+def trailing_labels(host: polars.Expr, depth: int) -> polars.Expr:
+    """Function to extract the last "depth" labels of a host, or null if it has fewer labels."""
+    return host.str.extract(r"((?:[^.]+\.){" + str(depth - 1) + r"}[^.]+)$", 1)
+
+
+def fast_domain_expression(suffixes: PublicSuffixes) -> polars.Expr:
+    """Function to build the polars expression that computes the domain name of the column "normalized_url", or null if the URL cannot be classified in bulk."""
+    host = (
+        polars.col("normalized_url")
+        .str.extract(HOST_PATTERN, 1)
+        .str.to_lowercase()
+        .str.replace(STRIPPED_PREFIX_PATTERN, "$1")
+    )
+    unclassifiable = host.is_null() | host.str.contains(UNCLASSIFIABLE_HOST_PATTERN)
+
+    # Leave hosts under wildcard or exception rules to Ural
+    for depth in range(1, suffixes.max_depth + 2):
+        labels = trailing_labels(host, depth)
+        unclassifiable = (
+            unclassifiable
+            | labels.is_in(list(suffixes.wildcard_parents))
+            | labels.is_in(list(suffixes.exceptions))
+        )
+
+    # The domain name is the longest matching public suffix and the label before it
+    domain = polars.lit(None, dtype=polars.Utf8)
+    for depth in sorted(suffixes.by_depth.keys()):
+        domain = (
+            polars.when(
+                trailing_labels(host, depth).is_in(list(suffixes.by_depth[depth]))
+            )
+            .then(trailing_labels(host, depth + 1))
+            .otherwise(domain)
+        )
+    return polars.when(unclassifiable).then(None).otherwise(domain)
+
+
+def fast_attribute_domains(normalized_urls: list[str]) -> polars.DataFrame:
+    """Function to compute in bulk the domain names of normalized URLs, with every parsed version of a YouTube domain name written the same. The column "domain" is null where the fast path could not classify the URL."""
+    suffixes = load_public_suffixes()
+    dataframe = polars.DataFrame(
+        {"normalized_url": normalized_urls}, schema={"normalized_url": polars.Utf8}
+    )
+    youtube_aliases = polars.DataFrame(
+        {
+            "domain": list(ural.youtube.YOUTUBE_DOMAINS),
+            "alias": ["youtube.com"] * len(ural.youtube.YOUTUBE_DOMAINS),
+        },
+        schema={"domain": polars.Utf8, "alias": polars.Utf8},
+    )
+    return (
+        dataframe.with_columns([fast_domain_expression(suffixes).alias("domain")])
+        .join(youtube_aliases, on="domain", how="left")
+        .select(
+            [
+                polars.col("normalized_url"),
+                polars.coalesce([polars.col("alias"), polars.col("domain")]).alias(
+                    "domain"
+                ),
+            ]
+        )
+    )
+
+
+def attribute_domains(normalized_urls: list[str], fallback) -> list:
+    """Function to get the domain names of normalized URLs with the fast path, calling "fallback" on every URL it could not classify."""
+    fast_domains = (
+        fast_attribute_domains(normalized_urls).get_column("domain").to_list()
+    )
+    return [
+        domain if domain is not None or url is None else fallback(url)
+        for url, domain in zip(normalized_urls, fast_domains)
+    ]
+
+
+def verify_fast_path(normalized_urls: list[str], reference, sample_size: int) -> list:
+    """Function to check, on a random sample of normalized URLs, that the fast path gives the same domain names as the "reference" function. It returns the (URL, fast path domain, reference domain) of every mismatch."""
+    sample = random.sample(normalized_urls, min(sample_size, len(normalized_urls)))
+    fast_domains = attribute_domains(sample, fallback=reference)
+    reference_domains = [reference(url) for url in sample]
+    return [
+        (url, fast_domain, reference_domain)
+        for url, fast_domain, reference_domain in zip(
+            sample, fast_domains, reference_domains
+        )
+        if fast_domain != reference_domain
+    ]
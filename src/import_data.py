@@ -1,7 +1,8 @@
+import datetime
 from pathlib import Path
 
 import duckdb
-from minet.youtube.constants import YOUTUBE_VIDEO_CSV_HEADERS
+import pyarrow
 from rich.progress import (
     BarColumn,
     MofNCompleteColumn,
@@ -10,8 +11,28 @@ from rich.progress import (
     TimeElapsedColumn,
 )
 
-from domains import list_tables
-from utilities import forge_name_with_date, get_filepaths, style_panel
+from incremental import MonthLedger
+from parquet_layout import month_partitions
+from utilities import (
+    extract_month,
+    forge_name_with_date,
+    get_filepaths,
+    list_tables,
+    style_panel,
+)
+from youtube_videos import VIDEO_METADATA_TABLE
+
+# Ways of storing the tweets' IDs and the domains' IDs in the monthly tables: as strings and an
+# MD5 hex digest of the domain name, as integers and a 64-bit hash of the domain name, or as
+# integers and a dense integer from the persistent table of domain names
+COMPACT_ID_MODES = ["none", "hash", "dictionary"]
+
+# Most rows that importing each month with its own range filter may read, as a multiple of the rows of the
+# files, before the files are instead read once and their rows routed to the months' tables
+MAX_MONTHLY_READ_RATIO = 1.5
+
+# Number of rows that are routed to the months' tables at a time, when the files are read once
+ROUTING_BATCH_SIZE = 500_000
 
 
 def insert_processed_data(
@@ -19,25 +40,33 @@ def insert_processed_data(
     preprocessing_dir: Path,
     input_file_pattern: str,
     color: str,
+    compact_ids: str = "none",
+    ledger: MonthLedger | None = None,
 ):
-    """Function to insert parquet file into database's main table."""
+    """Function to insert parquet file into database's main table. If a ledger of the months imported by earlier runs is given, only the new or changed months are imported."""
+
+    # If the pre-processed data was partitioned by month, import each month's partition at once
+    partitions = discover_month_partitions(preprocessing_dir, input_file_pattern)
+    if partitions:
+        insert_partitioned_data(
+            connection=connection,
+            partitions=partitions,
+            input_file_pattern=input_file_pattern,
+            color=color,
+            compact_ids=compact_ids,
+            ledger=ledger,
+        )
+        return
 
     msg = f"""
-For each pre-processed parquet file, parse the tweets' publication dates and insert each tweet's data into the table corresponding to the month of the tweet's publication.
+For each pre-processed parquet file, parse the tweets' publication dates and insert each tweet's data into the table corresponding to the month of the tweet's publication. If the files' row groups are clustered by time, each month is read from the row groups that contain it; otherwise the files are read once and each tweet is routed to its month.
     """
     style_panel(msg=msg, color=color, title="Import data")
 
     connection.execute("PRAGMA disable_progress_bar")
-
-    # Before continuing with this process, remove any existing monthly tables in the database
-    all_tables = connection.execute("SHOW TABLES;").fetchall()
-    aggregate_tables = list_tables(all_tables, "tweets_from")
-    if len(aggregate_tables) > 0:
-        for table in aggregate_tables:
-            query = f"""
-            DROP TABLE {table};
-            """
-            connection.execute(query)
+    if ledger is None:
+        drop_monthly_tables(connection)
+    create_domain_names_table(connection, compact_ids)
 
     # Get a list of all pre-processed parquet files in the pre-processing directory
     parquet_files = get_filepaths(
@@ -54,144 +83,550 @@ For each pre-processed parquet file, parse the tweets' publication dates and ins
         expand=True,
     )
     with ProgressCompleteColumn as progress:
-        task1 = progress.add_task(f"{color}Parsing date range...", start=False, total=0)
+        task1 = progress.add_task(
+            f"{color}Indexing months of files...", start=False, total=0
+        )
         task2 = progress.add_task(f"{color}Creating tables...", start=False, total=0)
         task3 = progress.add_task(
             f"{color}Importing tweet data...", start=False, total=0
         )
         # ------------------------------------------------------------------ #
 
-        # Start progress bar on task 1: Parsing the dataset's date range
+        # Start progress bar on task 1: Indexing the months of the pre-processed files
         progress.update(task_id=task1, total=len(parquet_files))
         progress.start_task(task_id=task1)
 
-        # Parse which months are represented in which data files
-        months_in_all_files = []
-        index_of_files_and_their_months = {}
-        for f in parquet_files:
-            filepath = str(f)
+        # Parse which months are represented in which data files, with one scan of only the files' column "local_time"
+        month_files = {}
+        if parquet_files:
+            files = [str(f) for f in parquet_files]
             query = f"""
-            SELECT DISTINCT date_trunc('month', local_time)
-            FROM (
-                SELECT CAST(local_time AS TIMESTAMP) AS local_time
-                FROM read_parquet('{filepath}')
-            )
-            GROUP BY date_trunc('month', local_time);
+            SELECT DISTINCT filename, date_trunc('month', CAST(local_time AS TIMESTAMP)) AS month
+            FROM read_parquet({files}, filename=true)
+            WHERE local_time IS NOT NULL
+            ORDER BY month, filename;
             """
-            months_in_the_file = [t[0] for t in duckdb.sql(query).fetchall()]
-            months_in_all_files.extend(months_in_the_file)
-            index_of_files_and_their_months[filepath] = months_in_the_file
-            progress.update(task_id=task1, advance=1)
-        all_months = set(months_in_all_files)
+            for file, month in connection.execute(query).fetchall():
+                month_files.setdefault(month, []).append(file)
+            progress.update(task_id=task1, advance=len(parquet_files))
+
+        # Only import the months that are new or whose pre-processed files have changed
+        if ledger is not None:
+            changed_months = ledger.update(
+                {month_name(month): files for month, files in month_files.items()}
+            )
+            drop_monthly_tables(connection, months=changed_months + ledger.removed)
+            month_files = {
+                month: files
+                for month, files in month_files.items()
+                if month_name(month) in changed_months
+            }
 
         # Start progress bar on task 2: Creating tables in the database
-        progress.update(task_id=task2, total=(len(all_months)))
+        progress.update(task_id=task2, total=(len(month_files)))
         progress.start_task(task_id=task2)
 
         # Create tables for each month in the dataset
-        for month in all_months:
+        for month in month_files:
             table_name = forge_name_with_date(prefix="tweets_from", datetime_obj=month)
-            query = f"""
-            DROP TABLE IF EXISTS {table_name};
-            CREATE TABLE {table_name}(
-                domain_id VARCHAR,
-                domain_name VARCHAR,
-                normalized_url VARCHAR,
-                link VARCHAR,
-                retweeted_id VARCHAR,
-                tweet_id VARCHAR,
-                user_id VARCHAR,
-                local_time TIMESTAMP,
-                );
-            """
-            connection.execute(query)
+            create_monthly_table(connection, table_name, compact_ids)
             progress.update(task_id=task2, advance=1)
 
-        # Start progress bar on task 3: Importing files' data into the database
-        progress.update(
-            task_id=task3, total=len(index_of_files_and_their_months.keys())
+        if not month_files:
+            return
+        files = sorted({f for files in month_files.values() for f in files})
+        update_domain_names(
+            connection, source=f"read_parquet({files})", compact_ids=compact_ids
         )
+
+        # Unless the files' row groups are clustered by time, reading each month's row groups would read
+        # the files about once per month, so the files are read once and their rows routed instead
+        monthly_rows, file_rows = count_monthly_read_rows(connection, month_files)
+        if monthly_rows > file_rows * MAX_MONTHLY_READ_RATIO:
+            progress.update(task_id=task3, total=file_rows)
+            progress.start_task(task_id=task3)
+            route_tweets_by_month(
+                connection=connection,
+                files=files,
+                months=list(month_files),
+                compact_ids=compact_ids,
+                on_batch=lambda nb_rows: progress.update(
+                    task_id=task3, advance=nb_rows
+                ),
+            )
+            return
+
+        # Start progress bar on task 3: Importing the months' files into the database
+        progress.update(task_id=task3, total=len(month_files))
         progress.start_task(task_id=task3)
 
-        # Import tweet data into the table representing the month of the tweet's publication
-        for file, months_in_the_file in index_of_files_and_their_months.items():
-            for month in months_in_the_file:
-                table_name = forge_name_with_date(
-                    prefix="tweets_from", datetime_obj=month
-                )
-                query = f"""
-                INSERT INTO {table_name}
-                SELECT  md5(domain_name),
-                        domain_name,
-                        normalized_url,
-                        link,
-                        retweeted_id,
-                        tweet_id,
-                        user_id,
-                        local_time,
-                FROM (
-                    SELECT  id AS tweet_id,
-                            CAST(local_time AS TIMESTAMP) AS local_time,
-                            user_id,
-                            retweeted_id,
-                            link,
-                            domain AS domain_name,
-                            normalized_url
-                    FROM read_parquet('{file}')
-                )
-                WHERE date_trunc('month', local_time) = '{month}';
-                """
-                connection.execute(query)
+        # Import each month's tweets straight from the files that contain the month. The month is filtered
+        # as a range on the raw column, so that the row groups' min/max statistics, which are narrow in
+        # files sorted by time, let DuckDB skip the row groups of other months
+        for month, files in month_files.items():
+            table_name = forge_name_with_date(prefix="tweets_from", datetime_obj=month)
+            query = insert_tweets_query(
+                table_name=table_name,
+                source=f"read_parquet({files})",
+                where=f"""
+                WHERE local_time >= TIMESTAMP '{month}'
+                AND local_time < TIMESTAMP '{month}' + INTERVAL 1 MONTH""",
+                compact_ids=compact_ids,
+            )
+            connection.execute(query)
             progress.update(task_id=task3, advance=1)
 
 
-def import_youtube_parsed_data(
+def next_month(month: datetime.date) -> datetime.date:
+    """Function to get the first day of the month after the given month."""
+    return (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def count_monthly_read_rows(
+    connection: duckdb.DuckDBPyConnection, month_files: dict
+) -> tuple[int, int]:
+    """Function to count, from the min/max statistics of the files' column "local_time," the rows of the row groups that importing each month with a range filter would read, and the rows of the files.
+
+    A row group without statistics is counted as read for every month of its file.
+    """
+    # Only the files' footers are read, one file at a time
+    row_groups = {}
+    for file in sorted({f for files in month_files.values() for f in files}):
+        query = f"""
+        SELECT  row_group_num_rows,
+                TRY_CAST(stats_min_value AS TIMESTAMP),
+                TRY_CAST(stats_max_value AS TIMESTAMP)
+        FROM parquet_metadata('{file}')
+        WHERE path_in_schema = 'local_time'
+        """
+        row_groups[file] = connection.execute(query).fetchall()
+
+    monthly_rows = 0
+    for month, files in month_files.items():
+        start = datetime.datetime(month.year, month.month, 1)
+        end = datetime.datetime.combine(next_month(start), datetime.time())
+        for file in files:
+            monthly_rows += sum(
+                nb_rows
+                for nb_rows, min_time, max_time in row_groups.get(file, [])
+                if min_time is None
+                or max_time is None
+                or (min_time < end and max_time >= start)
+            )
+    file_rows = sum(
+        nb_rows for groups in row_groups.values() for nb_rows, _, _ in groups
+    )
+    return monthly_rows, file_rows
+
+
+def route_tweets_by_month(
+    connection: duckdb.DuckDBPyConnection,
+    files: list[str],
+    months: list[datetime.date],
+    compact_ids: str = "none",
+    on_batch=None,
+):
+    """Function to read the pre-processed files once and to insert each batch's tweets into the tables of their months.
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): connection to the database
+        files (list[str]): pre-processed parquet files
+        months (list[datetime.date]): months to import, whose tables exist; the tweets of other months are skipped
+        compact_ids (str): way of storing the IDs, one of COMPACT_ID_MODES
+        on_batch (Callable[[int], None], optional): called with the number of rows of every batch that was routed
+    """
+    table_names = {
+        (month.year, month.month): forge_name_with_date(
+            prefix="tweets_from", datetime_obj=month
+        )
+        for month in months
+    }
+    # The files are streamed on a cursor of their own, while the batches are inserted on the connection
+    cursor = connection.cursor()
+    reader = cursor.execute(
+        select_tweets_query(
+            source=f"read_parquet({files})",
+            where=" WHERE local_time IS NOT NULL",
+            compact_ids=compact_ids,
+        )
+    ).fetch_record_batch(ROUTING_BATCH_SIZE)
+    for batch in reader:
+        tweets = pyarrow.Table.from_batches([batch])
+        for key, month_tweets in month_partitions(tweets).items():
+            table_name = table_names.get(key)
+            if table_name is None:
+                continue
+            connection.register("routed_tweets", month_tweets)
+            connection.execute(f"INSERT INTO {table_name} SELECT * FROM routed_tweets;")
+            connection.unregister("routed_tweets")
+        if on_batch:
+            on_batch(batch.num_rows)
+    cursor.close()
+
+
+def discover_month_partitions(
+    preprocessing_dir: Path, input_file_pattern: str
+) -> dict[datetime.date, Path]:
+    """Function to find the months of pre-processed data from its Hive-style "year=/month=" directories."""
+    partitions = {}
+    for directory in Path(preprocessing_dir).glob("year=*/month=*"):
+        if directory.is_dir() and any(directory.glob(input_file_pattern)):
+            year = int(directory.parent.name.split("=")[1])
+            month = int(directory.name.split("=")[1])
+            partitions[datetime.date(year, month, 1)] = directory
+    return dict(sorted(partitions.items()))
+
+
+def insert_partitioned_data(
+    connection: duckdb.DuckDBPyConnection,
+    partitions: dict[datetime.date, Path],
+    input_file_pattern: str,
+    color: str,
+    compact_ids: str = "none",
+    ledger: MonthLedger | None = None,
+):
+    """Function to insert each month's partition of pre-processed parquet files into the table corresponding to that month."""
+
+    msg = f"""
+For each month's partition of pre-processed parquet files, insert the tweets' data into the table corresponding to the month of the tweets' publication.
+    """
+    style_panel(msg=msg, color=color, title="Import data")
+
+    connection.execute("PRAGMA disable_progress_bar")
+    create_domain_names_table(connection, compact_ids)
+
+    # Only import the months that are new or whose pre-processed files have changed
+    if ledger is None:
+        drop_monthly_tables(connection)
+    else:
+        month_files = {
+            month_name(month): list(directory.glob(input_file_pattern))
+            for month, directory in partitions.items()
+        }
+        changed_months = ledger.update(month_files)
+        drop_monthly_tables(connection, months=changed_months + ledger.removed)
+        partitions = {
+            month: directory
+            for month, directory in partitions.items()
+            if month_name(month) in changed_months
+        }
+
+    # ----------------------------------------------------------------------- #
+    # Set up the progress bar
+    ProgressCompleteColumn = Progress(
+        TextColumn("{task.description}"),
+        MofNCompleteColumn(),
+        BarColumn(bar_width=60),
+        TimeElapsedColumn(),
+        expand=True,
+    )
+    with ProgressCompleteColumn as progress:
+        task = progress.add_task(
+            f"{color}Importing monthly partitions...", total=len(partitions)
+        )
+        # ------------------------------------------------------------------ #
+
+        # Bulk-load every file of the month's partition with one query
+        for month, directory in partitions.items():
+            table_name = forge_name_with_date(prefix="tweets_from", datetime_obj=month)
+            create_monthly_table(connection, table_name, compact_ids)
+            files = str(directory.joinpath(input_file_pattern))
+            source = f"read_parquet('{files}', hive_partitioning=1)"
+            update_domain_names(connection, source=source, compact_ids=compact_ids)
+            query = insert_tweets_query(
+                table_name=table_name, source=source, compact_ids=compact_ids
+            )
+            connection.execute(query)
+            progress.update(task_id=task, advance=1)
+
+
+def create_monthly_views(
     connection: duckdb.DuckDBPyConnection,
-    video_infile: Path,
-    channel_infile: Path,
+    preprocessing_dir: Path,
+    input_file_pattern: str,
+    color: str,
+    compact_ids: str = "none",
+    ledger: MonthLedger | None = None,
 ):
-    """Function imports the parsed channel CSV and the video metadata CSV into one table.
+    """Function to create, for every month of the pre-processed data, a view that reads the month's tweets from the pre-processed parquet files in place of a monthly table.
+
+    The views have the columns of the monthly tables, and DuckDB pushes the aggregations'
+    projections and the month's range of publication dates down into the parquet scans, so only
+    the columns and row groups that a query needs are read. The database then only stores the
+    aggregates and, with compact IDs, the table of domain names.
 
     Args:
         connection (duckdb.DuckDBPyConnection): database connection
-        video_infile (Path): path to metadata from called videos
-        channel_infile (Path): path to parsed channel links
+        preprocessing_dir (Path): directory of the pre-processed parquet files
+        input_file_pattern (str): pattern of the pre-processed parquet files' names
+        color (str): color name for rich progress bar
+        compact_ids (str): way of storing the IDs, one of COMPACT_ID_MODES
+        ledger (MonthLedger | None): if given, the months imported by earlier runs, which it compares with the current months
     """
-    exported_db_table_name = "all_youtube_links"
-    import_table_name = "all_parsed_youtube_links"
-    video_file_name = str(video_infile)
-    channel_file_name = str(channel_infile)
-
-    exported_db_table = duckdb.table(exported_db_table_name, connection=connection)
-    columns_names_before_parsing = exported_db_table.columns
-    columns_and_dtypes_before_parsing = ", ".join(
-        [
-            f"{col} {dtype}"
-            for col, dtype in list(
-                zip(columns_names_before_parsing, exported_db_table.dtypes)
+    msg = f"""
+For each month of pre-processed data, create a view that reads the tweets published in that month directly from the pre-processed parquet files, instead of importing them into the database.
+    """
+    style_panel(msg=msg, color=color, title="Query data in place")
+
+    connection.execute("PRAGMA disable_progress_bar")
+    drop_monthly_tables(connection)
+    create_domain_names_table(connection, compact_ids)
+
+    # Find the files of every month, from the Hive-style "year=/month=" directories if the
+    # pre-processed data was partitioned by month, or else by reading the files' publication dates
+    partitions = discover_month_partitions(preprocessing_dir, input_file_pattern)
+    month_files = {
+        month: sorted(directory.glob(input_file_pattern))
+        for month, directory in partitions.items()
+    }
+    parquet_files = sorted(
+        get_filepaths(data_path=preprocessing_dir, file_pattern=input_file_pattern)
+    )
+    if not partitions and parquet_files:
+        files = [str(f.resolve()) for f in parquet_files]
+        query = f"""
+        SELECT DISTINCT filename, date_trunc('month', CAST(local_time AS TIMESTAMP))
+        FROM read_parquet({files}, filename=true);
+        """
+        for file, month in connection.execute(query).fetchall():
+            month_files.setdefault(month, []).append(Path(file))
+        month_files = dict(sorted(month_files.items()))
+    all_files = [f for files in month_files.values() for f in files]
+
+    # The views are created for every month, but the ledger's changed months are the only ones aggregated again
+    if ledger is not None:
+        ledger.update(
+            {month_name(month): files for month, files in month_files.items()}
+        )
+
+    # ----------------------------------------------------------------------- #
+    # Set up the progress bar
+    ProgressCompleteColumn = Progress(
+        TextColumn("{task.description}"),
+        MofNCompleteColumn(),
+        BarColumn(bar_width=60),
+        TimeElapsedColumn(),
+        expand=True,
+    )
+    with ProgressCompleteColumn as progress:
+        task = progress.add_task(
+            f"{color}Creating monthly views...", total=len(month_files)
+        )
+        # ------------------------------------------------------------------ #
+
+        if all_files:
+            files = sorted({str(Path(f).resolve()) for f in all_files})
+            update_domain_names(
+                connection, source=f"read_parquet({files})", compact_ids=compact_ids
             )
+
+        for month, files in month_files.items():
+            view_name = forge_name_with_date(prefix="tweets_from", datetime_obj=month)
+            files = sorted({str(Path(f).resolve()) for f in files})
+            if month in partitions:
+                source = f"read_parquet({files}, hive_partitioning=1)"
+                where = ""
+            else:
+                source = f"read_parquet({files})"
+                where = f"""
+                WHERE local_time >= TIMESTAMP '{month}'
+                AND local_time < TIMESTAMP '{month}' + INTERVAL 1 MONTH"""
+            query = f"""
+            CREATE VIEW {view_name} AS
+            {select_tweets_query(source, where, compact_ids)};
+            """
+            connection.execute(query)
+            progress.update(task_id=task, advance=1)
+
+
+def month_name(month: datetime.date) -> str:
+    """Function to get the name by which a month is known in table names, i.e. "2022_1"."""
+    return extract_month(forge_name_with_date(prefix="tweets_from", datetime_obj=month))
+
+
+def drop_monthly_tables(
+    connection: duckdb.DuckDBPyConnection, months: list[str] | None = None
+):
+    """Function to remove any existing monthly tables, or views in the query-in-place mode, in the database or, if months are given, the tables of those months."""
+    all_tables = connection.execute("SHOW TABLES;").fetchall()
+    monthly_tables = list_tables(all_tables, "tweets_from")
+    if months is not None:
+        monthly_tables = [
+            table for table in monthly_tables if extract_month(table) in months
         ]
-    )
+    views = [
+        view[0]
+        for view in connection.execute(
+            "SELECT view_name FROM duckdb_views();"
+        ).fetchall()
+    ]
+    for table in monthly_tables:
+        kind = "VIEW" if table in views else "TABLE"
+        query = f"""
+        DROP {kind} {table};
+        """
+        connection.execute(query)
 
+
+def create_monthly_table(
+    connection: duckdb.DuckDBPyConnection, table_name: str, compact_ids: str = "none"
+):
+    # With compact IDs, the domain's name is not repeated on every row but kept in the table of domain names
+    if compact_ids == "none":
+        columns = """
+        domain_id VARCHAR,
+        domain_name VARCHAR,
+        normalized_url VARCHAR,
+        link VARCHAR,
+        retweeted_id VARCHAR,
+        tweet_id VARCHAR,
+        user_id VARCHAR,
+        """
+    else:
+        columns = """
+        domain_id UBIGINT,
+        normalized_url VARCHAR,
+        link VARCHAR,
+        retweeted_id UBIGINT,
+        tweet_id UBIGINT,
+        user_id UBIGINT,
+        """
     query = f"""
-    DROP TABLE IF EXISTS {import_table_name};
-    CREATE TABLE {import_table_name}({columns_and_dtypes_before_parsing}, channel_id VARCHAR);
+    DROP TABLE IF EXISTS {table_name};
+    CREATE TABLE {table_name}(
+        {columns}
+        local_time TIMESTAMP,
+        );
+    """
+    connection.execute(query)
+
+
+def insert_tweets_query(
+    table_name: str, source: str, where: str = "", compact_ids: str = "none"
+) -> str:
+    """Function to build the SQL command that inserts pre-processed tweet data from the given source into a monthly table."""
+    return f"""
+    INSERT INTO {table_name}
+    {select_tweets_query(source, where, compact_ids)};
+    """
+
+
+def select_tweets_query(source: str, where: str = "", compact_ids: str = "none") -> str:
+    """Function to build the SQL query that selects pre-processed tweet data from the given source with the columns of a monthly table."""
+    # An original tweet's empty retweeted ID is null in every mode, so that it isn't counted as a retweet
+    tweets = f"""
+        SELECT  id AS tweet_id,
+                CAST(local_time AS TIMESTAMP) AS local_time,
+                user_id,
+                NULLIF(CAST(retweeted_id AS VARCHAR), '') AS retweeted_id,
+                link,
+                domain AS domain_name,
+                normalized_url
+        FROM {source}{where}
+    """
+    # Without compact IDs, the IDs are stored as strings
+    if compact_ids == "none":
+        return f"""
+        SELECT  md5(domain_name) AS domain_id,
+                domain_name,
+                normalized_url,
+                link,
+                CAST(retweeted_id AS VARCHAR) AS retweeted_id,
+                CAST(tweet_id AS VARCHAR) AS tweet_id,
+                CAST(user_id AS VARCHAR) AS user_id,
+                local_time,
+        FROM ({tweets})
+        """
+    # Snowflake IDs fit in 64-bit unsigned integers, and the domain's ID is looked up by its name.
+    # The IDs are cast strictly, so that an ID that isn't numeric fails the import rather than being lost
+    return f"""
+    SELECT  domain_names.domain_id,
+            tweets.normalized_url,
+            tweets.link,
+            CAST(tweets.retweeted_id AS UBIGINT) AS retweeted_id,
+            CAST(tweets.tweet_id AS UBIGINT) AS tweet_id,
+            CAST(tweets.user_id AS UBIGINT) AS user_id,
+            tweets.local_time,
+    FROM ({tweets}) AS tweets
+    LEFT JOIN {domain_names_table(compact_ids)} AS domain_names
+    ON tweets.domain_name = domain_names.domain_name
+    """
+
+
+def domain_names_table(compact_ids: str) -> str:
+    """Function to get the name of the table that gives the name of every domain ID, when the IDs are compact."""
+    if compact_ids == "hash":
+        return "domain_hashes"
+    return "domain_dictionary"
+
+
+def create_domain_names_table(connection: duckdb.DuckDBPyConnection, compact_ids: str):
+    """Function to create, if it doesn't exist, the table of compact domain IDs and their names.
+
+    The table is kept from one import to the next, so that a domain keeps its dense ID and the
+    domains of months imported by earlier runs keep their names.
+    """
+    if compact_ids == "none":
+        return
+    table_name = domain_names_table(compact_ids)
+    query = f"""
+    CREATE TABLE IF NOT EXISTS {table_name}(
+        domain_id UBIGINT,
+        domain_name VARCHAR,
+        );
     """
     connection.execute(query)
 
+
+def update_domain_names(
+    connection: duckdb.DuckDBPyConnection, source: str, compact_ids: str
+):
+    """Function to give a compact ID to every domain name in the given source that doesn't have one yet."""
+    if compact_ids == "none":
+        return
+    table_name = domain_names_table(compact_ids)
+    if compact_ids == "hash":
+        domain_id = "hash(domain_name)"
+    else:
+        domain_id = f"""(SELECT COALESCE(MAX(domain_id), 0) FROM {table_name})
+                + ROW_NUMBER() OVER (ORDER BY domain_name)"""
     query = f"""
-    INSERT INTO {import_table_name}
-    SELECT {", ".join(columns_names_before_parsing)}, channel_id
+    INSERT INTO {table_name}
+    SELECT  {domain_id},
+            domain_name
     FROM (
-        SELECT {", ".join(columns_names_before_parsing+YOUTUBE_VIDEO_CSV_HEADERS)}
-        FROM read_csv('{video_file_name}', AUTO_DETECT=TRUE)
-    )
+        SELECT DISTINCT domain AS domain_name
+        FROM {source}
+        WHERE domain IS NOT NULL
+    ) AS new_domains
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM {table_name}
+        WHERE {table_name}.domain_name = new_domains.domain_name
+    );
     """
     connection.execute(query)
 
+
+def import_youtube_parsed_data(connection: duckdb.DuckDBPyConnection):
+    """Function imports the classified YouTube links with the channel ID of their channel or of their video into one table.
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): database connection
+    """
+    exported_db_table_name = "all_youtube_links"
+    import_table_name = "all_parsed_youtube_links"
+
+    # A channel link has the ID it gives or to which its name was resolved, and a video link the ID
+    # of its video's channel, or none if the API didn't find the video
     query = f"""
-    INSERT INTO {import_table_name}
-    SELECT {", ".join(columns_names_before_parsing)}, channel_id
-    FROM read_csv('{channel_file_name}', AUTO_DETECT=TRUE)
+    DROP TABLE IF EXISTS {import_table_name};
+    CREATE TABLE {import_table_name} AS
+    SELECT links.* EXCLUDE (kind, video_id, channel_id, channel_name),
+        coalesce(links.channel_id, metadata.channel_id) AS channel_id
+    FROM {exported_db_table_name} AS links
+    LEFT JOIN {VIDEO_METADATA_TABLE} AS metadata
+    ON links.video_id = metadata.video_id
+    WHERE links.kind IS NOT NULL;
     """
     connection.execute(query)
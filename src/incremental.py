@@ -0,0 +1,174 @@
+import hashlib
+from pathlib import Path
+
+import duckdb
+
+from aggregate import timeseries_table_name
+from sketches import sketch_table_name
+from utilities import list_tables
+
+# Table in which the database records the months whose aggregates are archived
+MONTH_LEDGER_TABLE = "archived_months"
+
+# Suffix of the working copy of the running totals, which is combined with the new months' aggregates
+RUNNING_TOTAL_SUFFIX = "running_total"
+
+
+def archived_table_name(table_name: str) -> str:
+    return f"archived_{table_name}"
+
+
+def running_table_name(aggregate_table_prefix: str) -> str:
+    return f"running_{aggregate_table_prefix}"
+
+
+def fingerprint_files(files: list[Path]) -> str:
+    """Function to summarise the path, size and modification time of the pre-processed files from which a month is imported."""
+    digest = hashlib.blake2b()
+    for file in sorted(Path(f) for f in files):
+        stat = file.stat()
+        digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+class MonthLedger:
+    """Class to keep track, in the database, of the months whose aggregates are kept from earlier runs and of the pre-processed files they were imported from."""
+
+    def __init__(self, connection: duckdb.DuckDBPyConnection) -> None:
+        self.connection = connection
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {MONTH_LEDGER_TABLE}(
+            month VARCHAR,
+            fingerprint VARCHAR
+            );
+        """
+        self.connection.execute(query)
+        self.recorded = dict(
+            self.connection.execute(
+                f"SELECT month, fingerprint FROM {MONTH_LEDGER_TABLE};"
+            ).fetchall()
+        )
+        self.fingerprints = {}
+        self.changed = []
+        self.removed = []
+
+    def update(self, month_files: dict[str, list[Path]]) -> list[str]:
+        """Method to compare the months in the pre-processed data, and the files they come from, with the recorded months. It returns the months that are new or have changed."""
+        self.fingerprints = {
+            month: fingerprint_files(files) for month, files in month_files.items()
+        }
+        self.changed = sorted(
+            month
+            for month, fingerprint in self.fingerprints.items()
+            if self.recorded.get(month) != fingerprint
+        )
+        self.removed = sorted(
+            month for month in self.recorded if month not in self.fingerprints
+        )
+        return self.changed
+
+    def pending(self) -> dict:
+        """Method to get the months that are waiting to be recorded, so that a resumed run can restore them."""
+        return {
+            "fingerprints": self.fingerprints,
+            "changed": self.changed,
+            "removed": self.removed,
+        }
+
+    def restore(self, pending: dict):
+        """Method to restore the months that an interrupted run imported but didn't record."""
+        self.fingerprints = pending.get("fingerprints", {})
+        self.changed = pending.get("changed", [])
+        self.removed = pending.get("removed", [])
+
+    def record(self):
+        """Method to record the months whose aggregates have been archived and merged into the running totals."""
+        for month in self.changed + self.removed:
+            self.connection.execute(
+                f"DELETE FROM {MONTH_LEDGER_TABLE} WHERE month = ?;", [month]
+            )
+        for month in self.changed:
+            self.connection.execute(
+                f"INSERT INTO {MONTH_LEDGER_TABLE} VALUES (?, ?);",
+                [month, self.fingerprints[month]],
+            )
+        self.recorded = dict(self.fingerprints)
+
+
+def prepare_running_totals(
+    connection: duckdb.DuckDBPyConnection,
+    aggregate_table_prefix: str,
+    ledger: MonthLedger,
+):
+    """Function to archive the aggregates of the months that were just aggregated and to set out the tables that the combining step will merge into new running totals.
+
+    When only new months were added, the running totals of the earlier runs are combined with the
+    new months' aggregates. When a month that was already archived changed or was removed, the
+    running totals are rebuilt from the archived aggregates of every month.
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): database connection
+        aggregate_table_prefix (str): prefix of the monthly aggregate tables
+        ledger (MonthLedger): months that changed or were removed since the last run
+    """
+    all_tables = [table[0] for table in connection.execute("SHOW TABLES;").fetchall()]
+    prefixes = [aggregate_table_prefix, sketch_table_name(aggregate_table_prefix)]
+    running_tables = [running_table_name(prefix) for prefix in prefixes]
+
+    # A running total that already includes one of the months must be rebuilt
+    rebuild = running_tables[0] not in all_tables or any(
+        archived_table_name(f"{prefix}_{month}") in all_tables
+        for prefix in prefixes
+        for month in ledger.changed + ledger.removed
+    )
+
+    # Forget the months that are no longer in the data
+    for prefix in prefixes:
+        for month in ledger.removed:
+            connection.execute(
+                f"DROP TABLE IF EXISTS {archived_table_name(f'{prefix}_{month}')};"
+            )
+    if ledger.removed:
+        months = ", ".join(f"'{month}'" for month in ledger.removed)
+        connection.execute(
+            f"DELETE FROM {timeseries_table_name(aggregate_table_prefix)} WHERE month IN ({months});"
+        )
+
+    # Archive the aggregates of the months that were just aggregated
+    for prefix in prefixes:
+        for month in ledger.changed:
+            table = f"{prefix}_{month}"
+            if table in all_tables:
+                connection.execute(
+                    f"CREATE OR REPLACE TABLE {archived_table_name(table)} AS SELECT * FROM {table};"
+                )
+
+    for prefix, running_table in zip(prefixes, running_tables):
+        if rebuild:
+            # Restore the archived aggregates of the other months next to the new months' aggregates
+            archive_prefix = archived_table_name(f"{prefix}_")
+            for archived_table in list_tables(
+                [(table,) for table in all_tables], archive_prefix
+            ):
+                month = archived_table[len(archive_prefix) :]
+                if month not in ledger.changed + ledger.removed:
+                    connection.execute(
+                        f"CREATE TABLE {prefix}_{month} AS SELECT * FROM {archived_table};"
+                    )
+        elif running_table in all_tables:
+            connection.execute(
+                f"CREATE TABLE {prefix}_{RUNNING_TOTAL_SUFFIX} AS SELECT * FROM {running_table};"
+            )
+
+
+def save_running_totals(
+    connection: duckdb.DuckDBPyConnection, aggregate_table_prefix: str
+):
+    """Function to keep a copy of the combined aggregate table as the running totals of the next run."""
+    all_tables = connection.execute("SHOW TABLES;").fetchall()
+    combined_table = list_tables(all_tables, aggregate_table_prefix)[0]
+    query = f"""
+    CREATE OR REPLACE TABLE {running_table_name(aggregate_table_prefix)} AS
+    SELECT * FROM {combined_table};
+    """
+    connection.execute(query)
@@ -7,18 +7,62 @@ import click
 import duckdb
 from ebbe import Timer
 
-from aggregate import aggregate_tables, recursively_aggregate_tables
-from domains import domain_aggregate_sql, export_domains
-from import_data import import_youtube_parsed_data, insert_processed_data
-from preprocessing import PARSED_URL_FILE_PATTERN, parse_input
-from utilities import SwitchColor
+from aggregate import (
+    COMBINE_ENGINES,
+    aggregate_tables,
+    combine_sketches,
+    combine_tables,
+)
+from domains import domain_aggregate_sql, domain_group_by, export_domains
+from incremental import (
+    MonthLedger,
+    prepare_running_totals,
+    running_table_name,
+    save_running_totals,
+)
+from import_data import (
+    COMPACT_ID_MODES,
+    create_monthly_views,
+    import_youtube_parsed_data,
+    insert_processed_data,
+)
+from metrics import (
+    DEFAULT_RUN_REPORT,
+    RunReport,
+    count_parquet_rows,
+    count_table_rows,
+)
+from parquet_layout import (
+    DEFAULT_ROW_GROUP_SIZE,
+    PARQUET_COMPRESSIONS,
+    ParquetLayout,
+    worker_sort_limits,
+)
+from preprocessing import (
+    PARSED_URL_FILE_PATTERN,
+    PreprocessingOptions,
+    parse_input,
+)
+from profiling import PROFILE_DIR_NAME, ProfiledConnection
+from sketches import sketch_table_name
+from stages import PipelineStages, pipeline_fingerprint
+from url_cache import DEFAULT_URL_CACHE_SIZE
+from utilities import SwitchColor, get_filepaths
+from youtube_api import (
+    DEFAULT_DAILY_QUOTA,
+    DEFAULT_REQUESTS_IN_FLIGHT,
+    YOUTUBE_API_BASE_URL,
+    YouTubeClient,
+)
+from youtube_cache import DEFAULT_VIDEO_PART_TTLS, YOUTUBE_CACHE_FILE_NAME
+from youtube_channel_names import resolve_channel_names
 from youtube_channels import aggregate_channels
 from youtube_links import (
+    classify_youtube_links,
     export_youtube_links,
-    parse_youtube_links,
     youtube_link_aggregate_sql,
 )
-from youtube_videos import call_youtube_videos
+from youtube_videos import VIDEO_METADATA_TABLE, call_youtube_videos
 
 
 @click.command()
@@ -56,7 +100,277 @@ from youtube_videos import call_youtube_videos
     default=False,
     help="This flag skips the steps of parsing the raw twitter data and moves directly to importing pre-processed parquet files into the database for aggregation and further processing.",
 )
-def main(data, glob_file_pattern, key, config_file, skip_pre_processing):
+@click.option(
+    "-w",
+    "--workers",
+    type=click.types.INT,
+    default=1,
+    show_default=True,
+    help="The number of processes in which to pre-process the data files in parallel. The largest files are started first.",
+)
+@click.option(
+    "--streaming",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag fuses the pre-processing steps and streams each data file one block at a time, without writing an intermediate file, so that memory use is bounded by the block size.",
+)
+@click.option(
+    "--block-size",
+    type=click.types.INT,
+    default=16,
+    show_default=True,
+    help="The size, in megabytes, of each block of CSV data read at a time when streaming.",
+)
+@click.option(
+    "--url-cache",
+    type=click.types.Path(dir_okay=False),
+    required=False,
+    help="A SQLite file in which to cache parsed links across files and runs. If not given, parsed links are only cached in memory.",
+)
+@click.option(
+    "--url-cache-size",
+    type=click.types.INT,
+    default=DEFAULT_URL_CACHE_SIZE,
+    show_default=True,
+    help="The maximum number of parsed links that each pre-processing process keeps in memory.",
+)
+@click.option(
+    "--fast-domains",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag computes the links' domain names in bulk with vectorised expressions, leaving to Ural only the URLs that cannot be classified this way.",
+)
+@click.option(
+    "--verify-fast-domains",
+    type=click.types.INT,
+    default=0,
+    show_default=True,
+    help="The number of URLs in each batch on which to check that the fast path gives the same domain names as Ural.",
+)
+@click.option(
+    "--hash-inputs",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag detects changed data files by hashing their contents rather than by comparing their modification times.",
+)
+@click.option(
+    "--parquet-compression",
+    type=click.Choice(PARQUET_COMPRESSIONS),
+    default="zstd",
+    show_default=True,
+    help="The compression codec of the pre-processed parquet files.",
+)
+@click.option(
+    "--row-group-size",
+    type=click.types.INT,
+    default=DEFAULT_ROW_GROUP_SIZE,
+    show_default=True,
+    help="The number of rows in each row group of the pre-processed parquet files.",
+)
+@click.option(
+    "--dictionary-column",
+    multiple=True,
+    required=False,
+    help="A column of the pre-processed parquet files to dictionary-encode (i.e. --dictionary-column domain). This option may be given multiple times. If not given, every column is dictionary-encoded.",
+)
+@click.option(
+    "--sort-by-time/--no-sort-by-time",
+    default=True,
+    show_default=True,
+    help="Whether to sort the rows of each pre-processed parquet file by the tweets' local time, so that each row group covers a narrow range of time and filters on the tweets' month can skip row groups. Sorting writes and reads every file once more, with --streaming too. Each pre-processing worker's sort uses at most its share of --memory-limit (or of 80% of the memory) and of --threads, beyond which it spills to disk.",
+)
+@click.option(
+    "--partition-by-month",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help='This flag writes the pre-processed parquet files in Hive-style "year=/month=" directories, so that each month can be imported at once.',
+)
+@click.option(
+    "--decompression-threads",
+    type=click.types.INT,
+    default=1,
+    show_default=True,
+    help="The number of threads with which each pre-processing process decompresses a data file. Blocked gzip (bgzip) files are decompressed in parallel natively, other gzip files with rapidgzip, and a warning is printed if it isn't installed.",
+)
+@click.option(
+    "--compact-ids",
+    type=click.Choice(COMPACT_ID_MODES),
+    default="none",
+    show_default=True,
+    help='How to store IDs in the database. "hash" stores tweet and user IDs as integers and domain IDs as 64-bit hashes of the domain names; "dictionary" stores domain IDs as dense integers from a table of domain names that is kept in the database. Domain names are joined back to their IDs at export.',
+)
+@click.option(
+    "--approximate-distinct",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag estimates the distinct counts that span several months (links, retweets and accounts) from HyperLogLog sketches that are merged across months, rather than summing each month's exact counts.",
+)
+@click.option(
+    "--combine-engine",
+    type=click.Choice(COMBINE_ENGINES),
+    default="pairwise",
+    show_default=True,
+    help='How to combine the monthly aggregate tables. "pairwise" recursively merges pairs of tables; "single-pass" re-groups all the tables at once with one query over a view that concatenates them.',
+)
+@click.option(
+    "--memory-limit",
+    type=click.types.STRING,
+    required=False,
+    help='The maximum memory that the database may use (i.e. "8GB"), beyond which it writes temporary data to disk. The pre-processing workers\' sorts share it too.',
+)
+@click.option(
+    "--temp-directory",
+    type=click.types.Path(file_okay=False),
+    required=False,
+    help="The directory in which the database writes temporary data when it exceeds its memory limit.",
+)
+@click.option(
+    "--threads",
+    type=click.types.INT,
+    required=False,
+    help="The number of threads that the database may use in total, which the pre-processing workers' sorts share too. If not given, the database uses every core.",
+)
+@click.option(
+    "--concurrent-months",
+    type=click.types.INT,
+    default=1,
+    show_default=True,
+    help="The number of months whose tweet data is aggregated at the same time, each on its own database cursor. The months share the database's threads.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag keeps the database of earlier runs and only imports and aggregates the months that are new or whose pre-processed files have changed, before merging them into the running totals of domains and YouTube links.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag keeps the database of an interrupted run and restarts from the first stage that the run didn't complete. Stages are run again if the pre-processed data or the options have changed since they were completed.",
+)
+@click.option(
+    "--query-in-place",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag skips the import of the pre-processed data into the database. The aggregations read the pre-processed parquet files directly through one view per month, and the database only stores their results.",
+)
+@click.option(
+    "--run-report",
+    type=click.types.Path(dir_okay=False),
+    required=False,
+    help="The NDJSON file to which the metrics of every stage of the run are appended. Defaults to 'output/run_report.ndjson'.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    show_default=False,
+    default=False,
+    help="This flag profiles the run. The plan of every query issued by the import, aggregation and export steps is saved as JSON, and the parsing of links and of YouTube links is profiled with cProfile, in 'output/profiles/', in one directory per stage.",
+)
+@click.option(
+    "--youtube-api-url",
+    type=click.types.STRING,
+    default=YOUTUBE_API_BASE_URL,
+    show_default=True,
+    help="The root of the YouTube Data API, which can be replaced by the address of a local server that imitates it.",
+)
+@click.option(
+    "--youtube-requests-in-flight",
+    type=click.types.INT,
+    default=DEFAULT_REQUESTS_IN_FLIGHT,
+    show_default=True,
+    help="The maximum number of requests sent to the YouTube API at the same time.",
+)
+@click.option(
+    "--youtube-daily-quota",
+    type=click.types.INT,
+    default=DEFAULT_DAILY_QUOTA,
+    show_default=True,
+    help="The units of quota that each YouTube API key may use. Once a key has used them, the next key is used.",
+)
+@click.option(
+    "--youtube-cache",
+    type=click.types.Path(dir_okay=False),
+    required=False,
+    help="DuckDB file in which the metadata of YouTube videos is cached across runs. Defaults to 'output/youtube_cache.duckdb'.",
+)
+@click.option(
+    "--youtube-snippet-ttl",
+    type=click.types.FLOAT,
+    default=DEFAULT_VIDEO_PART_TTLS["snippet"],
+    show_default=True,
+    help="Number of days after which a video's cached title, description, channel and publication date are requested again.",
+)
+@click.option(
+    "--youtube-statistics-ttl",
+    type=click.types.FLOAT,
+    default=DEFAULT_VIDEO_PART_TTLS["statistics"],
+    show_default=True,
+    help="Number of days after which a video's cached view, like and comment counts are requested again.",
+)
+@click.option(
+    "--youtube-details-ttl",
+    type=click.types.FLOAT,
+    default=DEFAULT_VIDEO_PART_TTLS["contentDetails"],
+    show_default=True,
+    help="Number of days after which a video's cached duration and captions are requested again.",
+)
+@click.option(
+    "--youtube-csv/--no-youtube-csv",
+    default=True,
+    show_default=True,
+    help="Whether a CSV copy of each of the YouTube outputs, which are written as Parquet files that keep the columns' types, is also written.",
+)
+def main(
+    data,
+    glob_file_pattern,
+    key,
+    config_file,
+    skip_pre_processing,
+    workers,
+    streaming,
+    block_size,
+    url_cache,
+    url_cache_size,
+    fast_domains,
+    verify_fast_domains,
+    hash_inputs,
+    parquet_compression,
+    row_group_size,
+    dictionary_column,
+    sort_by_time,
+    partition_by_month,
+    decompression_threads,
+    compact_ids,
+    approximate_distinct,
+    combine_engine,
+    memory_limit,
+    temp_directory,
+    threads,
+    concurrent_months,
+    incremental,
+    resume,
+    query_in_place,
+    run_report,
+    profile,
+    youtube_api_url,
+    youtube_requests_in_flight,
+    youtube_daily_quota,
+    youtube_cache,
+    youtube_snippet_ttl,
+    youtube_statistics_ttl,
+    youtube_details_ttl,
+    youtube_csv,
+):
     data_path = Path(data)
 
     # If given, parse the array of youtube API keys
@@ -74,30 +388,79 @@ def main(data, glob_file_pattern, key, config_file, skip_pre_processing):
     preprocessing_directory_path = output_directory_path.joinpath("pre-processing")
     database_name = "twitter_links"
     database_path = output_directory_path.joinpath(f"{database_name}.duckdb")
+    manifest_path = output_directory_path.joinpath("pre-processing_manifest.json")
 
     color = SwitchColor()
+    # The profiles of a previous run are replaced
+    profile_dir = output_directory_path.joinpath(PROFILE_DIR_NAME) if profile else None
+    if profile_dir:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+    # Every stage's wall time, CPU time, memory, rows, I/O and database size are appended to the run report
+    report = RunReport(
+        outfile=Path(run_report)
+        if run_report
+        else output_directory_path.joinpath(DEFAULT_RUN_REPORT),
+        database_path=database_path,
+        options={
+            option: value
+            for option, value in click.get_current_context().params.items()
+            if option not in ["key", "config_file"]
+        },
+    )
 
     # ------------------------------------------------------------------------ #
     # Step 1. Isolate and parse URLs from raw twitter data
 
-    # If the directory "output/pre-processing/" doesn't already have each input
-    # file's URLs de-concatenated and parsed with Ural, clear out the "output/"
-    # directory and run parse_input() on the data file(s)
+    # Unless skipped, run parse_input() on the data file(s) that the manifest
+    # next to the directory "output/pre-processing/" shows are new or have changed
+    # since they were last pre-processed, and, unless incremental, start from a new database
     if not skip_pre_processing:
-        shutil.rmtree(output_dir_name, ignore_errors=True)
-        output_directory_path.mkdir(exist_ok=True)
-        preprocessing_directory_path.mkdir()
+        preprocessing_directory_path.mkdir(parents=True, exist_ok=True)
+        if not incremental and not resume:
+            database_path.unlink(missing_ok=True)
 
-        with Timer(
+        # Each worker sorts its files with its share of the database's memory and threads
+        sort_memory_limit, sort_threads = worker_sort_limits(
+            memory_limit=memory_limit, threads=threads, workers=workers
+        )
+        with report.stage("pre_processing") as stage, Timer(
             name="---->total time to pre-process data",
             file=sys.stdout,
             precision="nanoseconds",
         ):
-            parse_input(
+            stage.rows_in = parse_input(
                 input_data_path=data_path,
                 input_file_pattern=glob_file_pattern,
                 output_dir=preprocessing_directory_path,
                 color=color.set(),
+                workers=workers,
+                options=PreprocessingOptions(
+                    streaming=streaming,
+                    block_size=block_size * 1024 * 1024,
+                    url_cache_size=url_cache_size,
+                    url_cache_path=Path(url_cache) if url_cache else None,
+                    fast_domains=fast_domains,
+                    verify_sample=verify_fast_domains,
+                    layout=ParquetLayout(
+                        compression=parquet_compression,
+                        row_group_size=row_group_size,
+                        dictionary_columns=list(dictionary_column) or None,
+                        sort_by_time=sort_by_time,
+                        sort_memory_limit=sort_memory_limit,
+                        sort_threads=sort_threads,
+                    ),
+                    partition_by_month=partition_by_month,
+                    decompression_threads=decompression_threads,
+                    profile_dir=profile_dir.joinpath("parse_links")
+                    if profile_dir
+                    else None,
+                ),
+                manifest_path=manifest_path,
+                hash_inputs=hash_inputs,
+            )
+            stage.rows_out = count_parquet_rows(
+                parsed_url_files(preprocessing_directory_path)
             )
         print("")
     if skip_pre_processing and not preprocessing_directory_path.exists():
@@ -107,162 +470,336 @@ def main(data, glob_file_pattern, key, config_file, skip_pre_processing):
     # Step 2. Import the parsed URL twitter data into the database
 
     db_connection = duckdb.connect(str(database_path), read_only=False)
+    if memory_limit:
+        db_connection.execute(f"SET memory_limit='{memory_limit}';")
+    if temp_directory:
+        db_connection.execute(f"SET temp_directory='{temp_directory}';")
+    if threads:
+        db_connection.execute(f"SET threads={threads};")
 
-    with Timer(
-        name="---->total time to import pre-processed data",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        insert_processed_data(
+    # When profiling, every query of the import, aggregation and export steps saves its plan under the current stage
+    if profile_dir:
+        db_connection = ProfiledConnection(
             connection=db_connection,
-            preprocessing_dir=preprocessing_directory_path,
-            input_file_pattern=PARSED_URL_FILE_PATTERN,
-            color=color.set(),
+            output_dir=profile_dir,
+            stage=lambda: report.current_stage or "other",
         )
-        print("")
+
+    # The database records the stages completed with the current pre-processed data and options,
+    # from the first incomplete one of which a resumed run restarts
+    stages = PipelineStages(
+        connection=db_connection,
+        fingerprint=pipeline_fingerprint(
+            files=parsed_url_files(preprocessing_directory_path),
+            options={
+                "compact_ids": compact_ids,
+                "approximate_distinct": approximate_distinct,
+                "incremental": incremental,
+                "query_in_place": query_in_place,
+                "youtube_keys": bool(youtube_keys),
+            },
+        ),
+        resume=resume,
+    )
+
+    # In the incremental mode, the database keeps track of the months imported by earlier runs
+    ledger = MonthLedger(db_connection) if incremental else None
+
+    if stages.should_run("import"):
+        with report.stage("import") as stage, Timer(
+            name="---->total time to import pre-processed data",
+            file=sys.stdout,
+            precision="nanoseconds",
+        ):
+            # In the query-in-place mode, the monthly tables are replaced by views over the parquet files
+            import_data = (
+                create_monthly_views if query_in_place else insert_processed_data
+            )
+            import_data(
+                connection=db_connection,
+                preprocessing_dir=preprocessing_directory_path,
+                input_file_pattern=PARSED_URL_FILE_PATTERN,
+                color=color.set(),
+                compact_ids=compact_ids,
+                ledger=ledger,
+            )
+            stage.rows_in = count_parquet_rows(
+                parsed_url_files(preprocessing_directory_path)
+            )
+            stage.rows_out = count_table_rows(db_connection, "tweets_from")
+            print("")
+        stages.complete("import", state=ledger.pending() if ledger else None)
+    elif ledger:
+        ledger.restore(stages.state("import"))
+    months = ledger.changed if ledger else None
 
     # ------------------------------------------------------------------------ #
     # Step 3. Group the twitter data by the parsed domain name of each URL
 
-    with Timer(
-        name="---->total time to aggregate domains for each month",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        aggregate_tables(
-            connection=db_connection,
-            color=color.set(),
-            target_table_prefix="domains_in",
-            sql=domain_aggregate_sql(),
-        )
-    print("")
-
-    with Timer(
-        name="---->total time to sum all aggregated domains",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        recursively_aggregate_tables(
-            connection=db_connection,
-            targeted_table_prefix="domains_in",
-            group_by=["domain_id", "domain_name"],
-            color=color.set(),
-            any_value=[],
-        )
-    print("")
+    domain_sql = domain_aggregate_sql(compact_ids, approximate_distinct)
+    domains_path_obj = output_directory_path.joinpath("domains.csv")
+
+    if stages.should_run("domains", outputs=[domains_path_obj]):
+        with report.stage("aggregate_domains") as stage, Timer(
+            name="---->total time to aggregate domains for each month",
+            file=sys.stdout,
+            precision="nanoseconds",
+        ):
+            stage.rows_in = count_table_rows(db_connection, "tweets_from")
+            aggregate_tables(
+                connection=db_connection,
+                color=color.set(),
+                target_table_prefix="domains_in",
+                sql=domain_sql,
+                concurrent_months=concurrent_months,
+                months=months,
+            )
+            stage.rows_out = count_table_rows(db_connection, "domains_in")
+        print("")
+
+        with report.stage("combine_domains") as stage, Timer(
+            name="---->total time to sum all aggregated domains",
+            file=sys.stdout,
+            precision="nanoseconds",
+        ):
+            if ledger:
+                prepare_running_totals(db_connection, "domains_in", ledger)
+            stage.rows_in = count_table_rows(db_connection, "domains_in")
+            combine_tables(
+                connection=db_connection,
+                targeted_table_prefix="domains_in",
+                group_by=domain_group_by(compact_ids),
+                color=color.set(),
+                any_value=[],
+                engine=combine_engine,
+            )
+            combine_sketches(
+                connection=db_connection,
+                targeted_table_prefix="domains_in",
+                sql=domain_sql,
+                color=color.set(),
+                engine=combine_engine,
+                keep_as=running_table_name(sketch_table_name("domains_in"))
+                if ledger
+                else None,
+            )
+            if ledger:
+                save_running_totals(db_connection, "domains_in")
+            stage.rows_out = count_table_rows(db_connection, "domains_in")
+        print("")
 
-    with Timer(
-        name="---->total time to export aggregated domains",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        outfile_path_obj = output_directory_path.joinpath("domains.csv")
-        export_domains(connection=db_connection, outfile=str(outfile_path_obj))
+        with report.stage("export_domains") as stage, Timer(
+            name="---->total time to export aggregated domains",
+            file=sys.stdout,
+            precision="nanoseconds",
+        ):
+            stage.rows_in = count_table_rows(db_connection, "domains_in")
+            export_domains(
+                connection=db_connection,
+                outfile=str(domains_path_obj),
+                compact_ids=compact_ids,
+            )
+            stage.rows_out = count_table_rows(db_connection, "all_domains")
+        stages.complete("domains")
 
     # ------------------------------------------------------------------------ #
     # Step 4. Group together all the YouTube links
 
     youtube_dir = output_directory_path.joinpath("youtube")
-    shutil.rmtree(youtube_dir, ignore_errors=True)
-    youtube_dir.mkdir()
-    youtube_links_path_obj = youtube_dir.joinpath("youtube_links.csv")
-    youtube_parsed_channel_ids_path_obj = youtube_dir.joinpath(
-        "youtube_channel_ids.csv"
-    )
-    youtube_videos_path_obj = youtube_dir.joinpath("youtube_videos.csv")
-    youtube_videos_metadata_path_obj = youtube_dir.joinpath(
-        "youtube_video_metadata.csv"
+    if not resume:
+        shutil.rmtree(youtube_dir, ignore_errors=True)
+    youtube_dir.mkdir(exist_ok=True)
+    youtube_links_path_obj = youtube_dir.joinpath("youtube_links.parquet")
+    youtube_video_metadata_path_obj = youtube_dir.joinpath(
+        "youtube_video_metadata.parquet"
     )
     aggregated_youtube_channels_path_obj = youtube_dir.joinpath(
-        "aggregated_youtube_channels.csv"
+        "aggregated_youtube_channels.parquet"
     )
 
-    with Timer(
-        name="---->total time to aggregate YouTube links for each month",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        aggregate_tables(
-            connection=db_connection,
-            color=color.set(),
-            target_table_prefix="youtube_links",
-            sql=youtube_link_aggregate_sql(),
-        )
-    print("")
-
-    with Timer(
-        name="---->total time to sum all aggregated YouTube links",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        recursively_aggregate_tables(
-            connection=db_connection,
-            targeted_table_prefix="youtube_links",
-            group_by=["normalized_url"],
-            any_value=["link_for_scraping"],
-            color=color.set(),
-        )
-    print("")
-
-    with Timer(
-        name="---->total time to export aggregated YouTube links",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        export_youtube_links(
-            connection=db_connection, outfile=str(youtube_links_path_obj)
-        )
-    print("")
-
-    with Timer(
-        name="---->total time to get every links' channel ID",
-        file=sys.stdout,
-        precision="nanoseconds",
-    ):
-        parse_youtube_links(
-            infile=youtube_links_path_obj,
-            channel_outfile=youtube_parsed_channel_ids_path_obj,
-            video_outfile=youtube_videos_path_obj,
-        )
-
-    # ------------------------------------------------------------------------ #
-    # Step 4. Get channel data
+    # If asked, each Parquet file of the YouTube outputs also gets a CSV copy next to it
+    def youtube_csv_path(path: Path) -> Path | None:
+        return path.with_suffix(".csv") if youtube_csv else None
 
-    if youtube_keys:
-        with Timer(
-            name="---->total time to parse YouTube links",
+    youtube_link_sql = youtube_link_aggregate_sql(compact_ids, approximate_distinct)
+    if stages.should_run("youtube_links", outputs=[youtube_links_path_obj]):
+        with report.stage("aggregate_youtube_links") as stage, Timer(
+            name="---->total time to aggregate YouTube links for each month",
             file=sys.stdout,
             precision="nanoseconds",
         ):
-            call_youtube_videos(
-                infile=youtube_videos_path_obj,
-                outfile=youtube_videos_metadata_path_obj,
-                keys=youtube_keys,
+            stage.rows_in = count_table_rows(db_connection, "tweets_from")
+            aggregate_tables(
+                connection=db_connection,
+                color=color.set(),
+                target_table_prefix="youtube_links",
+                sql=youtube_link_sql,
+                concurrent_months=concurrent_months,
+                months=months,
             )
+            stage.rows_out = count_table_rows(db_connection, "youtube_links")
+        print("")
 
-        with Timer(
-            name="---->total time to import parsed YouTube link data",
+        with report.stage("combine_youtube_links") as stage, Timer(
+            name="---->total time to sum all aggregated YouTube links",
             file=sys.stdout,
             precision="nanoseconds",
         ):
-            import_youtube_parsed_data(
+            if ledger:
+                prepare_running_totals(db_connection, "youtube_links", ledger)
+            stage.rows_in = count_table_rows(db_connection, "youtube_links")
+            combine_tables(
                 connection=db_connection,
-                video_infile=youtube_videos_metadata_path_obj,
-                channel_infile=youtube_parsed_channel_ids_path_obj,
+                targeted_table_prefix="youtube_links",
+                group_by=["normalized_url"],
+                any_value=["link_for_scraping"],
+                color=color.set(),
+                engine=combine_engine,
             )
+            combine_sketches(
+                connection=db_connection,
+                targeted_table_prefix="youtube_links",
+                sql=youtube_link_sql,
+                color=color.set(),
+                engine=combine_engine,
+                keep_as=running_table_name(sketch_table_name("youtube_links"))
+                if ledger
+                else None,
+            )
+            if ledger:
+                save_running_totals(db_connection, "youtube_links")
+            stage.rows_out = count_table_rows(db_connection, "youtube_links")
         print("")
 
-        with Timer(
-            name="---->total time to aggregate YouTube channels",
+        with report.stage("export_youtube_links") as stage, Timer(
+            name="---->total time to export aggregated YouTube links",
             file=sys.stdout,
             precision="nanoseconds",
         ):
-            aggregate_channels(
+            stage.rows_in = count_table_rows(db_connection, "youtube_links")
+            export_youtube_links(
                 connection=db_connection,
-                outfile=aggregated_youtube_channels_path_obj,
+                outfile=youtube_links_path_obj,
+                csv_outfile=youtube_csv_path(youtube_links_path_obj),
             )
+            stage.rows_out = count_table_rows(db_connection, "all_youtube_links")
+
+        with report.stage("classify_youtube_links") as stage, Timer(
+            name="---->total time to classify YouTube links",
+            file=sys.stdout,
+            precision="nanoseconds",
+        ):
+            stage.rows_in = count_table_rows(db_connection, "all_youtube_links")
+            classify_youtube_links(connection=db_connection)
+            stage.rows_out = stage.rows_in
+
+        # Now that the new months are merged into the running totals, record them
+        if ledger:
+            ledger.record()
+        stages.complete("youtube_links")
         print("")
 
+    # ------------------------------------------------------------------------ #
+    # Step 4. Get channel data
+
+    if youtube_keys:
+        # The YouTube API's responses are cached across runs, next to the database
+        youtube_cache_path = (
+            Path(youtube_cache)
+            if youtube_cache
+            else output_directory_path.joinpath(YOUTUBE_CACHE_FILE_NAME)
+        )
+        # Both stages share one key ring, so that a key's quota and refusal hold across them
+        youtube_client = YouTubeClient(
+            keys=youtube_keys,
+            base_url=youtube_api_url,
+            requests_in_flight=youtube_requests_in_flight,
+            daily_quota=youtube_daily_quota,
+        )
+        if stages.should_run(
+            "youtube_videos", outputs=[youtube_video_metadata_path_obj]
+        ):
+            with report.stage("youtube_videos") as stage, Timer(
+                name="---->total time to parse YouTube links",
+                file=sys.stdout,
+                precision="nanoseconds",
+            ):
+                call_youtube_videos(
+                    connection=db_connection,
+                    client=youtube_client,
+                    color=color.set(),
+                    cache_path=youtube_cache_path,
+                    outfile=youtube_video_metadata_path_obj,
+                    csv_outfile=youtube_csv_path(youtube_video_metadata_path_obj),
+                    ttls={
+                        "snippet": youtube_snippet_ttl,
+                        "statistics": youtube_statistics_ttl,
+                        "contentDetails": youtube_details_ttl,
+                    },
+                )
+                stage.rows_in = count_table_rows(db_connection, "all_youtube_links")
+                stage.rows_out = count_table_rows(db_connection, VIDEO_METADATA_TABLE)
+            stages.complete("youtube_videos")
+
+        if stages.should_run("resolve_youtube_channel_names"):
+            with report.stage("resolve_youtube_channel_names") as stage, Timer(
+                name="---->total time to resolve YouTube channel names",
+                file=sys.stdout,
+                precision="nanoseconds",
+            ):
+                resolve_channel_names(
+                    connection=db_connection,
+                    client=youtube_client,
+                    color=color.set(),
+                    cache_path=youtube_cache_path,
+                )
+                stage.rows_in = count_table_rows(db_connection, "all_youtube_links")
+                stage.rows_out = stage.rows_in
+            stages.complete("resolve_youtube_channel_names")
+
+        if stages.should_run("import_youtube_data"):
+            with report.stage("import_youtube_data") as stage, Timer(
+                name="---->total time to import parsed YouTube link data",
+                file=sys.stdout,
+                precision="nanoseconds",
+            ):
+                import_youtube_parsed_data(connection=db_connection)
+                stage.rows_in = count_table_rows(db_connection, "all_youtube_links")
+                stage.rows_out = count_table_rows(
+                    db_connection, "all_parsed_youtube_links"
+                )
+            print("")
+            stages.complete("import_youtube_data")
+
+        if stages.should_run(
+            "youtube_channels", outputs=[aggregated_youtube_channels_path_obj]
+        ):
+            with report.stage("aggregate_youtube_channels") as stage, Timer(
+                name="---->total time to aggregate YouTube channels",
+                file=sys.stdout,
+                precision="nanoseconds",
+            ):
+                stage.rows_in = count_table_rows(
+                    db_connection, "all_parsed_youtube_links"
+                )
+                aggregate_channels(
+                    connection=db_connection,
+                    outfile=aggregated_youtube_channels_path_obj,
+                    csv_outfile=youtube_csv_path(aggregated_youtube_channels_path_obj),
+                )
+                stage.rows_out = count_parquet_rows(
+                    [aggregated_youtube_channels_path_obj]
+                )
+            print("")
+            stages.complete("youtube_channels")
+
+
+def parsed_url_files(preprocessing_dir: Path) -> list[Path]:
+    """Function to get the pre-processed parquet files, including those of monthly partitions."""
+    return get_filepaths(
+        data_path=preprocessing_dir, file_pattern=f"**/{PARSED_URL_FILE_PATTERN}"
+    )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+from pathlib import Path
+
+# Size of the chunks read at a time when hashing an input file's contents
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def fingerprint_file(infile: Path, hash_contents: bool = False) -> dict:
+    """Function to describe the state of an input file with its size and either its modification time or a hash of its contents."""
+    stat = infile.stat()
+    fingerprint = {"size": stat.st_size}
+    if hash_contents:
+        digest = hashlib.blake2b()
+        with open(infile, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        fingerprint["hash"] = digest.hexdigest()
+    else:
+        fingerprint["mtime"] = stat.st_mtime_ns
+    return fingerprint
+
+
+class PreprocessingManifest:
+    """Class to record, for every pre-processed input file, the file's fingerprint, the version of the code that processed it, and the output files derived from it."""
+
+    def __init__(self, path: Path, code_version: str) -> None:
+        self.path = path
+        self.code_version = code_version
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.entries = json.load(fp=f)
+
+    def is_current(self, infile: Path, fingerprint: dict) -> bool:
+        """Method to check whether the input file was already pre-processed, in its current state and by the current code, and whether its outputs still exist."""
+        entry = self.entries.get(str(infile))
+        if entry is None:
+            return False
+        return (
+            entry["fingerprint"] == fingerprint
+            and entry["code_version"] == self.code_version
+            and all(Path(outfile).exists() for outfile in entry["outputs"])
+        )
+
+    def record(self, infile: Path, fingerprint: dict, outputs: list[Path]):
+        # Delete the outputs that a previous version of the file had and the current version doesn't
+        previous_entry = self.entries.get(str(infile), {"outputs": []})
+        current_outputs = {str(outfile) for outfile in outputs}
+        for outfile in previous_entry["outputs"]:
+            if outfile not in current_outputs:
+                Path(outfile).unlink(missing_ok=True)
+        self.entries[str(infile)] = {
+            "fingerprint": fingerprint,
+            "code_version": self.code_version,
+            "outputs": [str(outfile) for outfile in outputs if outfile.exists()],
+        }
+        self.save()
+
+    def remove_missing_inputs(self, infiles: list[Path]) -> list[str]:
+        """Method to forget the input files that are no longer targeted and delete their outputs. It returns the forgotten input files."""
+        current = {str(infile) for infile in infiles}
+        missing = [infile for infile in self.entries if infile not in current]
+        for infile in missing:
+            for outfile in self.entries[infile]["outputs"]:
+                Path(outfile).unlink(missing_ok=True)
+            del self.entries[infile]
+        self.save()
+        return missing
+
+    def outputs(self) -> list[Path]:
+        return [
+            Path(outfile)
+            for entry in self.entries.values()
+            for outfile in entry["outputs"]
+        ]
+
+    def save(self):
+        # Write to a temporary file first so that an interrupted run never leaves a truncated manifest
+        temporary_path = self.path.with_suffix(".tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(self.entries, fp=f, indent=2)
+        temporary_path.replace(self.path)
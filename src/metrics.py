@@ -0,0 +1,170 @@
+import datetime
+import json
+import resource
+import time
+import uuid
+from pathlib import Path
+
+import casanova
+import duckdb
+import pyarrow.parquet
+
+from utilities import list_tables
+
+# File, in the output directory, to which every run appends the metrics of its stages
+DEFAULT_RUN_REPORT = "run_report.ndjson"
+
+
+def read_io_counters() -> dict[str, int | None]:
+    """Function to get the number of bytes that the process, if the system reports them in "/proc/self/io," and its finished child processes have read from and written to storage."""
+    counters = {"read_bytes": None, "write_bytes": None}
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                key, value = line.split(":")
+                if key in counters:
+                    counters[key] = int(value)
+    except OSError:
+        pass
+    # The I/O of child processes, like the workers of the pre-processing, is only reported in their
+    # resource usage, in blocks of 512 bytes, once they have finished
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if counters["read_bytes"] is not None:
+        counters["read_bytes"] += 512 * children.ru_inblock
+    if counters["write_bytes"] is not None:
+        counters["write_bytes"] += 512 * children.ru_oublock
+    return counters
+
+
+def cpu_time() -> float:
+    """Function to get the CPU time, in seconds, that the process and its finished child processes have spent in user and system mode."""
+    return sum(
+        usage.ru_utime + usage.ru_stime
+        for usage in (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        )
+    )
+
+
+def peak_rss() -> int:
+    """Function to get the highest resident set size, in bytes, that the process or any of its finished child processes has reached since the run started. It is a high-water mark, so it can't go down from one stage to the next."""
+    # On Linux, the maximum resident set size is given in kilobytes
+    return 1024 * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def count_table_rows(connection: duckdb.DuckDBPyConnection, prefix: str) -> int:
+    """Function to count the rows of every table in the database whose name starts with the prefix. Views are not counted, because counting them would scan the files they read."""
+    views = [
+        view[0]
+        for view in connection.execute(
+            "SELECT view_name FROM duckdb_views();"
+        ).fetchall()
+    ]
+    all_tables = connection.execute("SHOW TABLES;").fetchall()
+    tables = [table for table in list_tables(all_tables, prefix) if table not in views]
+    return sum(
+        connection.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+        for table in tables
+    )
+
+
+def count_parquet_rows(files: list[Path]) -> int:
+    """Function to count the rows of parquet files from their metadata."""
+    return sum(pyarrow.parquet.ParquetFile(file).metadata.num_rows for file in files)
+
+
+def count_csv_rows(file: Path) -> int | None:
+    """Function to count the rows of a CSV file, if it exists."""
+    if not Path(file).exists():
+        return None
+    return casanova.reader.count(str(file))
+
+
+class StageMetrics:
+    """Class to measure the resources that a stage of the pipeline uses, between entering and exiting its context, and to append them to the run report.
+
+    The rows that the stage reads and writes are counted by the caller, who sets the attributes
+    "rows_in" and "rows_out." CPU time and I/O include the child processes that finished during
+    the stage, like the workers of the pre-processing. The peak resident set size is the run's
+    high-water mark up to the end of the stage, not the stage's own.
+    """
+
+    def __init__(self, report: "RunReport", stage: str) -> None:
+        self.report = report
+        self.stage = stage
+        self.rows_in = None
+        self.rows_out = None
+
+    def __enter__(self) -> "StageMetrics":
+        self.report.current_stage = self.stage
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self.io_start = read_io_counters()
+        self.cpu_start = cpu_time()
+        self.wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.report.current_stage = None
+        wall_seconds = time.perf_counter() - self.wall_start
+        cpu_seconds = cpu_time() - self.cpu_start
+        io_end = read_io_counters()
+        io = {
+            key: io_end[key] - self.io_start[key]
+            if io_end[key] is not None and self.io_start[key] is not None
+            else None
+            for key in io_end
+        }
+        self.report.write(
+            {
+                "stage": self.stage,
+                "status": "failed" if exc_type else "completed",
+                "started_at": self.started_at,
+                "wall_seconds": round(wall_seconds, 6),
+                "cpu_seconds": round(cpu_seconds, 6),
+                "cumulative_peak_rss_bytes": peak_rss(),
+                "rows_in": self.rows_in,
+                "rows_out": self.rows_out,
+                "bytes_read": io["read_bytes"],
+                "bytes_written": io["write_bytes"],
+                "database_bytes": self.report.database_size(),
+            }
+        )
+
+
+class RunReport:
+    """Class to append the metrics of every stage of a run, one JSON object per line, to a report that keeps the history of earlier runs."""
+
+    def __init__(self, outfile: Path, database_path: Path, options: dict) -> None:
+        self.outfile = Path(outfile)
+        self.database_path = Path(database_path)
+        self.run_id = uuid.uuid4().hex
+        # Stage being measured, by which other instruments, like the profiler, can key their outputs
+        self.current_stage = None
+        self.write({"stage": "run", "options": options})
+
+    def stage(self, stage: str) -> StageMetrics:
+        """Method to get the context in which a stage's metrics are measured."""
+        return StageMetrics(self, stage)
+
+    def database_size(self) -> int | None:
+        """Method to get the size, in bytes, of the database file and of its write-ahead log."""
+        if not self.database_path.exists():
+            return None
+        wal = Path(f"{self.database_path}.wal")
+        return self.database_path.stat().st_size + (
+            wal.stat().st_size if wal.exists() else 0
+        )
+
+    def write(self, record: dict):
+        self.outfile.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            "run_id": self.run_id,
+            "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            **record,
+        }
+        with open(self.outfile, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
@@ -0,0 +1,279 @@
+import os
+import re
+import shutil
+from pathlib import Path
+
+import duckdb
+import polars
+import pyarrow
+import pyarrow.parquet
+
+# Compression codecs that can be given to the parquet writer
+PARQUET_COMPRESSIONS = ["zstd", "lz4", "snappy", "gzip", "none"]
+
+# Default number of rows in each row group of the pre-processed parquet files
+DEFAULT_ROW_GROUP_SIZE = 500_000
+
+# Share of the physical memory that DuckDB may use by default, which the workers' sorts divide between them when no memory limit is given
+DEFAULT_MEMORY_SHARE = 0.8
+
+# Number of bytes in each unit of a memory limit, as DuckDB reads them
+MEMORY_LIMIT_UNITS = {
+    "": 1,
+    "b": 1,
+    "bytes": 1,
+    "k": 10**3,
+    "kb": 10**3,
+    "m": 10**6,
+    "mb": 10**6,
+    "g": 10**9,
+    "gb": 10**9,
+    "t": 10**12,
+    "tb": 10**12,
+}
+
+
+class ParquetLayout:
+    """Class to hold the settings that determine how pre-processed data is laid out in parquet files.
+
+    Sorting a file's rows on the column "local_time" clusters each row group on a narrow range of
+    time, so that the min/max statistics written for every row group let DuckDB skip the row groups
+    that a filter on the tweets' month doesn't need. The sort's memory limit and threads, if given,
+    bound the DuckDB connection that sorts each file, beyond which it spills to disk.
+    """
+
+    def __init__(
+        self,
+        compression: str = "zstd",
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+        dictionary_columns: list[str] | None = None,
+        sort_by_time: bool = True,
+        sort_memory_limit: str | None = None,
+        sort_threads: int | None = None,
+    ) -> None:
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.dictionary_columns = dictionary_columns
+        self.sort_by_time = sort_by_time
+        self.sort_memory_limit = sort_memory_limit
+        self.sort_threads = sort_threads
+
+    def writer_options(self) -> dict:
+        """Method to get the keyword arguments for pyarrow's parquet writer."""
+        return {
+            "compression": self.compression,
+            "use_dictionary": self.dictionary_columns
+            if self.dictionary_columns is not None
+            else True,
+            "write_statistics": True,
+        }
+
+    def describe(self) -> str:
+        """Method to summarise the layout, so that a change of layout can be detected."""
+        dictionary = ",".join(self.dictionary_columns or ["all"])
+        return f"{self.compression}-{self.row_group_size}-{dictionary}-sorted:{self.sort_by_time}"
+
+
+class ParquetBatchWriter:
+    """Class to append tables to a parquet file according to a layout, in row groups of exactly the layout's number of rows, except for the last one.
+
+    When the layout sorts rows by time, the rows are first appended to a temporary file next to the
+    out-file. Once the writer is closed, the temporary file is sorted as a whole on the column
+    "local_time" by DuckDB, which spills to disk rather than holding the file in memory, and its
+    rows are written to the out-file.
+    """
+
+    def __init__(self, outfile: Path, layout: ParquetLayout) -> None:
+        self.outfile = outfile
+        self.layout = layout
+        self.unsorted_outfile = outfile.with_name(f".unsorted_{outfile.name}")
+        self.sort = False
+        self.writer = None
+        self.schema = None
+        self.buffer = []
+        self.buffered_rows = 0
+
+    def write(self, table: pyarrow.Table):
+        if self.writer is None:
+            self.sort = self.layout.sort_by_time and "local_time" in table.column_names
+            self.schema = table.schema
+            self.writer = pyarrow.parquet.ParquetWriter(
+                self.unsorted_outfile if self.sort else self.outfile,
+                self.schema,
+                **self.layout.writer_options(),
+            )
+        self.append(table)
+
+    def append(self, table: pyarrow.Table):
+        """Method to add the table's rows to the buffer and to write every full row group."""
+        self.buffer.append(table.cast(self.schema))
+        self.buffered_rows += table.num_rows
+        while self.buffered_rows >= self.layout.row_group_size:
+            self.flush(self.layout.row_group_size)
+
+    def flush(self, nb_rows: int):
+        """Method to write the first rows of the buffer as one row group and to keep the rest of the rows in the buffer."""
+        table = pyarrow.concat_tables(self.buffer)
+        self.writer.write_table(table.slice(0, nb_rows), row_group_size=nb_rows)
+        remainder = table.slice(nb_rows)
+        self.buffer = [remainder] if remainder.num_rows else []
+        self.buffered_rows = remainder.num_rows
+
+    def close(self):
+        if self.writer is None:
+            return
+        if self.buffered_rows:
+            self.flush(self.buffered_rows)
+        self.writer.close()
+        if self.sort:
+            self.sort_by_time()
+
+    def sort_by_time(self):
+        """Method to write the rows of the temporary file to the out-file, sorted on the column "local_time," and to delete the temporary file."""
+        temp_directory = self.outfile.with_name(f".sort_{self.outfile.stem}")
+        connection = duckdb.connect()
+        connection.execute(f"SET temp_directory='{temp_directory}';")
+        if self.layout.sort_memory_limit:
+            connection.execute(f"SET memory_limit='{self.layout.sort_memory_limit}';")
+        if self.layout.sort_threads:
+            connection.execute(f"SET threads={self.layout.sort_threads};")
+        reader = connection.execute(
+            f"""
+            SELECT *
+            FROM read_parquet('{self.unsorted_outfile}')
+            ORDER BY local_time
+            """
+        ).fetch_record_batch(self.layout.row_group_size)
+        self.writer = pyarrow.parquet.ParquetWriter(
+            self.outfile, self.schema, **self.layout.writer_options()
+        )
+        for batch in reader:
+            # DuckDB reads the columns that pyarrow wrote with the null type as integers
+            columns = [
+                pyarrow.nulls(batch.num_rows)
+                if field.type == pyarrow.null()
+                else batch.column(field.name)
+                for field in self.schema
+            ]
+            self.append(pyarrow.Table.from_arrays(columns, names=self.schema.names))
+        if self.buffered_rows:
+            self.flush(self.buffered_rows)
+        self.writer.close()
+        connection.close()
+        self.unsorted_outfile.unlink(missing_ok=True)
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+    def outputs(self) -> list[Path]:
+        if self.writer is None:
+            return []
+        return [self.outfile]
+
+
+def parse_memory_limit(memory_limit: str) -> int:
+    """Function to get the number of bytes of a memory limit written as DuckDB reads it (i.e. "8GB")."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", memory_limit)
+    unit = match.group(2).lower() if match else None
+    if unit not in MEMORY_LIMIT_UNITS:
+        raise ValueError(
+            f'The memory limit "{memory_limit}" is not a number of bytes, KB, MB, GB or TB (i.e. "8GB").'
+        )
+    return int(float(match.group(1)) * MEMORY_LIMIT_UNITS[unit])
+
+
+def worker_sort_limits(
+    memory_limit: str | None, threads: int | None, workers: int
+) -> tuple[str | None, int]:
+    """Function to divide the memory and the threads that the database may use between the pre-processing workers, for the sorts of their files.
+
+    Args:
+        memory_limit (str | None): memory limit of the database, or, if not given, DuckDB's default share of the physical memory
+        threads (int | None): number of threads of the database, or, if not given, the number of cores
+        workers (int): number of processes that pre-process data files at the same time
+
+    Returns:
+        tuple[str | None, int]: memory limit and number of threads of each worker's sort
+    """
+    workers = max(workers, 1)
+    if memory_limit:
+        budget = parse_memory_limit(memory_limit)
+    else:
+        try:
+            budget = int(
+                os.sysconf("SC_PAGE_SIZE")
+                * os.sysconf("SC_PHYS_PAGES")
+                * DEFAULT_MEMORY_SHARE
+            )
+        except (AttributeError, ValueError, OSError):
+            budget = None
+    sort_memory_limit = f"{budget // workers}B" if budget else None
+    sort_threads = max(1, (threads or os.cpu_count() or 1) // workers)
+    return sort_memory_limit, sort_threads
+
+
+def month_partitions(table: pyarrow.Table) -> dict[tuple[int, int], pyarrow.Table]:
+    """Function to split a table according to the year and the month of its column "local_time." Rows without a time are dropped."""
+    dataframe = polars.from_arrow(table)
+    local_time = polars.col("local_time")
+    if dataframe.schema["local_time"] == polars.Utf8:
+        local_time = local_time.str.strptime(polars.Datetime, strict=False)
+    dataframe = dataframe.with_columns(
+        [
+            local_time.dt.year().alias("year"),
+            local_time.dt.month().alias("month"),
+        ]
+    ).drop_nulls(["year", "month"])
+    partitions = {}
+    for partition in dataframe.partition_by(["year", "month"]):
+        key = (partition["year"][0], partition["month"][0])
+        partitions[key] = partition.drop(["year", "month"]).to_arrow()
+    return partitions
+
+
+def partition_directory(output_dir: Path, year: int, month: int) -> Path:
+    """Function to get the Hive-style directory of a month's partition."""
+    return output_dir.joinpath(f"year={year}", f"month={month}")
+
+
+class PartitionedParquetWriter:
+    """Class to append tables to parquet files partitioned, in Hive-style "year=/month=" directories, by the month of the tweets.
+
+    Every month has its own writer, but the rows buffered across all of them are capped at the
+    layout's number of rows in a row group, as a single file's writer would be, by writing out the
+    largest buffers first.
+    """
+
+    def __init__(self, output_dir: Path, filename: str, layout: ParquetLayout) -> None:
+        self.output_dir = output_dir
+        self.filename = filename
+        self.layout = layout
+        self.writers = {}
+
+    def write(self, table: pyarrow.Table):
+        for (year, month), partition in month_partitions(table).items():
+            writer = self.writers.get((year, month))
+            if writer is None:
+                directory = partition_directory(self.output_dir, year, month)
+                directory.mkdir(parents=True, exist_ok=True)
+                writer = ParquetBatchWriter(
+                    directory.joinpath(self.filename), self.layout
+                )
+                self.writers[(year, month)] = writer
+            writer.write(partition)
+
+        while (
+            sum(writer.buffered_rows for writer in self.writers.values())
+            > self.layout.row_group_size
+        ):
+            largest = max(
+                self.writers.values(), key=lambda writer: writer.buffered_rows
+            )
+            largest.flush(largest.buffered_rows)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def outputs(self) -> list[Path]:
+        return [
+            output for writer in self.writers.values() for output in writer.outputs()
+        ]
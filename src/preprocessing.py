@@ -1,12 +1,15 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
+from typing import Callable
 
 import duckdb
 import polars
 import pyarrow
 import pyarrow.csv
-import pyarrow.parquet
 import ural
 import ural.youtube
+from rich import print as rich_print
 from rich.progress import (
     MofNCompleteColumn,
     Progress,
@@ -15,6 +18,16 @@ from rich.progress import (
     TimeElapsedColumn,
 )
 
+from decompression import open_input, single_threaded_files
+from fast_domains import attribute_domains, verify_fast_path
+from manifest import PreprocessingManifest, fingerprint_file
+from parquet_layout import (
+    ParquetBatchWriter,
+    ParquetLayout,
+    PartitionedParquetWriter,
+)
+from profiling import PythonProfile
+from url_cache import DEFAULT_URL_CACHE_SIZE, ParsedURLCache, ural_version
 from utilities import FileNaming, get_filepaths, style_panel
 
 # Columns to be selected from raw Twitter file
@@ -30,10 +43,76 @@ FINAL_PREPROCESSING_COLUMNS = UNALTERED_COLUMNS + ["link", "domain"]
 PARSED_URL_PREFIX = "parsed_urls"
 PARSED_URL_FILE_PATTERN = PARSED_URL_PREFIX + "*.parquet"
 
+# Version of the pre-processed files' format, to be changed whenever the pre-processing code changes its output
+PREPROCESSING_VERSION = "2"
+
+# Descriptions of the pre-processing steps, shown in the progress bar
+PREPROCESSING_STEPS = [
+    "Step 1. select columns",
+    "Step 2. de-concatenate links",
+    "Step 3. parse links",
+    "Done",
+]
+STREAMING_STEPS = [
+    "Steps 1-3. stream, de-concatenate and parse links",
+    "Done",
+]
+
+# Default size (in bytes) of the blocks of CSV data read at a time by the streaming engine
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Maximum number of mismatches between the fast path and Ural to report
+MAX_REPORTED_MISMATCHES = 10
+
+# Parser of links, whose cache is shared by every file pre-processed in the same process
+link_parser = None
+
+
+class PreprocessingOptions:
+    """Class to hold the settings that determine how each data file is pre-processed."""
+
+    def __init__(
+        self,
+        streaming: bool = False,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        url_cache_size: int = DEFAULT_URL_CACHE_SIZE,
+        url_cache_path: Path | None = None,
+        fast_domains: bool = False,
+        verify_sample: int = 0,
+        layout: ParquetLayout | None = None,
+        partition_by_month: bool = False,
+        decompression_threads: int = 1,
+        profile_dir: Path | None = None,
+    ) -> None:
+        self.streaming = streaming
+        self.block_size = block_size
+        self.url_cache_size = url_cache_size
+        self.url_cache_path = url_cache_path
+        self.fast_domains = fast_domains
+        self.verify_sample = verify_sample
+        if layout is None:
+            layout = ParquetLayout()
+        self.layout = layout
+        self.partition_by_month = partition_by_month
+        self.decompression_threads = decompression_threads
+        # If given, the directory in which the parsing of each file's links is profiled
+        self.profile_dir = profile_dir
+        if self.streaming:
+            self.steps = STREAMING_STEPS
+        else:
+            self.steps = PREPROCESSING_STEPS
+
 
 def parse_input(
-    input_data_path: Path, input_file_pattern: str, output_dir: Path, color: str
-):
+    input_data_path: Path,
+    input_file_pattern: str,
+    output_dir: Path,
+    color: str,
+    workers: int = 1,
+    options: PreprocessingOptions | None = None,
+    manifest_path: Path | None = None,
+    hash_inputs: bool = False,
+) -> int:
     """
     Iterating over each file captured by the input file pattern, this function manages the 3 steps of pre-processing:
 
@@ -42,7 +121,22 @@ def parse_input(
         (2) De-concatenate and unnest the URLs in the "links" column.
 
         (3) Parse the isolated URLs with Ural, generating new columns for the domain name and the normalized version of each URL.
+
+    If more than 1 worker is given, the files are pre-processed in a pool of processes, starting with the largest files.
+
+    With the streaming option, the 3 steps are fused and applied to one block of the CSV file at a time, without writing an intermediate file.
+
+    Every distinct link is parsed once per batch, and parsed links are memoised in a cache that lasts across files and, if given a path, across runs.
+
+    With the fast domains option, domain names are computed in bulk with polars expressions and only the URLs the fast path cannot classify are given to Ural.
+
+    If given a manifest, only the files that are new or have changed since they were last pre-processed are processed, and the outputs of files that are no longer targeted are removed. The number of rows read from the pre-processed data files is returned.
     """
+    if options is None:
+        options = PreprocessingOptions()
+    partitioning = ""
+    if options.partition_by_month:
+        partitioning = ', in "year=/month=" directories'
 
     msg = f"""
 Iterating over each targeted data file:
@@ -50,13 +144,46 @@ Iterating over each targeted data file:
   (2) De-concatenate and unnest the URLs in the "links" column.
   (3) Parse the isolated URLs with Ural, generating new columns for the domain name and the normalized version of each URL.
 
-The resulting parsed data are written to compressed parquet files in the directory "{str(output_dir)}" with the prefix "{PARSED_URL_PREFIX}".
+The resulting parsed data are written to compressed parquet files in the directory "{str(output_dir)}" with the prefix "{PARSED_URL_PREFIX}"{partitioning}.
     """
     style_panel(msg=msg, color=color, title="Pre-process data")
 
     # Using the file path pattern, get an array of files to process
     files = get_filepaths(input_data_path, input_file_pattern)
 
+    # Skip the files that the manifest shows were already pre-processed in their current state
+    fingerprints = {}
+    manifest = None
+    if manifest_path:
+        manifest = PreprocessingManifest(
+            manifest_path, code_version=preprocessing_code_version(options)
+        )
+        removed_files = manifest.remove_missing_inputs(files)
+        fingerprints = {
+            infile: fingerprint_file(infile, hash_contents=hash_inputs)
+            for infile in files
+        }
+        up_to_date_files = [
+            infile
+            for infile in files
+            if manifest.is_current(infile, fingerprints[infile])
+        ]
+        files = [infile for infile in files if infile not in up_to_date_files]
+        rich_print(
+            f"{color}{len(files)} new or changed files to pre-process, {len(up_to_date_files)} files up to date, {len(removed_files)} removed files"
+        )
+
+    # Parallel decompression of ordinary gzip files depends on rapidgzip, without which it silently wouldn't happen
+    single_threaded = single_threaded_files(files, options.decompression_threads)
+    if single_threaded:
+        rich_print(
+            f"[bold red]rapidgzip isn't installed, so {len(single_threaded)} gzip file(s) will be decompressed on a single thread instead of {options.decompression_threads}. Install it with 'pip install rapidgzip' or compress the files with bgzip."
+        )
+
+    def record(infile: Path, outputs: list[Path]):
+        if manifest:
+            manifest.record(infile, fingerprints[infile], outputs)
+
     # ----------------------------------------------------------------------- #
     # Set up the progress bar
     with Progress(
@@ -65,63 +192,290 @@ The resulting parsed data are written to compressed parquet files in the directo
         MofNCompleteColumn(),
         TimeElapsedColumn(),
     ) as progress:
-        total = total = len(files)
+        total = len(files)
         file_task = progress.add_task(
             description=f"{color}Processing files...", total=total, start=True
         )
-        for n, infile in enumerate(files):
-            name_file = FileNaming(output_dir, infile)
-
-            step1 = progress.add_task(
-                description=f"[yellow]    Step 1. select columns...",
-                total=total,
-                start=False,
-            )
-            progress.update(task_id=step1, completed=n)
-            step2 = progress.add_task(
-                description=f"[yellow]    Step 2. de-concatenate links...",
-                total=total,
-                start=False,
+        stats = {}
+        if workers > 1:
+            stats = preprocess_files_in_pool(
+                files=files,
+                output_dir=output_dir,
+                workers=workers,
+                progress=progress,
+                file_task=file_task,
+                options=options,
+                record=record,
             )
-            progress.update(task_id=step2, completed=n)
-            step3 = progress.add_task(
-                description=f"[yellow]    Step 3. parse links...",
-                total=total,
-                start=False,
+        else:
+            for infile in files:
+                file_progress = FileProgress(progress, infile, options.steps)
+                _, outputs, file_stats = preprocess_file(
+                    infile, output_dir, options=options, report=file_progress.update
+                )
+                record(infile, outputs)
+                add_stats(stats, file_stats)
+                file_progress.remove()
+
+                # Before moving to next file, update progress bar
+                progress.update(task_id=file_task, advance=1)
+
+    report_parsing_stats(stats, color)
+    return stats.get("rows", 0)
+
+
+def preprocessing_code_version(options: PreprocessingOptions) -> str:
+    """Function to identify the code that pre-processes the files, including the version of Ural on which the parsed links depend and the layout of the parquet files."""
+    return f"{PREPROCESSING_VERSION}/ural-{ural_version()}/{options.layout.describe()}/partitioned:{options.partition_by_month}"
+
+
+class FileProgress:
+    """Class to show, in a rich progress bar, which pre-processing step a file has reached."""
+
+    def __init__(self, progress: Progress, infile: Path, steps: list[str]) -> None:
+        self.progress = progress
+        self.name = Path(infile).name
+        self.steps = steps
+        self.task = progress.add_task(
+            description=f"[yellow]    {self.name}",
+            total=len(self.steps) - 1,
+            start=True,
+        )
+
+    def update(self, step: int) -> None:
+        self.progress.update(
+            task_id=self.task,
+            completed=step,
+            description=f"[yellow]    {self.name}: {self.steps[step]}...",
+        )
+
+    def remove(self) -> None:
+        self.progress.remove_task(task_id=self.task)
+
+
+class QueueReport:
+    """Class to send a worker's progress on a file back to the main process through a shared queue."""
+
+    def __init__(self, queue, infile: Path) -> None:
+        self.queue = queue
+        self.infile = str(infile)
+
+    def __call__(self, step: int) -> None:
+        self.queue.put((self.infile, step))
+
+
+def schedule_files(files: list[Path]) -> list[Path]:
+    """Function to order files from largest to smallest, so that the longest jobs are started first and don't finish last on a single worker."""
+    return sorted(files, key=lambda f: f.stat().st_size, reverse=True)
+
+
+def add_stats(total: dict, file_stats: dict):
+    for key, value in file_stats.items():
+        if isinstance(value, list):
+            total[key] = (total.get(key, []) + value)[:MAX_REPORTED_MISMATCHES]
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def report_parsing_stats(stats: dict, color: str):
+    """Function to print how many parsed links were found in the cache and, if the fast path was verified, how many of its domain names differed from Ural's."""
+    hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+    rate = 100 * hits / (hits + misses) if hits + misses else 0
+    rich_print(
+        f"{color}Parsed link cache: {hits} hits, {misses} misses ({rate:.1f}% hit rate)"
+    )
+    if stats.get("verified"):
+        rich_print(
+            f"{color}Domain fast path: {stats['nb_mismatches']} mismatches with Ural in a sample of {stats['verified']} URLs"
+        )
+        for url, fast_domain, ural_domain in stats.get("mismatches", []):
+            rich_print(f"[red]    {url}: {fast_domain} != {ural_domain}")
+
+
+def preprocess_files_in_pool(
+    files: list[Path],
+    output_dir: Path,
+    workers: int,
+    progress: Progress,
+    file_task,
+    options: PreprocessingOptions,
+    record: Callable,
+):
+    """Function to pre-process files in a pool of processes while reporting every worker's progress in the main process's progress bar."""
+    file_progresses = {}
+    stats = {}
+    # Polars's thread pool does not survive being forked, so the workers are spawned
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, ProcessPoolExecutor(
+        max_workers=workers, mp_context=context
+    ) as executor:
+        queue = manager.Queue()
+        futures = [
+            executor.submit(
+                preprocess_file,
+                infile,
+                output_dir,
+                options,
+                QueueReport(queue, infile),
             )
-            progress.update(task_id=step3, completed=n)
-            # -------------------------------------------------------------- #
-
-            # Select relevant columns from CSV file
-            task = step1
-            progress.start_task(task_id=task)
-            selected_columns_outfile = name_file.parquet("selected_columns")
-            select_columns(infile, selected_columns_outfile)
-            progress.stop_task(task_id=task)
-            progress.update(task_id=task, completed=n + 1)
-
-            # De-concatenate URLs in "links" column
-            task = step2
-            progress.start_task(task_id=task)
-            deconcatenate_links_dataframe = deconcatenate_links(
-                selected_columns_outfile
+            for infile in schedule_files(files)
+        ]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+
+            # Show the steps the workers have reached since the last check
+            while not queue.empty():
+                infile, step = queue.get()
+                if infile not in file_progresses:
+                    file_progresses[infile] = FileProgress(
+                        progress, infile, options.steps
+                    )
+                file_progresses[infile].update(step)
+
+            for future in done:
+                # Raise any exception met in the worker
+                infile, outputs, file_stats = future.result()
+                record(infile, outputs)
+                add_stats(stats, file_stats)
+                file_progress = file_progresses.pop(str(infile), None)
+                if file_progress:
+                    file_progress.remove()
+                progress.update(task_id=file_task, advance=1)
+    return stats
+
+
+class LinkParser:
+    """Class to parse links with Ural while memoising the results in a cache and, optionally, computing domain names with the vectorised fast path."""
+
+    def __init__(
+        self,
+        cache: ParsedURLCache | None = None,
+        fast_domains: bool = False,
+        verify_sample: int = 0,
+    ) -> None:
+        if cache is None:
+            cache = ParsedURLCache()
+        self.cache = cache
+        self.fast_domains = fast_domains
+        self.verify_sample = verify_sample
+        self.verified = 0
+        self.nb_mismatches = 0
+        self.mismatches = []
+
+    def parse(self, links: list[str]) -> dict:
+        """Method to get the (normalized URL, domain name) of distinct links, parsing only the links missing from the cache."""
+        found, missing = self.cache.lookup(links)
+        if self.fast_domains:
+            normalized_urls = [ural.normalize_url(link) for link in missing]
+            domains = attribute_domains(normalized_urls, fallback=attribute_domain)
+            parsed_links = dict(zip(missing, zip(normalized_urls, domains)))
+            if self.verify_sample:
+                self.verify(normalized_urls)
+        else:
+            parsed_links = {link: parse_url(link) for link in missing}
+        self.cache.store(parsed_links)
+        found.update(parsed_links)
+        return found
+
+    def verify(self, normalized_urls: list[str]):
+        mismatches = verify_fast_path(
+            normalized_urls, reference=attribute_domain, sample_size=self.verify_sample
+        )
+        self.verified += min(self.verify_sample, len(normalized_urls))
+        self.nb_mismatches += len(mismatches)
+        self.mismatches = (self.mismatches + mismatches)[:MAX_REPORTED_MISMATCHES]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "verified": self.verified,
+            "nb_mismatches": self.nb_mismatches,
+        }
+
+
+def get_link_parser(options: PreprocessingOptions) -> LinkParser:
+    """Function to get the process's parser of links, creating it on first use."""
+    global link_parser
+    if link_parser is None:
+        link_parser = LinkParser(
+            cache=ParsedURLCache(
+                maxsize=options.url_cache_size, path=options.url_cache_path
+            ),
+            fast_domains=options.fast_domains,
+            verify_sample=options.verify_sample,
+        )
+    return link_parser
+
+
+def preprocess_file(
+    infile: Path,
+    output_dir: Path,
+    options: PreprocessingOptions,
+    report: Callable | None = None,
+):
+    """Function to run the 3 steps of pre-processing on one file, calling "report" with the index of each step as it starts. It returns the file, its output files, and statistics on the parsing of its links."""
+    if report is None:
+        report = lambda step: None
+    name_file = FileNaming(output_dir, infile)
+    parsed_urls_outfile = name_file.parquet(PARSED_URL_PREFIX)
+    if options.partition_by_month:
+        writer = PartitionedParquetWriter(
+            output_dir, parsed_urls_outfile.name, options.layout
+        )
+    else:
+        writer = ParquetBatchWriter(parsed_urls_outfile, options.layout)
+    parser = get_link_parser(options)
+    stats_before = parser.stats()
+    mismatches_before = len(parser.mismatches)
+    profile_outfile = (
+        options.profile_dir.joinpath(f"{name_file.forge_name('parse_links')}.prof")
+        if options.profile_dir
+        else None
+    )
+
+    if options.streaming:
+        report(0)
+        with PythonProfile(profile_outfile):
+            rows = stream_links(
+                infile,
+                writer,
+                parser=parser,
+                block_size=options.block_size,
+                decompression_threads=options.decompression_threads,
             )
-            progress.stop_task(task_id=task)
-            progress.update(task_id=task, completed=n + 1)
+        report(1)
+    else:
+        # Select relevant columns from CSV file
+        report(0)
+        selected_columns_outfile = name_file.parquet("selected_columns")
+        rows = select_columns(
+            infile,
+            selected_columns_outfile,
+            layout=options.layout,
+            decompression_threads=options.decompression_threads,
+        )
+
+        # De-concatenate URLs in "links" column
+        report(1)
+        deconcatenate_links_dataframe = deconcatenate_links(selected_columns_outfile)
+        # The intermediate file isn't recorded in the manifest, so delete it once its links are in memory
+        selected_columns_outfile.unlink(missing_ok=True)
 
-            # Parse links
-            task = step3
-            progress.start_task(task_id=task)
-            parsed_urls_outfile = name_file.parquet(PARSED_URL_PREFIX)
-            parse_links(deconcatenate_links_dataframe, parsed_urls_outfile)
-            progress.stop_task(task_id=task)
-            progress.update(task_id=task, completed=n + 1)
+        # Parse links
+        report(2)
+        with PythonProfile(profile_outfile):
+            parse_links(deconcatenate_links_dataframe, writer, parser=parser)
+        report(3)
+    writer.close()
 
-            # Before moving to next file, update progress bar
-            progress.update(task_id=file_task, advance=1)
-            progress.remove_task(task_id=step1)
-            progress.remove_task(task_id=step2)
-            progress.remove_task(task_id=step3)
+    file_stats = {
+        key: value - stats_before[key] for key, value in parser.stats().items()
+    }
+    file_stats["mismatches"] = parser.mismatches[mismatches_before:]
+    file_stats["rows"] = rows
+    return infile, writer.outputs(), file_stats
 
 
 def configure_pyarrow(columns):
@@ -134,23 +488,38 @@ def configure_pyarrow(columns):
     return convert_options, parser_options
 
 
-def select_columns(infile: Path, outfile: Path, columns: list = SELECT_COLUMNS):
-    """Step 1 in pre-processing. This function streams a CSV file and writes certain columns to a parquet file."""
-    infile_path_name = str(infile)
+def select_columns(
+    infile: Path,
+    outfile: Path,
+    columns: list = SELECT_COLUMNS,
+    layout: ParquetLayout | None = None,
+    decompression_threads: int = 1,
+):
+    """Step 1 in pre-processing. This function streams a CSV file and writes certain columns to a parquet file. It returns the number of rows read."""
+    if layout is None:
+        layout = ParquetLayout()
+    # The selected columns are only read once, by the next step, so they're written in the layout's row groups but not sorted
+    writer = ParquetBatchWriter(
+        outfile,
+        ParquetLayout(
+            compression=layout.compression,
+            row_group_size=layout.row_group_size,
+            dictionary_columns=layout.dictionary_columns,
+            sort_by_time=False,
+        ),
+    )
     convert_options, parser_options = configure_pyarrow(columns)
-    writer = None
-    with pyarrow.csv.open_csv(
-        infile_path_name, convert_options=convert_options, parse_options=parser_options
+    rows = 0
+    with open_input(infile, decompression_threads) as stream, pyarrow.csv.open_csv(
+        stream, convert_options=convert_options, parse_options=parser_options
     ) as reader:
         for next_chunk in reader:
             if next_chunk is None:
                 break
-            if writer is None:
-                writer = pyarrow.parquet.ParquetWriter(outfile, next_chunk.schema)
-            next_table = pyarrow.Table.from_batches([next_chunk])
-            writer.write_table(next_table)
-    if writer:
-        writer.close()
+            rows += next_chunk.num_rows
+            writer.write(pyarrow.Table.from_batches([next_chunk]))
+    writer.close()
+    return rows
 
 
 def deconcatenate_links(infile: Path) -> polars.DataFrame:
@@ -179,15 +548,87 @@ def attribute_domain(normalized_url: str):
     return domain
 
 
-def parse_links(in_dataframe: polars.DataFrame, outfile: Path):
-    """Step 3 in pre-processing. This function parses the dataframe's URL data and adds columns with a normalized URL and domain name."""
-    df_with_normalized_url = in_dataframe.with_columns(
-        [
-            polars.col("link").apply(ural.normalize_url).alias("normalized_url"),
-        ]
+def parse_url(link: str) -> tuple[str, str | None]:
+    """Function to get the normalized version and the domain name of a link."""
+    normalized_url = ural.normalize_url(link)
+    return normalized_url, attribute_domain(normalized_url)
+
+
+def parse_links(
+    in_dataframe: polars.DataFrame,
+    writer: ParquetBatchWriter | PartitionedParquetWriter,
+    parser: LinkParser | None = None,
+):
+    """Step 3 in pre-processing. This function parses the dataframe's URL data, adds columns with a normalized URL and domain name, and gives the result to the parquet writer."""
+    writer.write(parse_link_dataframe(in_dataframe, parser).to_arrow())
+
+
+def parse_link_dataframe(
+    in_dataframe: polars.DataFrame, parser: LinkParser | None = None
+) -> polars.DataFrame:
+    """Function to add columns with the normalized URL and the domain name of each link in the dataframe.
+
+    Because the same links are shared many times, every distinct link is only parsed once: links are
+    looked up in the cache, the missing ones are parsed with Ural, and the results are joined back to the rows.
+    """
+    if parser is None:
+        parser = LinkParser()
+    distinct_links = in_dataframe.get_column("link").drop_nulls().unique().to_list()
+    found = parser.parse(distinct_links)
+
+    parsed_dataframe = polars.DataFrame(
+        {
+            "link": list(found.keys()),
+            "normalized_url": [value[0] for value in found.values()],
+            "domain": [value[1] for value in found.values()],
+        },
+        schema={
+            "link": polars.Utf8,
+            "normalized_url": polars.Utf8,
+            "domain": polars.Utf8,
+        },
     )
-    df_with_normalized_url.with_columns(
-        [
-            polars.col("normalized_url").apply(attribute_domain).alias("domain"),
-        ]
-    ).write_parquet(file=outfile, compression="gzip")
+    return in_dataframe.with_columns([polars.col("link").cast(polars.Utf8)]).join(
+        parsed_dataframe, on="link", how="left"
+    )
+
+
+def deconcatenate_batch(batch: pyarrow.RecordBatch) -> polars.DataFrame:
+    """Function to de-concatenate the URLs in one record batch's column "links," which are separated by a |."""
+    return (
+        polars.from_arrow(pyarrow.Table.from_batches([batch]))
+        .with_columns([polars.col("links").cast(polars.Utf8)])
+        .filter(polars.col("links").str.n_chars() > 1)
+        .with_columns([polars.col("links").str.split("|").alias("link")])
+        .explode("link")
+        .select(UNALTERED_COLUMNS + ["link"])
+    )
+
+
+def stream_links(
+    infile: Path,
+    writer: ParquetBatchWriter | PartitionedParquetWriter,
+    parser: LinkParser | None = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    columns: list = SELECT_COLUMNS,
+    decompression_threads: int = 1,
+):
+    """Steps 1 to 3 in pre-processing, fused. This function streams a CSV file one record batch at a time and, for each batch, selects the relevant columns, de-concatenates and parses the links, and gives the result to the parquet writer. Because no intermediate file is written and only one batch and one row group are held at a time, memory use depends on the block size and the row group size rather than on the size of the file. It returns the number of rows read."""
+    convert_options, parser_options = configure_pyarrow(columns)
+    rows = 0
+    read_options = pyarrow.csv.ReadOptions(block_size=block_size)
+    with open_input(infile, decompression_threads) as stream, pyarrow.csv.open_csv(
+        stream,
+        read_options=read_options,
+        convert_options=convert_options,
+        parse_options=parser_options,
+    ) as reader:
+        for next_chunk in reader:
+            if next_chunk is None:
+                break
+            rows += next_chunk.num_rows
+            links_dataframe = deconcatenate_batch(next_chunk)
+            if links_dataframe.is_empty():
+                continue
+            writer.write(parse_link_dataframe(links_dataframe, parser).to_arrow())
+    return rows
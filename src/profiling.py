@@ -0,0 +1,113 @@
+import cProfile
+import io
+import itertools
+import pstats
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Callable
+
+import duckdb
+
+# Directory, in the output directory, in which the profiles are written
+PROFILE_DIR_NAME = "profiles"
+
+# Modules whose queries are profiled
+PROFILED_MODULES = ["aggregate", "import_data", "domains", "youtube_links"]
+
+# Number of functions listed in the text summary of a Python profile
+PROFILE_SUMMARY_LENGTH = 40
+
+
+def query_label(query: str) -> str:
+    """Function to label a query by its last statement's command and the first table it names, i.e. "insert_domains_in_2022_1"."""
+    statements = [s for s in query.split(";") if s.strip()]
+    words = re.findall(r"[A-Za-z_][A-Za-z0-9_]*", statements[-1] if statements else "")
+    if not words:
+        return "query"
+    command = words[0].lower()
+    keywords = {"table", "view", "into", "from", "exists", "replace", "or", "if", "not"}
+    target = next(
+        (
+            word
+            for word in words[1:]
+            if word.lower() not in keywords and not word.isupper()
+        ),
+        "",
+    )
+    return f"{command}_{target}".strip("_")
+
+
+class ProfiledConnection:
+    """Class to wrap a database connection so that DuckDB profiles every query issued from the profiled modules and writes its plan, as JSON, to the directory of the current stage.
+
+    Other queries, and the connection's other methods, are passed on to the database as they are.
+    The cursors of a profiled connection are profiled too, and share its numbering of the plans.
+    """
+
+    def __init__(
+        self,
+        connection: duckdb.DuckDBPyConnection,
+        output_dir: Path,
+        stage: Callable[[], str],
+        counter: itertools.count | None = None,
+    ) -> None:
+        self.connection = connection
+        self.output_dir = Path(output_dir)
+        self.stage = stage
+        self.counter = counter or itertools.count(1)
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        return getattr(self.connection, name)
+
+    def cursor(self) -> "ProfiledConnection":
+        return ProfiledConnection(
+            self.connection.cursor(), self.output_dir, self.stage, self.counter
+        )
+
+    def execute(self, query: str, *args, **kwargs):
+        # DuckDB writes a query's plan once its result is closed, when the next statement is run, so
+        # profiling is only switched on or off, and the plan's file chosen, before each query
+        caller = sys._getframe(1).f_code
+        module = Path(caller.co_filename).stem
+        if module not in PROFILED_MODULES:
+            self.connection.execute("PRAGMA disable_profiling;")
+            return self.connection.execute(query, *args, **kwargs)
+
+        with self.lock:
+            number = next(self.counter)
+        stage_dir = self.output_dir.joinpath(self.stage())
+        stage_dir.mkdir(parents=True, exist_ok=True)
+        outfile = stage_dir.joinpath(
+            f"{number:05d}_{module}.{caller.co_name}_{query_label(query)}.json"
+        )
+        self.connection.execute("PRAGMA enable_profiling='json';")
+        self.connection.execute(f"PRAGMA profiling_output='{outfile}';")
+        return self.connection.execute(query, *args, **kwargs)
+
+
+class PythonProfile:
+    """Class to profile the Python code run in its context with cProfile, and to write the statistics and a text summary of the most time-consuming functions next to each other."""
+
+    def __init__(self, outfile: Path | None) -> None:
+        self.outfile = Path(outfile) if outfile else None
+        self.profile = cProfile.Profile()
+
+    def __enter__(self) -> "PythonProfile":
+        if self.outfile:
+            self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if not self.outfile:
+            return
+        self.profile.disable()
+        self.outfile.parent.mkdir(parents=True, exist_ok=True)
+        self.profile.dump_stats(self.outfile)
+        summary = io.StringIO()
+        pstats.Stats(self.profile, stream=summary).sort_stats("cumulative").print_stats(
+            PROFILE_SUMMARY_LENGTH
+        )
+        self.outfile.with_suffix(".txt").write_text(summary.getvalue())
@@ -0,0 +1,86 @@
+import math
+
+# Number of bits of a value's hash that choose one of the sketch's registers
+HLL_PRECISION = 14
+
+# Number of registers in each HyperLogLog sketch
+HLL_REGISTERS = 2**HLL_PRECISION
+
+# Number of bits of a value's hash that remain once the register is chosen
+HLL_REMAINING_BITS = 64 - HLL_PRECISION
+
+# Bias correction constant of the HyperLogLog estimate for the number of registers
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+# Prefix of the tables in which sketches are stored alongside the aggregate tables
+SKETCH_TABLE_PREFIX = "sketch"
+
+
+def sketch_table_name(aggregate_table_name: str) -> str:
+    return f"{SKETCH_TABLE_PREFIX}_{aggregate_table_name}"
+
+
+def sketch_registers_sql(
+    source: str, group_by: str, metrics: dict[str, str], where: str
+) -> str:
+    """Function to build the SQL query that computes, for every group of the source, a HyperLogLog sketch of the distinct values of each metric.
+
+    Sketches are stored in a long format, one row per group, metric and non-empty register. The
+    register is chosen by the lowest bits of the value's hash and keeps the maximum rank, or the
+    position of the first 1 bit, of the hash's remaining bits. Sketches are merged by taking the
+    maximum rank of each register.
+    """
+    hashed_values = " UNION ALL ".join(
+        f"""
+        SELECT  {group_by},
+                '{metric}' AS metric,
+                hash({value}) AS value_hash
+        FROM {source}
+        WHERE ({where}) AND {value} IS NOT NULL
+        """
+        for metric, value in metrics.items()
+    )
+    return f"""
+    SELECT  {group_by},
+            metric,
+            CAST(value_hash & {HLL_REGISTERS - 1} AS USMALLINT) AS register,
+            MAX(
+                CASE WHEN value_hash >> {HLL_PRECISION} = 0
+                THEN {HLL_REMAINING_BITS + 1}
+                ELSE {HLL_REMAINING_BITS} - CAST(floor(log2(value_hash >> {HLL_PRECISION})) AS INTEGER)
+                END
+            ) AS rank
+    FROM ({hashed_values})
+    GROUP BY {group_by}, metric, register
+    """
+
+
+def sketch_estimates_sql(sketch_table: str, group_by: str, metric: str) -> str:
+    """Function to build the SQL query that estimates, for every group, the number of distinct values of a metric from its HyperLogLog sketch.
+
+    Small cardinalities, for which some registers are still empty, are estimated with linear counting.
+    """
+    return f"""
+    SELECT  {group_by},
+            CAST(round(
+                CASE WHEN raw_estimate <= {2.5 * HLL_REGISTERS} AND empty_registers > 0
+                THEN {HLL_REGISTERS} * ln({float(HLL_REGISTERS)} / empty_registers)
+                ELSE raw_estimate
+                END
+            ) AS UBIGINT) AS estimate
+    FROM (
+        SELECT  {group_by},
+                {HLL_ALPHA * HLL_REGISTERS**2} / (
+                    {HLL_REGISTERS} - COUNT(*) + SUM(pow(2, -rank))
+                ) AS raw_estimate,
+                {HLL_REGISTERS} - COUNT(*) AS empty_registers
+        FROM {sketch_table}
+        WHERE metric = '{metric}'
+        GROUP BY {group_by}
+    )
+    """
+
+
+def standard_error() -> float:
+    """Function to get the relative standard error of the HyperLogLog estimates."""
+    return 1.04 / math.sqrt(HLL_REGISTERS)
@@ -0,0 +1,84 @@
+import hashlib
+import json
+from pathlib import Path
+
+import duckdb
+
+from incremental import fingerprint_files
+
+# Table in which the database records the pipeline's completed stages
+PIPELINE_STAGES_TABLE = "pipeline_stages"
+
+
+def pipeline_fingerprint(files: list[Path], options: dict) -> str:
+    """Function to summarise the pre-processed files and the options on which the database's contents depend."""
+    digest = hashlib.blake2b()
+    digest.update(fingerprint_files(files).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class PipelineStages:
+    """Class to record, in the database, each completed stage of the pipeline and the fingerprint of the inputs it was completed with, so that an interrupted run can be resumed from its first incomplete stage.
+
+    Every stage depends on the stages before it, so once a stage is run again, so are all the
+    following stages.
+    """
+
+    def __init__(
+        self, connection: duckdb.DuckDBPyConnection, fingerprint: str, resume: bool
+    ) -> None:
+        self.connection = connection
+        self.fingerprint = fingerprint
+        self.rerunning = False
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {PIPELINE_STAGES_TABLE}(
+            stage VARCHAR,
+            fingerprint VARCHAR,
+            completed_at TIMESTAMP,
+            state VARCHAR
+            );
+        """
+        self.connection.execute(query)
+        if not resume:
+            self.connection.execute(f"DELETE FROM {PIPELINE_STAGES_TABLE};")
+        query = f"""
+        SELECT stage, state
+        FROM {PIPELINE_STAGES_TABLE}
+        WHERE fingerprint = ?;
+        """
+        self.completed = {
+            stage: json.loads(state) if state else {}
+            for stage, state in self.connection.execute(
+                query, [self.fingerprint]
+            ).fetchall()
+        }
+
+    def should_run(self, stage: str, outputs: list[Path] | None = None) -> bool:
+        """Method to check whether a stage must be run, because it wasn't completed with the current inputs, one of its output files is missing, or an earlier stage was run again."""
+        if (
+            not self.rerunning
+            and stage in self.completed
+            and all(Path(outfile).exists() for outfile in outputs or [])
+        ):
+            print(f"---->skipping the stage '{stage}', completed by an earlier run\n")
+            return False
+        self.rerunning = True
+        self.connection.execute(
+            f"DELETE FROM {PIPELINE_STAGES_TABLE} WHERE stage = ?;", [stage]
+        )
+        return True
+
+    def complete(self, stage: str, state: dict | None = None):
+        """Method to record that a stage was completed, with any state that the following stages need if it is skipped by a resumed run."""
+        self.connection.execute(
+            f"DELETE FROM {PIPELINE_STAGES_TABLE} WHERE stage = ?;", [stage]
+        )
+        self.connection.execute(
+            f"INSERT INTO {PIPELINE_STAGES_TABLE} VALUES (?, ?, current_timestamp, ?);",
+            [stage, self.fingerprint, json.dumps(state or {})],
+        )
+        self.completed[stage] = state or {}
+
+    def state(self, stage: str) -> dict:
+        return self.completed.get(stage, {})
@@ -0,0 +1,151 @@
+import csv
+import datetime
+import gzip
+import itertools
+import random
+from pathlib import Path
+
+from preprocessing import SELECT_COLUMNS
+
+# Columns of the synthetic Twitter files: the selected columns and a text column that pre-processing ignores
+SYNTHETIC_COLUMNS = SELECT_COLUMNS + ["text"]
+
+# Domains, other than YouTube's, of the synthetic links
+SYNTHETIC_DOMAINS = [
+    "example.org",
+    "www.lemonde.fr",
+    "www.bbc.co.uk",
+    "github.com",
+    "en.wikipedia.org",
+    "medium.com",
+    "www.nytimes.com",
+    "foo.blogspot.com",
+    "t.co",
+    "www.liberation.fr",
+]
+
+# First Snowflake ID of the synthetic tweets
+FIRST_TWEET_ID = 100_000_000_000_000_000
+
+
+class SyntheticDataOptions:
+    """Class to hold the settings that shape the synthetic Twitter data.
+
+    Links are drawn from a pool of distinct URLs with a Zipf distribution, whose exponent sets how
+    much the most shared URLs are repeated: 0 shares every URL as often, and higher values
+    concentrate the shares on fewer URLs.
+    """
+
+    def __init__(
+        self,
+        rows: int = 100_000,
+        links_per_tweet: float = 1.5,
+        distinct_urls: int = 10_000,
+        url_skew: float = 1.1,
+        youtube_share: float = 0.2,
+        months: int = 12,
+        first_month: datetime.date = datetime.date(2022, 1, 1),
+        users: int = 10_000,
+        retweet_share: float = 0.3,
+        seed: int = 0,
+    ) -> None:
+        self.rows = rows
+        self.links_per_tweet = links_per_tweet
+        self.distinct_urls = distinct_urls
+        self.url_skew = url_skew
+        self.youtube_share = youtube_share
+        self.months = months
+        self.first_month = first_month
+        self.users = users
+        self.retweet_share = retweet_share
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return {
+            key: str(value) if isinstance(value, datetime.date) else value
+            for key, value in vars(self).items()
+        }
+
+
+def synthetic_url(index: int, youtube: bool) -> str:
+    """Function to forge the distinct URL of the given index, as a YouTube video or channel link or as a link to another domain."""
+    if youtube:
+        # Two out of three YouTube links are to videos, in their long or short form, and the others to channels
+        kind = index % 3
+        if kind == 0:
+            return f"https://www.youtube.com/watch?v=vid{index:08d}"
+        if kind == 1:
+            return f"https://youtu.be/vid{index:08d}"
+        return f"https://www.youtube.com/channel/UC{index:022d}"
+    domain = SYNTHETIC_DOMAINS[index % len(SYNTHETIC_DOMAINS)]
+    return f"https://{domain}/articles/{index}?utm_source=twitter"
+
+
+def month_starts(first_month: datetime.date, months: int) -> list[datetime.datetime]:
+    """Function to list the first moment of every month of the synthetic data."""
+    starts = []
+    for i in range(months + 1):
+        year, month = divmod(first_month.month - 1 + i, 12)
+        starts.append(datetime.datetime(first_month.year + year, month + 1, 1))
+    return starts
+
+
+def generate_tweets(options: SyntheticDataOptions):
+    """Function to generate the rows of synthetic tweets, whose links, users and publication dates are drawn at random from the options' distributions."""
+    rng = random.Random(options.seed)
+
+    # Which distinct URLs are YouTube links is decided once, so that a URL keeps its domain
+    urls = [
+        synthetic_url(i, youtube=rng.random() < options.youtube_share)
+        for i in range(options.distinct_urls)
+    ]
+    url_weights = list(
+        itertools.accumulate(
+            1 / (rank**options.url_skew) for rank in range(1, len(urls) + 1)
+        )
+    )
+
+    # Tweets are spread evenly over the months, at random times within each month
+    starts = month_starts(options.first_month, options.months)
+
+    # The number of links in a tweet is drawn between 0 and twice the mean
+    max_links = max(1, round(2 * options.links_per_tweet))
+    for i in range(options.rows):
+        month = i % options.months
+        span = (starts[month + 1] - starts[month]).total_seconds()
+        local_time = starts[month] + datetime.timedelta(seconds=rng.random() * span)
+        nb_links = min(max_links, round(rng.uniform(0, 2 * options.links_per_tweet)))
+        links = rng.choices(urls, cum_weights=url_weights, k=nb_links)
+        # A retweet's ID is an earlier tweet's ID, and an original tweet's is left empty, as in real exports
+        if i and rng.random() < options.retweet_share:
+            retweeted_id = FIRST_TWEET_ID + rng.randrange(i)
+        else:
+            retweeted_id = ""
+        yield [
+            FIRST_TWEET_ID + i,
+            local_time.isoformat(timespec="seconds"),
+            rng.randrange(options.users),
+            retweeted_id,
+            "|".join(links),
+            "synthetic tweet",
+        ]
+
+
+def write_synthetic_data(
+    output_dir: Path, options: SyntheticDataOptions, files: int = 1
+) -> list[Path]:
+    """Function to write the synthetic tweets, split between the given number of gzipped CSV files, and to return the files' paths."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = [output_dir.joinpath(f"tweets_{i}.csv.gz") for i in range(files)]
+    handles = [gzip.open(path, "wt", newline="") for path in paths]
+    try:
+        writers = [csv.writer(handle) for handle in handles]
+        for writer in writers:
+            writer.writerow(SYNTHETIC_COLUMNS)
+        for i, row in enumerate(generate_tweets(options)):
+            writers[i % files].writerow(row)
+    finally:
+        for handle in handles:
+            handle.close()
+    return paths
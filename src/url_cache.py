@@ -0,0 +1,120 @@
+import sqlite3
+from collections import OrderedDict
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+# Default number of parsed links to keep in memory
+DEFAULT_URL_CACHE_SIZE = 1_000_000
+
+# Maximum number of links to look up in the on-disk cache in one query
+SQLITE_CHUNK_SIZE = 900
+
+
+def ural_version() -> str:
+    """Function to get the installed version of Ural, whose parsing the cached values depend on."""
+    try:
+        return version("ural")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class ParsedURLCache:
+    """Class to memoise the normalized URL and the domain name of links.
+
+    The parsed values are kept in a bounded LRU in memory and, if a path is given, in a SQLite
+    file that persists across files, processes and runs. The cached values are tied to the
+    installed version of Ural, so that upgrading Ural invalidates them.
+    """
+
+    def __init__(
+        self, maxsize: int = DEFAULT_URL_CACHE_SIZE, path: Path | None = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.version = ural_version()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(str(path), timeout=60)
+            self.db.execute("PRAGMA journal_mode=WAL;")
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS parsed_urls(
+                    link TEXT,
+                    version TEXT,
+                    normalized_url TEXT,
+                    domain TEXT,
+                    PRIMARY KEY (link, version)
+                );
+                """
+            )
+            self.db.commit()
+
+    def lookup(self, links: list[str]) -> tuple[dict, list[str]]:
+        """Method to get the cached values of distinct links, returning a dictionary of the links found in the cache and a list of the missing links."""
+        found = {}
+        not_in_memory = []
+        for link in links:
+            value = self.memory.get(link)
+            if value is None:
+                not_in_memory.append(link)
+            else:
+                self.memory.move_to_end(link)
+                found[link] = value
+
+        missing = not_in_memory
+        if self.db is not None and not_in_memory:
+            found_on_disk = self.lookup_on_disk(not_in_memory)
+            self.remember(found_on_disk)
+            found.update(found_on_disk)
+            missing = [link for link in not_in_memory if link not in found_on_disk]
+
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def lookup_on_disk(self, links: list[str]) -> dict:
+        found = {}
+        for i in range(0, len(links), SQLITE_CHUNK_SIZE):
+            chunk = links[i : i + SQLITE_CHUNK_SIZE]
+            placeholders = ", ".join("?" for _ in chunk)
+            query = f"""
+            SELECT link, normalized_url, domain
+            FROM parsed_urls
+            WHERE version = ? AND link IN ({placeholders});
+            """
+            for link, normalized_url, domain in self.db.execute(
+                query, [self.version] + chunk
+            ):
+                found[link] = (normalized_url, domain)
+        return found
+
+    def store(self, parsed_links: dict) -> None:
+        """Method to cache a dictionary of links and their (normalized URL, domain name) values."""
+        self.remember(parsed_links)
+        if self.db is not None and parsed_links:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO parsed_urls VALUES (?, ?, ?, ?);",
+                [
+                    (link, self.version, normalized_url, domain)
+                    for link, (normalized_url, domain) in parsed_links.items()
+                ],
+            )
+            self.db.commit()
+
+    def remember(self, parsed_links: dict) -> None:
+        """Method to add values to the in-memory LRU, evicting the least recently used links beyond the maximum size."""
+        for link, value in parsed_links.items():
+            self.memory[link] = value
+            self.memory.move_to_end(link)
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
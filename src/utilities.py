@@ -2,6 +2,7 @@ import datetime
 from pathlib import Path
 from typing import Any
 
+import duckdb
 from rich import print as rich_print
 from rich.panel import Panel
 
@@ -115,18 +116,6 @@ def create_month_column_names(months: list) -> list:
     return columns
 
 
-def build_aggregate_command_for_month_columns(month_columns: list, month: str):
-    """Function to generate the SQL aggregation command for every month in data."""
-    value = f"COUNT(DISTINCT tweet_id) AS nb_tweets_in_{month}"
-    selection = []
-    for month_column in month_columns:
-        if extract_month(month_column) == month:
-            selection.append(value)
-        else:
-            selection.append("0")
-    return ", ".join(selection)
-
-
 def list_tables(all_tables: list, prefix: str):
     """Function to generate a simple list of all tables in the array returned with duckdb's list table method."""
     return [table[0] for table in all_tables if table[0].startswith(prefix)]
@@ -137,5 +126,21 @@ def log_time_message(step: str, duration: str):
     return f"{step} - {duration}"
 
 
+def export_query(
+    connection: duckdb.DuckDBPyConnection,
+    query: str,
+    outfile: Path,
+    csv_outfile: Path | None = None,
+):
+    """Function to write the result of a query to a Parquet file, which keeps the columns' types, and, if given, to a CSV file."""
+    connection.execute(
+        f"COPY ({query}) TO '{outfile}' (FORMAT PARQUET, COMPRESSION ZSTD);"
+    )
+    if csv_outfile:
+        connection.execute(
+            f"COPY ({query}) TO '{csv_outfile}' (HEADER, DELIMITER ',');"
+        )
+
+
 def style_panel(msg, color, title):
     rich_print(Panel(msg, title=f"{color}{title}", title_align="center", width=100))
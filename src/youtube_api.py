@@ -0,0 +1,223 @@
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator
+
+import urllib3
+
+from exceptions import YouTubeAPIError, YouTubeQuotaExhausted
+
+# Root of the YouTube Data API, which can be replaced by the address of a local fake server
+YOUTUBE_API_BASE_URL = "https://www.googleapis.com/youtube/v3"
+
+# Maximum number of IDs that a "videos.list" request accepts
+VIDEOS_PER_REQUEST = 50
+
+# Units of quota that the API gives each key per day, and that "videos.list" and "channels.list" requests cost
+DEFAULT_DAILY_QUOTA = 10_000
+VIDEOS_LIST_COST = 1
+CHANNELS_LIST_COST = 1
+
+# Default number of requests sent to the API at the same time
+DEFAULT_REQUESTS_IN_FLIGHT = 4
+
+# Number of times a request is retried when the API is unavailable or asks to slow down
+MAX_RETRIES = 5
+
+# Fields of each part of a video's resource from which its metadata is taken, by the column in which they're kept
+VIDEO_PART_FIELDS = {
+    "snippet": {
+        "published_at": "publishedAt",
+        "channel_id": "channelId",
+        "title": "title",
+        "description": "description",
+        "channel_title": "channelTitle",
+    },
+    "statistics": {
+        "view_count": "viewCount",
+        "like_count": "likeCount",
+        "comment_count": "commentCount",
+    },
+    "contentDetails": {
+        "duration": "duration",
+        "has_caption": "caption",
+    },
+}
+VIDEO_PARTS = list(VIDEO_PART_FIELDS)
+
+# Reasons for which the API refuses a key, which is then no longer used
+KEY_ERROR_REASONS = [
+    "quotaExceeded",
+    "dailyLimitExceeded",
+    "keyInvalid",
+    "keyExpired",
+    "accessNotConfigured",
+]
+
+
+class YouTubeKeyRing:
+    """Class to rotate through the API keys while keeping track of the quota that each key has used, and to skip the keys that have run out of quota or that the API refused."""
+
+    def __init__(self, keys: list[str], daily_quota: int = DEFAULT_DAILY_QUOTA) -> None:
+        self.keys = list(dict.fromkeys(keys))
+        self.daily_quota = daily_quota
+        self.used = {key: 0 for key in self.keys}
+        self.refused = set()
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def take(self, cost: int) -> str:
+        """Method to get the next key that has enough quota left for a request of the given cost, and to charge it the cost."""
+        with self.lock:
+            for _ in range(len(self.keys)):
+                key = self.keys[self.position]
+                self.position = (self.position + 1) % len(self.keys)
+                if (
+                    key not in self.refused
+                    and self.used[key] + cost <= self.daily_quota
+                ):
+                    self.used[key] += cost
+                    return key
+        raise YouTubeQuotaExhausted(
+            "Every YouTube API key has run out of quota or was refused by the API."
+        )
+
+    def refuse(self, key: str):
+        with self.lock:
+            self.refused.add(key)
+
+    def usage(self) -> dict[str, int]:
+        """Method to get the units of quota that each key has used, by the key's last 4 characters."""
+        return {f"...{key[-4:]}": used for key, used in self.used.items()}
+
+
+def error_reason(data: dict) -> str | None:
+    """Function to get the reason that the API gives for an error."""
+    errors = data.get("error", {}).get("errors", [])
+    if errors:
+        return errors[0].get("reason")
+    return None
+
+
+def part_row(item: dict, part: str) -> dict:
+    """Function to flatten one part of a video's resource into its columns."""
+    values = item.get(part, {})
+    row = {
+        column: values.get(field) for column, field in VIDEO_PART_FIELDS[part].items()
+    }
+    if part == "contentDetails" and row["has_caption"] is not None:
+        row["has_caption"] = row["has_caption"] == "true"
+    return row
+
+
+class YouTubeClient:
+    """Class to request resources from the YouTube Data API, with a bounded number of requests in flight and the keys used in turn.
+
+    Videos are requested 50 per "videos.list" request. Channels' handles and legacy usernames can
+    only be resolved one per "channels.list" request, so their requests are only sent concurrently.
+    """
+
+    def __init__(
+        self,
+        keys: list[str],
+        base_url: str = YOUTUBE_API_BASE_URL,
+        requests_in_flight: int = DEFAULT_REQUESTS_IN_FLIGHT,
+        daily_quota: int = DEFAULT_DAILY_QUOTA,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.requests_in_flight = requests_in_flight
+        self.key_ring = YouTubeKeyRing(keys, daily_quota)
+        retries = urllib3.Retry(
+            total=MAX_RETRIES,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+        )
+        self.http = urllib3.PoolManager(maxsize=requests_in_flight, retries=retries)
+
+    def request(self, resource: str, fields: dict, cost: int) -> list[dict]:
+        """Method to request a list of resources and return its items, sending the request again with the next key if the API refuses a key."""
+        while True:
+            key = self.key_ring.take(cost)
+            response = self.http.request(
+                "GET", f"{self.base_url}/{resource}", fields={**fields, "key": key}
+            )
+            try:
+                data = json.loads(response.data or b"{}")
+            except json.JSONDecodeError:
+                data = {}
+            if response.status == 200:
+                return data.get("items", [])
+
+            if error_reason(data) in KEY_ERROR_REASONS:
+                self.key_ring.refuse(key)
+                continue
+            raise YouTubeAPIError(
+                f"The YouTube API answered {response.status}: {response.data[:200]!r}"
+            )
+
+    def in_flight(self, function: Callable, tasks: Iterable) -> Iterator[tuple]:
+        """Method to call the function on every task in a pool of threads, yielding each task with its result as it completes."""
+        with ThreadPoolExecutor(max_workers=self.requests_in_flight) as executor:
+            # Only keep as many requests in flight as allowed, sending the next one when one completes
+            pending = {}
+            remaining = iter(tasks)
+            for task in remaining:
+                pending[executor.submit(function, task)] = task
+                if len(pending) >= self.requests_in_flight:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = pending.pop(future)
+                    # Raise any exception met in the request
+                    result = future.result()
+                    for next_task in remaining:
+                        pending[executor.submit(function, next_task)] = next_task
+                        break
+                    yield task, result
+
+    def videos_list(
+        self, video_ids: list[str], parts: list[str] = VIDEO_PARTS
+    ) -> list[dict]:
+        """Method to request the given parts of the resources of up to 50 videos. Videos that no longer exist are missing from the response."""
+        fields = {
+            "part": ",".join(parts),
+            "id": ",".join(video_ids),
+            "maxResults": str(VIDEOS_PER_REQUEST),
+        }
+        return self.request("videos", fields, VIDEOS_LIST_COST)
+
+    def videos(
+        self, video_ids: list[str], parts: list[str] = VIDEO_PARTS
+    ) -> Iterator[tuple[list[str], list[dict]]]:
+        """Method to request the given parts of every video's resource, yielding, as each request completes, the IDs it asked for and the resources of the videos it found."""
+        batches = [
+            video_ids[i : i + VIDEOS_PER_REQUEST]
+            for i in range(0, len(video_ids), VIDEOS_PER_REQUEST)
+        ]
+        yield from self.in_flight(lambda batch: self.videos_list(batch, parts), batches)
+
+    def channel_id(self, kind: str, name: str) -> str | None:
+        """Method to resolve a channel's handle, custom name or legacy username to its ID, or to None if no channel has it.
+
+        A custom URL's name is most often the channel's handle, since YouTube turned custom URLs into
+        handles, and is otherwise looked up as a legacy username.
+        """
+        lookups = {
+            "handle": [("forHandle", name)],
+            "custom": [("forHandle", f"@{name}"), ("forUsername", name)],
+            "user": [("forUsername", name)],
+        }
+        for parameter, value in lookups[kind]:
+            items = self.request(
+                "channels", {"part": "id", parameter: value}, CHANNELS_LIST_COST
+            )
+            if items:
+                return items[0]["id"]
+        return None
+
+    def channel_ids(
+        self, names: list[tuple[str, str]]
+    ) -> Iterator[tuple[tuple[str, str], str | None]]:
+        """Method to resolve every channel's (kind, name) pair to its ID, yielding each pair with its ID as its request completes."""
+        yield from self.in_flight(lambda name: self.channel_id(*name), names)
@@ -0,0 +1,210 @@
+from pathlib import Path
+
+import duckdb
+import pyarrow
+from minet.youtube.constants import YOUTUBE_VIDEO_CSV_HEADERS
+
+from youtube_api import VIDEO_PART_FIELDS, VIDEO_PARTS, part_row
+
+# File, in the output directory, of the cache of YouTube metadata that persists across runs
+YOUTUBE_CACHE_FILE_NAME = "youtube_cache.duckdb"
+
+# Table of the cache in which each part of the videos' resources is kept
+VIDEO_PART_TABLES = {
+    "snippet": "video_snippets",
+    "statistics": "video_statistics",
+    "contentDetails": "video_content_details",
+}
+
+# Table of the cache in which the channel ID of every handle, custom name and legacy username is kept
+CHANNEL_NAMES_TABLE = "channel_names"
+
+# Default number of days after which each part of a video's cached metadata is requested again
+DEFAULT_VIDEO_PART_TTLS = {"snippet": 30, "statistics": 1, "contentDetails": 90}
+
+# Types of the metadata's columns
+VIDEO_METADATA_TYPES = {
+    "video_id": "VARCHAR",
+    "published_at": "TIMESTAMP",
+    "channel_id": "VARCHAR",
+    "title": "VARCHAR",
+    "description": "VARCHAR",
+    "channel_title": "VARCHAR",
+    "view_count": "UBIGINT",
+    "like_count": "UBIGINT",
+    "comment_count": "UBIGINT",
+    "duration": "VARCHAR",
+    "has_caption": "BOOLEAN",
+}
+
+
+def video_id_table(video_ids: list[str]) -> pyarrow.Table:
+    """Function to put video IDs in a table that can be registered in the database, even if there are none."""
+    return pyarrow.table({"video_id": pyarrow.array(video_ids, type=pyarrow.string())})
+
+
+def name_table(names: list[tuple[str, str]]) -> pyarrow.Table:
+    """Function to put channels' (kind, name) pairs in a table that can be registered in the database, even if there are none."""
+    kinds, names = zip(*names) if names else ([], [])
+    return pyarrow.table(
+        {
+            "kind": pyarrow.array(list(kinds), type=pyarrow.string()),
+            "name": pyarrow.array(list(names), type=pyarrow.string()),
+        }
+    )
+
+
+class YouTubeCache:
+    """Class to keep the metadata of YouTube videos and the IDs of channels' names in a DuckDB file that persists across runs.
+
+    Each part of the videos' resources is kept in its own table with the time it was fetched, so
+    that a part is only requested again once it is older than its time to live, in days. Videos
+    that the API didn't find are kept too, so that they aren't requested again before then.
+    A channel's handle, custom name or legacy username is resolved only once, and names that no
+    channel has are kept with no ID.
+    """
+
+    def __init__(self, path: Path, ttls: dict[str, float] = DEFAULT_VIDEO_PART_TTLS):
+        self.connection = duckdb.connect(str(path), read_only=False)
+        self.ttls = ttls
+        for part, table in VIDEO_PART_TABLES.items():
+            columns = ", ".join(
+                f"{column} {VIDEO_METADATA_TYPES[column]}"
+                for column in VIDEO_PART_FIELDS[part]
+            )
+            query = f"""
+            CREATE TABLE IF NOT EXISTS {table}(
+                video_id VARCHAR,
+                {columns},
+                found BOOLEAN,
+                fetched_at TIMESTAMP
+            );
+            """
+            self.connection.execute(query)
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {CHANNEL_NAMES_TABLE}(
+            kind VARCHAR,
+            name VARCHAR,
+            channel_id VARCHAR,
+            fetched_at TIMESTAMP
+        );
+        """
+        self.connection.execute(query)
+
+    def stale_videos(self, video_ids: list[str]) -> dict[tuple[str, ...], list[str]]:
+        """Method to find the videos whose metadata is missing from the cache or older than its time to live, grouped by the parts of their resources that need to be requested."""
+        self.connection.register("requested_video_ids", video_id_table(video_ids))
+        stale_parts = {}
+        for part, table in VIDEO_PART_TABLES.items():
+            query = f"""
+            SELECT requested.video_id
+            FROM requested_video_ids AS requested
+            LEFT JOIN {table} AS cached
+            ON requested.video_id = cached.video_id
+            WHERE cached.fetched_at IS NULL
+            OR cached.fetched_at < now() - INTERVAL ({self.ttls[part]} * 86400) SECOND
+            """
+            stale_parts[part] = {
+                row[0] for row in self.connection.execute(query).fetchall()
+            }
+        self.connection.unregister("requested_video_ids")
+
+        requests = {}
+        for video_id in video_ids:
+            parts = tuple(part for part in VIDEO_PARTS if video_id in stale_parts[part])
+            if parts:
+                requests.setdefault(parts, []).append(video_id)
+        return requests
+
+    def store_videos(
+        self, video_ids: list[str], items: list[dict], parts: tuple[str, ...]
+    ):
+        """Method to replace the cached parts of the requested videos with those of the resources that the API returned."""
+        found = {item["id"]: item for item in items}
+        for part in parts:
+            rows = [
+                {
+                    "video_id": video_id,
+                    **part_row(found.get(video_id, {}), part),
+                    "found": video_id in found,
+                }
+                for video_id in video_ids
+            ]
+            self.connection.register("fetched_videos", pyarrow.Table.from_pylist(rows))
+            # The API's values are strings, i.e. the ISO 8601 date of publication, so they're cast to the columns' types
+            columns = ", ".join(
+                f"CAST({column} AS {VIDEO_METADATA_TYPES[column]})"
+                for column in VIDEO_PART_FIELDS[part]
+            )
+            table = VIDEO_PART_TABLES[part]
+            query = f"""
+            DELETE FROM {table}
+            WHERE video_id IN (SELECT video_id FROM fetched_videos);
+            INSERT INTO {table}
+            SELECT video_id, {columns}, found, now()
+            FROM fetched_videos;
+            """
+            self.connection.execute(query)
+            self.connection.unregister("fetched_videos")
+
+    def video_metadata(self, video_ids: list[str]) -> pyarrow.Table:
+        """Method to get the cached metadata of the videos that the API found, in the columns of YOUTUBE_VIDEO_CSV_HEADERS."""
+        self.connection.register("requested_video_ids", video_id_table(video_ids))
+        # Columns are cast to their types, since a cache created by an earlier version may have kept the date of publication as a string
+        columns = ", ".join(
+            "requested.video_id"
+            if column == "video_id"
+            else f"CAST({column} AS {VIDEO_METADATA_TYPES[column]}) AS {column}"
+            for column in YOUTUBE_VIDEO_CSV_HEADERS
+        )
+        query = f"""
+        SELECT {columns}
+        FROM requested_video_ids AS requested
+        JOIN {VIDEO_PART_TABLES["snippet"]} AS snippet
+        ON requested.video_id = snippet.video_id AND snippet.found
+        LEFT JOIN {VIDEO_PART_TABLES["statistics"]} AS statistics
+        ON requested.video_id = statistics.video_id
+        LEFT JOIN {VIDEO_PART_TABLES["contentDetails"]} AS details
+        ON requested.video_id = details.video_id
+        """
+        metadata = self.connection.execute(query).arrow()
+        self.connection.unregister("requested_video_ids")
+        return metadata
+
+    def unresolved_names(self, names: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """Method to find the channels' (kind, name) pairs that were never resolved."""
+        self.connection.register("requested_names", name_table(names))
+        query = f"""
+        SELECT requested.kind, requested.name
+        FROM requested_names AS requested
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM {CHANNEL_NAMES_TABLE} AS cached
+            WHERE cached.kind = requested.kind AND cached.name = requested.name
+        )
+        """
+        unresolved = self.connection.execute(query).fetchall()
+        self.connection.unregister("requested_names")
+        return unresolved
+
+    def store_channel_ids(self, resolved: list[tuple[str, str, str | None]]):
+        """Method to cache the channel ID, or the lack of one, of every (kind, name) pair."""
+        self.connection.executemany(
+            f"INSERT INTO {CHANNEL_NAMES_TABLE} VALUES (?, ?, ?, now());", resolved
+        )
+
+    def channel_ids(self, names: list[tuple[str, str]]) -> pyarrow.Table:
+        """Method to get the cached channel ID of every (kind, name) pair."""
+        self.connection.register("requested_names", name_table(names))
+        query = f"""
+        SELECT requested.kind, requested.name, cached.channel_id
+        FROM requested_names AS requested
+        JOIN {CHANNEL_NAMES_TABLE} AS cached
+        ON cached.kind = requested.kind AND cached.name = requested.name
+        """
+        channel_ids = self.connection.execute(query).arrow()
+        self.connection.unregister("requested_names")
+        return channel_ids
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,113 @@
+from pathlib import Path
+from urllib.parse import unquote
+
+import duckdb
+import pyarrow
+from rich import print as rich_print
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    TextColumn,
+    TimeElapsedColumn,
+)
+
+from utilities import style_panel
+from youtube_api import YouTubeClient
+from youtube_cache import YouTubeCache
+
+# Number of resolved names cached at a time
+CACHE_BATCH_SIZE = 100
+
+
+def resolve_channel_names(
+    connection: duckdb.DuckDBPyConnection,
+    client: YouTubeClient,
+    color: str,
+    cache_path: Path,
+):
+    """Function to resolve the handles, custom names and legacy usernames of YouTube channel links to channel IDs, from the cache or, if a name was never resolved, from the YouTube API, and to set the links' channel IDs.
+
+    Args:
+        connection (duckdb.DuckDBPyConnection): database connection
+        client (YouTubeClient): client of the YouTube API, whose keys' quota is shared with the other YouTube stages
+        color (str): color name for rich progress bar
+        cache_path (Path): path to the DuckDB file of cached channel IDs
+    """
+    query = """
+    SELECT DISTINCT kind, channel_name
+    FROM all_youtube_links
+    WHERE kind IN ('handle', 'custom', 'user')
+    ORDER BY kind, channel_name
+    """
+    # Names are taken from normalized URLs, which escape some characters, like the "@" of handles
+    link_names = {
+        (kind, link_name): (kind, unquote(link_name))
+        for kind, link_name in connection.execute(query).fetchall()
+    }
+    names = list(dict.fromkeys(link_names.values()))
+    cache = YouTubeCache(path=cache_path)
+    unresolved = cache.unresolved_names(names)
+
+    msg = f"""
+Of {len(names)} channel names, resolve the {len(unresolved)} missing from the cache "{cache_path}" to channel IDs with the YouTube API, {client.requests_in_flight} requests at a time, while rotating through {len(client.key_ring.keys)} API key(s). Then set the channel links' IDs in the table "all_youtube_links."
+    """
+    style_panel(msg=msg, color=color, title="Resolve YouTube channel names")
+
+    # ----------------------------------------------------------------------- #
+    # Set up the progress bar
+    ProgressCompleteColumn = Progress(
+        TextColumn("{task.description}"),
+        MofNCompleteColumn(),
+        BarColumn(bar_width=60),
+        TimeElapsedColumn(),
+        expand=True,
+    )
+    with ProgressCompleteColumn as progress:
+        task = progress.add_task(
+            f"{color}Resolving YouTube channel names...", total=len(unresolved)
+        )
+        # ------------------------------------------------------------------ #
+
+        # Resolved names are cached in batches as they arrive, so that an interrupted run keeps them
+        resolved = []
+        for (kind, name), channel_id in client.channel_ids(unresolved):
+            resolved.append((kind, name, channel_id))
+            if len(resolved) >= CACHE_BATCH_SIZE:
+                cache.store_channel_ids(resolved)
+                resolved = []
+            progress.update(task_id=task, advance=1)
+        if resolved:
+            cache.store_channel_ids(resolved)
+
+    channel_ids = {
+        (row["kind"], row["name"]): row["channel_id"]
+        for row in cache.channel_ids(names).to_pylist()
+    }
+    cache.close()
+    resolved_names = pyarrow.table(
+        {
+            "kind": [kind for kind, _ in link_names],
+            "channel_name": [link_name for _, link_name in link_names],
+            "channel_id": [channel_ids.get(name) for name in link_names.values()],
+        },
+        schema=pyarrow.schema(
+            [
+                ("kind", pyarrow.string()),
+                ("channel_name", pyarrow.string()),
+                ("channel_id", pyarrow.string()),
+            ]
+        ),
+    )
+    connection.register("resolved_names", resolved_names)
+    query = """
+    UPDATE all_youtube_links
+    SET channel_id = resolved_names.channel_id
+    FROM resolved_names
+    WHERE all_youtube_links.kind = resolved_names.kind
+    AND all_youtube_links.channel_name = resolved_names.channel_name;
+    """
+    connection.execute(query)
+    connection.unregister("resolved_names")
+
+    rich_print(f"Units of quota used by each key: {client.key_ring.usage()}")
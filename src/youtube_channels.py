@@ -1,20 +1,27 @@
 from pathlib import Path
 import duckdb
 
+from utilities import export_query
 
-def aggregate_channels(connection: duckdb.DuckDBPyConnection, outfile: Path):
+
+def aggregate_channels(
+    connection: duckdb.DuckDBPyConnection,
+    outfile: Path,
+    csv_outfile: Path | None = None,
+):
     """Function groups parsed YouTube links by the channel ID.
 
     Args:
         connection (duckdb.DuckDBPyConnection): connection to database
-        outfile (Path): path to CSV file of aggregated YouTube channels
+        outfile (Path): path to Parquet file of aggregated YouTube channels
+        csv_outfile (Path | None): path to CSV file of aggregated YouTube channels, if one is wanted
     """
     connection.execute("PRAGMA enable_progress_bar")
 
     # Get variables
     aggregate_table_name = "aggregated_youtube_channels"
     parsed_table_name = "all_parsed_youtube_links"
-    parsed_table = duckdb.table(parsed_table_name, connection=connection)
+    parsed_table = connection.table(parsed_table_name)
     parsed_column_names = parsed_table.columns
     parsed_column_and_dtypes = ", ".join(
         [
@@ -38,9 +45,7 @@ def aggregate_channels(connection: duckdb.DuckDBPyConnection, outfile: Path):
     columns_to_sum.remove("channel_id")
     columns_to_sum.remove("normalized_url")
     columns_to_sum.remove("link_for_scraping")
-    columns_to_sum = ", ".join(
-        [f"SUM(CAST({col} AS UBIGINT))" for col in columns_to_sum]
-    )
+    columns_to_sum = ", ".join([f"SUM({col})" for col in columns_to_sum])
 
     # Group by YouTube channel ID and sum aggregated metrics
     query = f"""
@@ -57,7 +62,6 @@ def aggregate_channels(connection: duckdb.DuckDBPyConnection, outfile: Path):
     connection.execute(query)
 
     # Export the final domain table to an out-file
-    query = f"""
-    COPY (SELECT * FROM {aggregate_table_name}) TO '{str(outfile)}' (HEADER, DELIMITER ',');
-    """
-    connection.execute(query)
+    export_query(
+        connection, f"SELECT * FROM {aggregate_table_name}", outfile, csv_outfile
+    )
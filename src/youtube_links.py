@@ -1,41 +1,73 @@
 from pathlib import Path
-import csv
 
-import rich.progress
-import casanova
 import duckdb
-from ural.youtube import YoutubeChannel, YoutubeVideo, parse_youtube_url
+from ural.youtube import YOUTUBE_CHANNEL_NAME_BLACKLIST
 
-from aggregate import AggregateSQL
+from aggregate import (
+    AggregateSQL,
+    count_distinct_sql,
+    pivot_timeseries_sql,
+)
 from exceptions import MissingTable
-from utilities import list_tables
+from import_data import domain_names_table
+from utilities import export_query, list_tables
 
 
-def youtube_link_aggregate_sql() -> AggregateSQL:
+# Distinct counts of the YouTube link aggregates and the values they count. Except for tweets,
+# which belong to one month only, the same values can be counted in several months
+YOUTUBE_LINK_DISTINCT_COUNTS = {
+    "nb_collected_retweets_with_links": "retweeted_id",
+    "sum_all_tweets_with_link": "tweet_id",
+    "nb_accounts_that_shared_link": "user_id",
+}
+CROSS_MONTH_YOUTUBE_LINK_COUNTS = [
+    "nb_collected_retweets_with_links",
+    "nb_accounts_that_shared_link",
+]
+
+# Columns that the classification of YouTube links adds to the table of aggregated links
+YOUTUBE_LINK_CLASSIFICATION_COLUMNS = ["kind", "video_id", "channel_id", "channel_name"]
+
+
+def youtube_link_aggregate_sql(
+    compact_ids: str = "none", approximate_distinct: bool = False
+) -> AggregateSQL:
     new_table_columns = [
         "normalized_url VARCHAR",
         "link_for_scraping VARCHAR",
-        "nb_collected_retweets_with_links UBIGINT",
-        "sum_all_tweets_with_link UBIGINT",
-        "nb_accounts_that_shared_link UBIGINT",
-    ]
+    ] + [f"{column} UBIGINT" for column in YOUTUBE_LINK_DISTINCT_COUNTS]
+
+    # In the approximate mode, the counts that would be overcounted by summing months are estimated from sketches
+    approximate = CROSS_MONTH_YOUTUBE_LINK_COUNTS if approximate_distinct else []
     select = """
             normalized_url,
-            ANY_VALUE(link),
-            COUNT(DISTINCT retweeted_id),
-            COUNT(DISTINCT tweet_id),
-            COUNT(DISTINCT user_id),
-    """
+            ANY_VALUE(link),"""
+    select += count_distinct_sql(YOUTUBE_LINK_DISTINCT_COUNTS, approximate)
+    where = "domain_name = 'youtube.com'"
+    if compact_ids != "none":
+        where = f"""domain_id = (
+                SELECT domain_id
+                FROM {domain_names_table(compact_ids)}
+                WHERE domain_name = 'youtube.com'
+            )"""
     return AggregateSQL(
         new_table_constant_columns=new_table_columns,
         select=select,
-        where="domain_name = 'youtube.com'",
+        where=where,
         group_by="normalized_url",
+        sketches={
+            column: YOUTUBE_LINK_DISTINCT_COUNTS[column] for column in approximate
+        },
     )
 
 
-def export_youtube_links(connection: duckdb.DuckDBPyConnection, outfile: str):
-    """Function to clean up after aggregation of YouTube links and to export result."""
+def export_youtube_links(
+    connection: duckdb.DuckDBPyConnection,
+    outfile: Path,
+    csv_outfile: Path | None = None,
+    aggregate_table_prefix: str = "youtube_links",
+):
+    """Function to clean up after aggregation of YouTube links and to export result to a Parquet file and, if given, a CSV file."""
 
     # If more than 1 table exists with the prefix "domains", the recursive aggregation of target tables failed
     all_tables = connection.execute("SHOW TABLES;").fetchall()
@@ -45,9 +77,19 @@ def export_youtube_links(connection: duckdb.DuckDBPyConnection, outfile: str):
     sole_remaining_domain_table = domain_tables[0]
 
     # Create a table for the finalized domain data with a generated column that counts original tweets
-    columns = duckdb.table(sole_remaining_domain_table, connection).columns
-    data_types = duckdb.table(sole_remaining_domain_table, connection).dtypes
+    columns = connection.table(sole_remaining_domain_table).columns
+    data_types = connection.table(sole_remaining_domain_table).dtypes
     columns_and_data_types = [f"{i[0]} {i[1]}" for i in list(zip(columns, data_types))]
+
+    # Pivot the links' long-format time series into one column of tweet counts per month
+    month_columns, timeseries = pivot_timeseries_sql(
+        connection, aggregate_table_prefix, group_by="normalized_url"
+    )
+    columns_and_data_types += [f"{column} UBIGINT" for column in month_columns]
+    columns += month_columns
+    source = f"""{sole_remaining_domain_table}
+    JOIN ({timeseries}) AS timeseries USING (normalized_url)"""
+
     query = f"""
     DROP TABLE IF EXISTS all_youtube_links;
     CREATE TABLE all_youtube_links(
@@ -61,7 +103,7 @@ def export_youtube_links(connection: duckdb.DuckDBPyConnection, outfile: str):
     query = f"""
     INSERT INTO all_youtube_links
     SELECT {', '.join(columns)}
-    FROM {sole_remaining_domain_table}
+    FROM {source}
     ORDER BY sum_all_tweets_with_link DESC;
     """
     connection.execute(query)
@@ -73,29 +115,89 @@ def export_youtube_links(connection: duckdb.DuckDBPyConnection, outfile: str):
     connection.execute(query)
 
     # Export the final domain table to an out-file
-    query = f"""
-    COPY (SELECT * FROM all_youtube_links) TO '{outfile}' (HEADER, DELIMITER ',');
+    export_query(connection, "SELECT * FROM all_youtube_links", outfile, csv_outfile)
+
+
+def classify_youtube_links(
+    connection: duckdb.DuckDBPyConnection, table_name: str = "all_youtube_links"
+):
+    """Function to classify every YouTube link as a video, a channel given by its ID or a channel given by its handle, custom URL or legacy username, and to extract the video's ID, the channel's ID or the channel's name into new columns of the table.
+
+    The classification follows the rules of Ural's parse_youtube_url, written as regular expressions over the normalized URLs.
+    """
+    # Components of the normalized URL, which has no scheme, and the first and second segments of its path
+    components = f"""
+    SELECT
+        normalized_url,
+        regexp_extract(normalized_url, '^(?:[a-zA-Z][a-zA-Z0-9+.-]*://)?([^/?#:]*)', 1) AS host,
+        regexp_extract(normalized_url, '^(?:[a-zA-Z][a-zA-Z0-9+.-]*://)?[^/?#]*([^?#]*)', 1) AS path,
+        regexp_extract(normalized_url, '\\?([^#]*)', 1) AS query,
+        regexp_extract(normalized_url, '#(.*)$', 1) AS fragment,
+        coalesce(
+            nullif(regexp_extract(normalized_url, '(?i)next=%2Fwatch%3Fv%3D([^%&]+)', 1), ''),
+            regexp_extract(normalized_url, '(?i)next%3D%252Fwatch%253Fv%253D([^%&]+)', 1)
+        ) AS next_video,
+        regexp_extract(path, '^/*([^/]*)', 1) AS first_segment,
+        regexp_extract(path, '^/*[^/]*/([^/]*)', 1) AS second_segment,
+        regexp_extract(path, '([^/]*)/*$', 1) AS last_segment
+    FROM {table_name}
+    """
+
+    # The kind of link and the value it carries, in the order in which Ural tries them
+    candidates = f"""
+    SELECT
+        normalized_url,
+        CASE
+            WHEN next_video <> '' THEN struct_pack(kind := 'continuation', value := next_video)
+            WHEN lower(host) LIKE '%youtu.be' THEN
+                CASE WHEN path LIKE '/%' THEN struct_pack(kind := 'video', value := left(first_segment, 11)) END
+            WHEN regexp_matches(fragment, '(?i)^(?:%2F|/)watch(?:%3F|\\?)v(?:%3D|=)[a-zA-Z0-9_-]{{11}}') THEN
+                struct_pack(kind := 'video', value := regexp_extract(fragment, '(?i)^(?:%2F|/)watch(?:%3F|\\?)v(?:%3D|=)([a-zA-Z0-9_-]{{11}})', 1))
+            WHEN path = '/watch' THEN
+                CASE WHEN regexp_matches(query, '(?i)v=[^&]') THEN struct_pack(kind := 'video', value := left(regexp_extract(query, '(?i)v=([^&]+)', 1), 11)) END
+            WHEN regexp_matches(path, '^/(?:v|video|embed)/') THEN
+                struct_pack(kind := 'video', value := left(last_segment, 11))
+            WHEN path LIKE '/user/%' THEN
+                CASE WHEN second_segment <> '' THEN struct_pack(kind := 'user', value := second_segment) END
+            WHEN path LIKE '/c/%' THEN
+                CASE WHEN second_segment <> '' THEN struct_pack(kind := 'name', value := second_segment) END
+            WHEN path LIKE '/channel/%' THEN
+                CASE WHEN second_segment <> '' THEN struct_pack(kind := 'channel', value := second_segment) END
+            WHEN regexp_full_match(rtrim(path, '/'), '/[^/]+')
+                AND rtrim(path, '/') NOT IN ({", ".join(f"'/{name}'" for name in sorted(YOUTUBE_CHANNEL_NAME_BLACKLIST))})
+            THEN struct_pack(kind := 'name', value := ltrim(rtrim(path, '/'), '/'))
+        END AS candidate
+    FROM ({components})
     """
-    connection.execute(query)
 
+    # DuckDB can't run the update in the same call as the statements that add its columns
+    for column in YOUTUBE_LINK_CLASSIFICATION_COLUMNS:
+        connection.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} VARCHAR;")
 
-def parse_youtube_links(infile: Path, channel_outfile: Path, video_outfile: Path):
-    total = casanova.reader.count(infile)
-    with open(infile) as f, open(channel_outfile, "w") as cof, open(
-        video_outfile, "w"
-    ) as vof:
-        reader = casanova.reader(f)
-        v_fieldnames = reader.fieldnames
-        video_writer = csv.writer(vof)
-        video_writer.writerow(v_fieldnames)
-        channel_writer = csv.writer(cof)
-        channel_writer.writerow(v_fieldnames + ["channel_id"])
-        for row, url in rich.progress.track(
-            reader.cells("normalized_url", with_rows=True), total=total
-        ):
-            parsed_url = parse_youtube_url(url)
-            if isinstance(parsed_url, YoutubeVideo):
-                video_writer.writerow(row)
-            elif isinstance(parsed_url, YoutubeChannel):
-                if parsed_url.id:
-                    channel_writer.writerow(row + [parsed_url.id])
+    # Video IDs are checked, except those of continuation links, and channel names are told apart by whether they're handles
+    query = f"""
+    UPDATE {table_name}
+    SET kind = classified.kind,
+        video_id = classified.video_id,
+        channel_id = classified.channel_id,
+        channel_name = classified.channel_name
+    FROM (
+        SELECT
+            normalized_url,
+            CASE
+                WHEN candidate.kind = 'continuation' THEN 'video'
+                WHEN candidate.kind = 'video'
+                    AND NOT regexp_full_match(candidate.value, '[a-zA-Z0-9_-]{{11}}')
+                THEN NULL
+                WHEN candidate.kind = 'name' AND regexp_matches(candidate.value, '^(?:@|%40)') THEN 'handle'
+                WHEN candidate.kind = 'name' THEN 'custom'
+                ELSE candidate.kind
+            END AS kind,
+            CASE WHEN kind = 'video' THEN candidate.value END AS video_id,
+            CASE WHEN kind = 'channel' THEN candidate.value END AS channel_id,
+            CASE WHEN kind IN ('handle', 'custom', 'user') THEN candidate.value END AS channel_name
+        FROM ({candidates})
+    ) AS classified
+    WHERE {table_name}.normalized_url = classified.normalized_url;
+    """
+    connection.execute(query)
@@ -1,49 +1,92 @@
-import casanova
 from pathlib import Path
-import itertools
-import subprocess
 
+import duckdb
+from rich import print as rich_print
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    TextColumn,
+    TimeElapsedColumn,
+)
 
-def call_youtube_videos(infile: Path, outfile: Path, keys: list):
-    """Function to get channel ID of all YouTube links.
+from utilities import export_query, style_panel
+from youtube_api import YouTubeClient
+from youtube_cache import DEFAULT_VIDEO_PART_TTLS, YouTubeCache
+
+# Table of the metadata that the API returned for every video
+VIDEO_METADATA_TABLE = "video_metadata"
+
+
+def call_youtube_videos(
+    connection: duckdb.DuckDBPyConnection,
+    client: YouTubeClient,
+    color: str,
+    cache_path: Path,
+    outfile: Path,
+    csv_outfile: Path | None = None,
+    ttls: dict[str, float] = DEFAULT_VIDEO_PART_TTLS,
+):
+    """Function to get the metadata of every YouTube video link's video from the cache or, if it's missing or stale there, from the YouTube API, to import it into the database and to export it.
 
     Args:
-        infile (Path): path to CSV file of video links
-        outfile (Path): path to CSV file in which to write video metadata
-        keys (list): YouTube API keys
+        connection (duckdb.DuckDBPyConnection): database connection
+        client (YouTubeClient): client of the YouTube API, whose keys' quota is shared with the other YouTube stages
+        color (str): color name for rich progress bar
+        cache_path (Path): path to the DuckDB file of cached video metadata
+        outfile (Path): path to Parquet file of the videos' metadata
+        csv_outfile (Path | None): path to CSV file of the videos' metadata, if one is wanted
+        ttls (dict): number of days after which each part of a video's cached metadata is stale
     """
-    total = casanova.reader.count(infile)
-    key_args = transform_key_list_into_subprocess_args(keys)
-    minet_yt_channel_command = (
-        [
-            "minet",
-            "yt",
-            "videos",
-            "-o",
-            str(outfile),
-            "--total",
-            str(total),
-        ]
-        + key_args
-        + [
-            "normalized_url",
-            "-i",
-            str(infile),
-        ]
-    )
-    subprocess.run(minet_yt_channel_command, check=True)
+    query = """
+    SELECT DISTINCT video_id
+    FROM all_youtube_links
+    WHERE kind = 'video'
+    ORDER BY video_id
+    """
+    video_ids = [row[0] for row in connection.execute(query).fetchall()]
+    cache = YouTubeCache(path=cache_path, ttls=ttls)
+    requests = cache.stale_videos(video_ids)
+    nb_requested = sum(len(ids) for ids in requests.values())
 
+    msg = f"""
+Of {len(video_ids)} videos, request the metadata of the {nb_requested} missing from or stale in the cache "{cache_path}" from the YouTube API, 50 videos per request with {client.requests_in_flight} requests at a time, while rotating through {len(client.key_ring.keys)} API key(s). Then insert the videos' metadata into the table "{VIDEO_METADATA_TABLE}" and export it to "{outfile}."
+    """
+    style_panel(msg=msg, color=color, title="Request YouTube videos")
 
-def transform_key_list_into_subprocess_args(keys: list) -> list[str]:
-    """Function to convert array of keys into array useable in subprocess.
+    # ----------------------------------------------------------------------- #
+    # Set up the progress bar
+    ProgressCompleteColumn = Progress(
+        TextColumn("{task.description}"),
+        MofNCompleteColumn(),
+        BarColumn(bar_width=60),
+        TimeElapsedColumn(),
+        expand=True,
+    )
+    with ProgressCompleteColumn as progress:
+        task = progress.add_task(
+            f"{color}Requesting YouTube videos...", total=nb_requested
+        )
+        # ------------------------------------------------------------------ #
 
-    Args:
-        keys (list): YouTube API keys
+        # Only the stale parts of each video's resource are requested, and responses are cached as
+        # they arrive, in this thread, so that an interrupted run keeps what it has already fetched
+        for parts, ids in requests.items():
+            for batch_ids, items in client.videos(ids, parts=list(parts)):
+                cache.store_videos(batch_ids, items, parts)
+                progress.update(task_id=task, advance=len(batch_ids))
 
-    Returns:
-        list[str]: array alternating "-k" and key
+    connection.register("cached_video_metadata", cache.video_metadata(video_ids))
+    cache.close()
+    query = f"""
+    DROP TABLE IF EXISTS {VIDEO_METADATA_TABLE};
+    CREATE TABLE {VIDEO_METADATA_TABLE} AS
+    SELECT * FROM cached_video_metadata;
     """
-    key_options = list(
-        itertools.chain.from_iterable(list(zip(itertools.repeat("-k"), keys)))
+    connection.execute(query)
+    connection.unregister("cached_video_metadata")
+    export_query(
+        connection, f"SELECT * FROM {VIDEO_METADATA_TABLE}", outfile, csv_outfile
     )
-    return key_options
+
+    rich_print(f"Units of quota used by each key: {client.key_ring.usage()}")